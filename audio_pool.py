@@ -0,0 +1,220 @@
+"""
+Пул процессов для конвертации аудио (pydub/ffmpeg)
+
+Декодирование и кодирование голосовых занимают процессор на секунды и не должны
+выполняться в event loop. Задания уходят в отдельные процессы; очередь ограничена,
+и при переполнении новое задание сразу отклоняется (PoolSaturated), чтобы бот мог
+попросить пользователя повторить позже, а не копил работу без конца.
+"""
+
+import asyncio
+import logging
+import subprocess
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional
+
+from process_pool import SpawnPool
+
+logger = logging.getLogger(__name__)
+
+# Частота дискретизации при нарезке (Whisper всё равно работает с 16 кГц)
+SPLIT_SAMPLE_RATE = 16000
+
+
+class PoolSaturated(Exception):
+    """Очередь конвертации заполнена"""
+
+
+def _ffmpeg(arguments: List[str], data: bytes, deadline: Optional[float] = None) -> bytes:
+    """
+    Запускает ffmpeg с вводом и выводом через каналы
+
+    Args:
+        deadline: Момент (time.monotonic()), после которого ffmpeg завершается принудительно
+    """
+    from pydub import AudioSegment
+
+    command = [AudioSegment.converter, '-hide_banner', '-loglevel', 'error'] + arguments
+    timeout = None if deadline is None else max(deadline - time.monotonic(), 0.1)
+    try:
+        result = subprocess.run(command, input=data, capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # subprocess.run уже убил ffmpeg; процесс пула свободен для следующего задания
+        raise RuntimeError(f"ffmpeg не уложился в {timeout:.0f} с") from None
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+
+def convert_audio(data: bytes, input_format: Optional[str] = 'ogg', output_format: str = 'mp3',
+                  timeout: Optional[float] = None) -> bytes:
+    """
+    Конвертирует аудио через ffmpeg без временных файлов (выполняется в процессе пула)
+
+    Args:
+        timeout: Максимальное время работы ffmpeg (в секундах)
+
+    Returns:
+        Сконвертированное аудио
+    """
+    # Whisper работает с моно 16 кГц: такое аудио меньше и кодируется быстрее без потери качества распознавания
+    arguments = ['-f', input_format] if input_format else []
+    arguments += ['-i', 'pipe:0', '-vn', '-ac', '1', '-ar', '16000', '-b:a', '48k', '-f', output_format, 'pipe:1']
+    return _ffmpeg(arguments, data, None if timeout is None else time.monotonic() + timeout)
+
+
+def split_audio(data: bytes, input_format: Optional[str] = 'ogg', max_segment: float = 45.0,
+                min_segment: float = 15.0, output_format: str = 'mp3',
+                timeout: Optional[float] = None) -> List[bytes]:
+    """
+    Режет аудио на части по паузам (выполняется в процессе пула)
+
+    Каждый разрез делается в самой длинной паузе между min_segment и max_segment секундами
+    от предыдущего; если пауз нет, аудио режется ровно по max_segment.
+
+    Args:
+        timeout: Максимальное время всей нарезки (в секундах), общее для всех запусков ffmpeg
+
+    Returns:
+        Части аудио по порядку
+    """
+    from pydub import AudioSegment
+    from pydub.silence import detect_silence
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    arguments = ['-f', input_format] if input_format else []
+    pcm = _ffmpeg(arguments + ['-i', 'pipe:0', '-vn', '-ac', '1', '-ar', str(SPLIT_SAMPLE_RATE),
+                               '-f', 's16le', 'pipe:1'], data, deadline)
+    audio = AudioSegment(data=pcm, sample_width=2, frame_rate=SPLIT_SAMPLE_RATE, channels=1)
+
+    max_ms, min_ms = int(max_segment * 1000), int(min_segment * 1000)
+    # Тишина — на 16 дБ тише средней громкости записи
+    silences = detect_silence(audio, min_silence_len=300, silence_thresh=audio.dBFS - 16, seek_step=10)
+    cuts, position = [], 0
+    while len(audio) - position > max_ms:
+        # Последняя часть тоже не должна быть короче min_segment
+        upper = min(position + max_ms, len(audio) - min_ms)
+        if upper < position + min_ms:
+            upper = position + max_ms
+        candidates = [(end - start, (start + end) // 2) for start, end in silences
+                      if position + min_ms <= (start + end) // 2 <= upper]
+        position = max(candidates)[1] if candidates else upper
+        cuts.append(position)
+
+    segments = []
+    for start, end in zip([0] + cuts, cuts + [len(audio)]):
+        raw = audio[start:end].raw_data
+        segments.append(_ffmpeg(['-f', 's16le', '-ac', '1', '-ar', str(SPLIT_SAMPLE_RATE), '-i', 'pipe:0',
+                                 '-b:a', '48k', '-f', output_format, 'pipe:1'], raw, deadline))
+    return segments
+
+
+class AudioPool:
+    def __init__(self, max_workers: int = 2, max_queue: int = 8, timeout: float = 60.0):
+        """
+        Инициализация пула
+
+        Args:
+            max_workers: Число процессов конвертации
+            max_queue: Сколько заданий может ждать свободного процесса
+            timeout: Максимальное время одного задания (в секундах); по его истечении ffmpeg
+                завершается и в процессе пула
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        # По таймауту процесс не завершаем: ffmpeg в нём и так остановится по тому же таймауту
+        self._pool = SpawnPool(max_workers)
+
+        self.jobs = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.convert_seconds = 0.0
+        self.audio_seconds = 0.0
+
+    @property
+    def saturated(self) -> bool:
+        return self._pool.pending >= self.max_workers + self.max_queue
+
+    async def convert(self, data: bytes, input_format: Optional[str] = 'ogg', output_format: str = 'mp3',
+                      duration: Optional[float] = None) -> bytes:
+        """
+        Конвертирует аудио в процессе пула
+
+        Args:
+            data: Исходное аудио
+            input_format: Формат исходного аудио (формат ffmpeg); None — определить по содержимому
+            output_format: Нужный формат
+            duration: Длительность аудио в секундах (для метрик; Telegram сообщает её заранее)
+
+        Returns:
+            Сконвертированное аудио
+
+        Raises:
+            PoolSaturated: Очередь заполнена
+            asyncio.TimeoutError: Задание не уложилось в timeout
+        """
+        return await self._run(duration, convert_audio, data, input_format, output_format, self.timeout)
+
+    async def split(self, data: bytes, input_format: Optional[str] = 'ogg', max_segment: float = 45.0,
+                    min_segment: float = 15.0, duration: Optional[float] = None) -> List[bytes]:
+        """
+        Режет аудио на части по паузам в процессе пула (см. split_audio)
+
+        Returns:
+            Части аудио в MP3 по порядку
+
+        Raises:
+            PoolSaturated: Очередь заполнена
+            asyncio.TimeoutError: Задание не уложилось в timeout
+        """
+        return await self._run(duration, split_audio, data, input_format, max_segment, min_segment, 'mp3',
+                               self.timeout)
+
+    async def _run(self, duration: Optional[float], func: Callable, *args):
+        if self.saturated:
+            self.rejected += 1
+            raise PoolSaturated(f"В очереди конвертации {self._pool.pending} заданий")
+
+        # Между проверкой и постановкой задания в пул (в начале run) других корутин не выполняется
+        started = time.monotonic()
+        try:
+            result = await self._pool.run(self.timeout, func, *args)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.error(f"Конвертация аудио не уложилась в {self.timeout:.0f} с")
+            raise
+        except BrokenProcessPool:
+            # Процесс пула упал (например, ffmpeg исчерпал память) — следующее задание создаст новый пул
+            self.failures += 1
+            logger.error("Процесс конвертации аудио аварийно завершился, пул будет пересоздан")
+            raise
+        except Exception:
+            self.failures += 1
+            raise
+        elapsed = time.monotonic() - started
+
+        self.jobs += 1
+        if duration:
+            self.convert_seconds += elapsed
+            self.audio_seconds += duration
+            logger.info(f"Аудио {duration:.1f} с обработано ({func.__name__}) за {elapsed:.2f} с "
+                        f"({elapsed / duration:.3f} с на секунду аудио)")
+        return result
+
+    def stats(self) -> Dict:
+        """Счётчики заданий и время конвертации на секунду аудио"""
+        return {
+            'jobs': self.jobs,
+            'pending': self._pool.pending,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'failures': self.failures,
+            'seconds_per_audio_second': self.convert_seconds / self.audio_seconds if self.audio_seconds else 0.0,
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Останавливает процессы пула"""
+        self._pool.shutdown(wait=wait)
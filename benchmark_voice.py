@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Сравнение задержки распознавания голосового сообщения: OGG/Opus как есть и с перекодированием в MP3
+
+Использование:
+    python benchmark_voice.py voice.ogg [повторов]
+
+Нужны OPENAI_API_KEY и (для перекодирования) ffmpeg. Каждый повтор — настоящий запрос к Whisper.
+"""
+
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from audio_pool import AudioPool
+from openai_client import create_async_client
+from voice_processor import VoiceProcessor
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+async def measure(name: str, prepare, processor: VoiceProcessor, repeats: int) -> None:
+    """Замеряет подготовку аудио и распознавание для одного пути"""
+    prepare_times, total_times = [], []
+    for attempt in range(1, repeats + 1):
+        started = time.perf_counter()
+        audio = await prepare()
+        prepared = time.perf_counter()
+        if audio is None:
+            logger.error(f"❌ {name}: не удалось подготовить аудио")
+            return
+        size = len(audio.getbuffer())
+        text = await processor._transcribe_audio(audio)
+        finished = time.perf_counter()
+        if text is None:
+            logger.error(f"❌ {name}: ошибка распознавания")
+            return
+        prepare_times.append(prepared - started)
+        total_times.append(finished - started)
+        logger.info(f"{name} #{attempt}: подготовка {prepared - started:.2f} с, всего {finished - started:.2f} с, "
+                    f"{size} байт, текст: {text[:60]}")
+
+    logger.info(f"📊 {name}: медиана {statistics.median(total_times):.2f} с "
+                f"(минимум {min(total_times):.2f} с, подготовка {statistics.median(prepare_times):.2f} с)")
+
+
+async def main():
+    if len(sys.argv) < 2:
+        logger.error("Использование: python benchmark_voice.py voice.ogg [повторов]")
+        return
+    path = sys.argv[1]
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    load_dotenv()
+    openai_key = os.getenv('OPENAI_API_KEY')
+    if not openai_key:
+        logger.error("❌ OPENAI_API_KEY не найден в переменных окружения")
+        return
+
+    with open(path, 'rb') as f:
+        audio_data = f.read()
+    logger.info(f"🚀 Файл {path}: {len(audio_data)} байт, повторов: {repeats}")
+
+    audio_pool = AudioPool(max_workers=1)
+    processor = VoiceProcessor(openai_key, create_async_client(openai_key), audio_pool=audio_pool)
+    try:
+        # Первый запуск процесса пула не входит в замер
+        await processor._convert_audio(audio_data)
+
+        await measure("OGG/Opus без перекодирования",
+                      lambda: processor._prepare_audio(audio_data, 'audio/ogg'), processor, repeats)
+        await measure("Перекодирование в MP3",
+                      lambda: processor._convert_audio(audio_data), processor, repeats)
+    finally:
+        audio_pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,170 @@
+"""
+Отправка сообщений в Telegram с учётом ограничений частоты (token bucket)
+
+Telegram допускает около 30 сообщений в секунду на бота и около одного сообщения
+в секунду в один чат. Отправки идут параллельно, но каждая сначала берёт токен
+из общего ведра и из ведра своего чата. Ответ 429 (retry_after) приостанавливает
+оба ведра, и сообщение отправляется повторно.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: Сколько токенов добавляется в секунду
+            capacity: Размер ведра (допустимый всплеск); по умолчанию — rate
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Ждёт, пока в ведре появится токен, и забирает его"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Останавливает выдачу токенов (после ответа 429)"""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+    def is_idle(self) -> bool:
+        now = time.monotonic()
+        return now >= self._paused_until and self._tokens + (now - self._updated) * self.rate >= self.capacity
+
+
+class DeliveryEngine:
+    # Ведра чатов, которые давно не использовались, удаляются после этого числа
+    MAX_CHAT_BUCKETS = 1000
+
+    def __init__(self, bot=None, token: Optional[str] = None, global_rate: float = 30.0,
+                 per_chat_rate: float = 1.0, max_concurrency: int = 20, max_attempts: int = 3):
+        """
+        Инициализация
+
+        Args:
+            bot: Экземпляр telegram.Bot (обычно application.bot); None — отправка через HTTP API
+            token: Токен бота для отправки через HTTP API
+            global_rate: Сообщений в секунду на весь бот
+            per_chat_rate: Сообщений в секунду в один чат
+            max_concurrency: Максимум одновременных запросов к Telegram
+            max_attempts: Сколько раз пробовать отправить сообщение после ответов 429
+        """
+        if bot is None and not token:
+            raise ValueError("Нужен bot или token")
+        self.bot = bot
+        self.token = token.strip() if token else None
+        self.per_chat_rate = per_chat_rate
+        self.max_attempts = max_attempts
+        self._global = TokenBucket(global_rate)
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        """Подготавливает соединение (повторный вызов ничего не делает)"""
+        if self.bot is not None:
+            await self.bot.initialize()
+        elif self._client is None:
+            self._client = httpx.AsyncClient(timeout=30.0)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.MAX_CHAT_BUCKETS:
+                for key in [k for k, b in self._chats.items() if b.is_idle()]:
+                    del self._chats[key]
+            bucket = self._chats[chat_id] = TokenBucket(self.per_chat_rate, 1.0)
+        return bucket
+
+    async def send_message(self, chat_id, text: str, before_send: Optional[Callable[[], Awaitable[bool]]] = None,
+                           **kwargs) -> Optional[Any]:
+        """
+        Отправляет сообщение с учётом ограничений частоты
+
+        Args:
+            chat_id: ID чата
+            text: Текст сообщения
+            before_send: Корутина, которая вызывается перед каждым запросом к Telegram, когда токены
+                уже получены; если вернула False, сообщение не отправляется
+            **kwargs: parse_mode, reply_markup и другие параметры sendMessage
+
+        Returns:
+            Отправленное сообщение (telegram.Message или dict ответа HTTP API) или None при ошибке
+        """
+        chat_bucket = self._chat_bucket(chat_id)
+        for attempt in range(1, self.max_attempts + 1):
+            await chat_bucket.acquire()
+            await self._global.acquire()
+            try:
+                async with self._semaphore:
+                    if before_send is not None and not await before_send():
+                        return None
+                    return await self._send(chat_id, text, **kwargs)
+            except RetryAfter as e:
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                delay = float(delay)
+            except Exception as e:
+                logger.error(f"Ошибка при отправке сообщения в чат {chat_id}: {e}")
+                return None
+
+            logger.warning(f"Telegram ограничил частоту (429), пауза {delay:.1f} с "
+                           f"(попытка {attempt}/{self.max_attempts}, чат {chat_id})")
+            self._global.pause(delay)
+            chat_bucket.pause(delay)
+        logger.error(f"Сообщение в чат {chat_id} не отправлено: превышено число попыток")
+        return None
+
+    async def _send(self, chat_id, text: str, **kwargs):
+        if self.bot is not None:
+            return await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+
+        if self._client is None:
+            await self.start()
+        response = await self._client.post(
+            f"https://api.telegram.org/bot{self.token}/sendMessage",
+            json=dict(kwargs, chat_id=chat_id, text=text)
+        )
+        if response.status_code == 429:
+            retry_after = response.json().get('parameters', {}).get('retry_after', 1)
+            raise RetryAfter(retry_after)
+        if response.status_code != 200:
+            raise RuntimeError(response.text)
+        return response.json().get('result')
@@ -0,0 +1,122 @@
+"""
+Журнал доставки напоминаний: гарантирует, что напоминание не придёт дважды
+
+Запись делается до и после отправки:
+- sending   — отправка начата; если процесс упал на этом шаге, после перезапуска
+              запись становится unknown и напоминание повторно не отправляется;
+- delivered — сообщение отправлено, но хранилище ещё не отметило sent;
+- acked     — хранилище отметило sent, запись нужна только для истории;
+- unknown   — исход отправки неизвестен (падение между sending и delivered).
+
+Отправка разрешена, только если записи нет. Проверка — один поиск по первичному ключу.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SENDING = 'sending'
+DELIVERED = 'delivered'
+ACKED = 'acked'
+UNKNOWN = 'unknown'
+
+
+class DeliveryLog:
+    def __init__(self, path: str = 'delivery_log.sqlite3'):
+        """
+        Args:
+            path: Путь к файлу SQLite
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        with self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS delivery_log ('
+                ' uid TEXT PRIMARY KEY, state TEXT NOT NULL, row INTEGER, chat_id INTEGER,'
+                ' message_id INTEGER, updated_at REAL NOT NULL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS idx_delivery_log_state ON delivery_log (state, updated_at)')
+
+    def recover(self) -> int:
+        """
+        Переводит незавершённые отправки прошлого запуска в unknown (вызывать при старте)
+
+        Returns:
+            Количество таких напоминаний
+        """
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                'UPDATE delivery_log SET state = ?, updated_at = ? WHERE state = ?', (UNKNOWN, time.time(), SENDING)
+            )
+        if cursor.rowcount:
+            logger.warning(f"Исход отправки {cursor.rowcount} напоминаний неизвестен (остановка во время отправки), "
+                           f"повторно они не отправляются")
+        return cursor.rowcount
+
+    def state(self, uid: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute('SELECT state FROM delivery_log WHERE uid = ?', (uid,)).fetchone()
+        return row['state'] if row else None
+
+    def begin(self, uid: str, row: int = None, chat_id: int = None) -> bool:
+        """
+        Отмечает начало отправки
+
+        Returns:
+            True если отправлять можно (записи не было), False если напоминание уже отправляется
+            или отправлено
+        """
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                'INSERT OR IGNORE INTO delivery_log (uid, state, row, chat_id, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (uid, SENDING, row, chat_id, time.time())
+            )
+        return cursor.rowcount == 1
+
+    def delivered(self, uid: str, message_id: int = None) -> None:
+        self._set(uid, DELIVERED, message_id=message_id)
+
+    def acknowledged(self, uid: str) -> None:
+        """Хранилище отметило напоминание как отправленное"""
+        self._set(uid, ACKED)
+
+    def failed(self, uid: str) -> None:
+        """Отправка не удалась — напоминание можно отправить снова"""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM delivery_log WHERE uid = ? AND state = ?', (uid, SENDING))
+
+    def unacknowledged(self) -> List[Dict]:
+        """Отправленные (или с неизвестным исходом) напоминания, которые хранилище ещё не отметило"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT uid, state, row, chat_id FROM delivery_log WHERE state IN (?, ?)', (DELIVERED, UNKNOWN)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def prune(self, older_than: float = 30 * 24 * 3600) -> int:
+        """Удаляет старые завершённые записи"""
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                'DELETE FROM delivery_log WHERE state = ? AND updated_at < ?', (ACKED, time.time() - older_than)
+            )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _set(self, uid: str, state: str, message_id: int = None) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE delivery_log SET state = ?, message_id = COALESCE(?, message_id), updated_at = ? '
+                'WHERE uid = ?',
+                (state, message_id, time.time(), uid)
+            )
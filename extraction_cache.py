@@ -0,0 +1,152 @@
+"""
+Кэш результатов извлечения напоминаний (ChatGPT) по нормализованному тексту сообщения
+
+Результат хранится относительно момента запроса, чтобы тот же текст, присланный позже,
+тоже попадал в кэш, когда это безопасно по смыслу:
+- напоминание без времени не зависит от момента — используется всегда;
+- "через 2 часа" хранится как смещение от момента запроса — используется всегда;
+- всё остальное ("завтра в 15:00", "в пятницу") хранится как смещение в днях и время суток
+  и используется только в тот же календарный день и только если время ещё не прошло.
+"""
+
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlite_cache import SQLiteCache
+from time_utils import get_timezone
+
+from time_parser import DATE_RE, DAY_RE, RELATIVE_RE, TIME_RE, WEEKDAY_RE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEZONE = 'Europe/Moscow'
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Ключ для записей, не зависящих от даты запроса
+ANY_DAY = '*'
+
+MODE_NONE = 'none'
+MODE_OFFSET = 'offset'
+MODE_CALENDAR = 'calendar'
+
+# Время суток словами: "через 2 дня вечером" зависит от календаря, а не только от смещения
+DAYPART_RE = re.compile(r'\b(?:утром|вечером|днем|ночью|обед\w*|утра|вечера|ночи|полдень|полночь)\b')
+
+
+def normalize_message(message: str) -> str:
+    """Нормализует текст: регистр, ё/е, пунктуация и лишние пробелы не влияют на ключ"""
+    text = message.lower().replace('ё', 'е')
+    text = re.sub(r'[^\w\s:.]', ' ', text)
+    text = re.sub(r'(?<!\d)[.:]|[.:](?!\d)', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def _cache_key(key: str, day: str) -> str:
+    return f"{day}|{key}"
+
+
+def _classify(normalized: str, reminder_info: Dict) -> str:
+    if not reminder_info.get('datetime'):
+        return MODE_NONE
+    is_relative = RELATIVE_RE.search(normalized)
+    has_calendar = any(regex.search(normalized) for regex in (TIME_RE, DAY_RE, WEEKDAY_RE, DATE_RE, DAYPART_RE))
+    if is_relative and not has_calendar:
+        return MODE_OFFSET
+    return MODE_CALENDAR
+
+
+class ExtractionCache(SQLiteCache):
+    def __init__(self, path: Optional[str] = None, max_entries: int = 10000, ttl: float = 7 * 24 * 3600):
+        """
+        Инициализация кэша
+
+        Args:
+            path: Путь к файлу SQLite; None — только память (до перезапуска)
+            max_entries: Максимальное число записей (вытесняются давно не использованные)
+            ttl: Время жизни записи (в секундах)
+        """
+        super().__init__('extraction_cache', path, max_entries, ttl)
+        self.tz = get_timezone(DEFAULT_TIMEZONE)
+
+    def get(self, message: str, now: Optional[datetime] = None) -> Optional[Dict]:
+        """
+        Ищет результат извлечения для сообщения
+
+        Args:
+            message: Текст, который отправлялся в ChatGPT
+            now: Текущее время (по умолчанию — сейчас, Europe/Moscow)
+
+        Returns:
+            Словарь {'text', 'datetime', 'timezone'} с временем, пересчитанным на now, или None
+        """
+        now = self._now(now)
+        key = normalize_message(message)
+        with self._lock:
+            for day in (ANY_DAY, now.strftime('%Y-%m-%d')):
+                payload = self.lookup(_cache_key(key, day))
+                if payload is None:
+                    continue
+                result = self._restore(payload, now)
+                if result is not None:
+                    self.hits += 1
+                    logger.info(f"Результат извлечения взят из кэша: {result}")
+                    return result
+            self.misses += 1
+            return None
+
+    def put(self, message: str, reminder_info: Dict, now: Optional[datetime] = None) -> None:
+        """
+        Сохраняет результат извлечения для сообщения
+
+        Args:
+            message: Текст, который отправлялся в ChatGPT
+            reminder_info: Результат MessageProcessor.extract_reminder_info
+            now: Момент, относительно которого ChatGPT считал время
+        """
+        if not reminder_info or 'text' not in reminder_info:
+            return
+        now = self._now(now)
+        key = normalize_message(message)
+        mode = _classify(key, reminder_info)
+        payload = {
+            'mode': mode,
+            'text': reminder_info['text'],
+            'timezone': reminder_info.get('timezone', DEFAULT_TIMEZONE),
+        }
+        day = ANY_DAY
+        if mode != MODE_NONE:
+            try:
+                dt = datetime.strptime(reminder_info['datetime'], DATETIME_FORMAT)
+            except (TypeError, ValueError):
+                return
+            naive_now = now.replace(tzinfo=None)
+            if mode == MODE_OFFSET:
+                payload['offset'] = (dt - naive_now).total_seconds()
+            else:
+                payload['days'] = (dt.date() - naive_now.date()).days
+                payload['time'] = dt.strftime('%H:%M:%S')
+                day = now.strftime('%Y-%m-%d')
+
+        self.store([_cache_key(key, day)], payload)
+
+    def _now(self, now: Optional[datetime]) -> datetime:
+        return (now or datetime.now(self.tz)).astimezone(self.tz).replace(microsecond=0)
+
+    def _restore(self, payload: Dict, now: datetime) -> Optional[Dict]:
+        result = {'text': payload['text'], 'datetime': None, 'timezone': payload['timezone']}
+        mode = payload['mode']
+        if mode == MODE_NONE:
+            return result
+        naive_now = now.replace(tzinfo=None)
+        if mode == MODE_OFFSET:
+            dt = naive_now + timedelta(seconds=payload['offset'])
+        else:
+            clock = datetime.strptime(payload['time'], '%H:%M:%S').time()
+            dt = datetime.combine(naive_now.date() + timedelta(days=payload['days']), clock)
+            if dt <= naive_now:
+                # Время уже прошло — по смыслу нужен новый расчёт
+                return None
+        result['datetime'] = dt.strftime(DATETIME_FORMAT)
+        return result
@@ -1,37 +1,323 @@
+import re
+import threading
+import time
 import gspread
+from gspread.utils import rowcol_to_a1
 from google.oauth2.service_account import Credentials
 from datetime import datetime
+from reminder_store import ReminderStore, parse_id
+from time_utils import parse_due_utc
 
 SCOPES = [
     'https://www.googleapis.com/auth/spreadsheets',
     'https://www.googleapis.com/auth/drive'
 ]
 
-class GoogleSheetsReminder:
-    def __init__(self, creds_path, spreadsheet_name, worksheet_name='reminders'):
+# Структура листа: datetime, text, timezone, sent, status, comment, chat_id, user_id
+COLUMNS = ['datetime', 'text', 'timezone', 'sent', 'status', 'comment', 'chat_id', 'user_id']
+LAST_COLUMN = 'H'
+
+# Номер первой строки в диапазоне A1-нотации, например "'reminders'!A42:F42" -> 42
+_RANGE_ROW_RE = re.compile(r'![A-Z]+(\d+)')
+
+def row_from_range(a1_range):
+    """Возвращает номер первой строки диапазона из ответа API или None."""
+    match = _RANGE_ROW_RE.search(a1_range or '')
+    return int(match.group(1)) if match else None
+
+class SheetWriteBuffer:
+    """
+    Буфер отложенной записи: копит изменения ячеек и отправляет их одним batch_update
+    
+    Повторные записи в одну ячейку схлопываются (побеждает последняя). При ошибке
+    изменения остаются в буфере, а следующая попытка откладывается с экспоненциальной задержкой.
+    """
+    
+    def __init__(self, worksheet, flush_interval=2.0, max_pending=500,
+                 initial_backoff=2.0, max_backoff=120.0):
+        """
+        Args:
+            worksheet: Лист gspread, в который пишутся изменения
+            flush_interval: Как часто (в секундах) отправлять накопленные изменения
+            max_pending: Максимальное число ячеек в буфере
+            initial_backoff: Задержка перед первой повторной попыткой (в секундах)
+            max_backoff: Максимальная задержка между попытками (в секундах)
+        """
+        self.ws = worksheet
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        
+        self._pending = {}  # {(row, col): value}
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='sheet-write-buffer', daemon=True)
+        self._thread.start()
+    
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+    
+    def put(self, row, col, value):
+        """
+        Ставит запись ячейки в очередь
+        
+        Returns:
+            bool: True если запись принята, False если буфер переполнен и сбросить его не удалось
+        """
+        with self._cond:
+            if self._closed:
+                return False
+            if (row, col) not in self._pending and len(self._pending) >= self.max_pending:
+                full = True
+            else:
+                self._pending[(row, col)] = value
+                self._cond.notify()
+                return True
+        
+        # Буфер заполнен — пробуем сбросить его прямо сейчас
+        if full and self.flush():
+            return self.put(row, col, value)
+        print(f"Буфер записи переполнен, изменение ячейки ({row}, {col}) не принято")
+        return False
+    
+    def flush(self):
+        """
+        Отправляет все накопленные изменения одним запросом
+        
+        Returns:
+            bool: True если буфер пуст или успешно отправлен
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch = self._pending
+                self._pending = {}
+            if not batch:
+                return True
+            data = [
+                {'range': rowcol_to_a1(row, col), 'values': [[value]]}
+                for (row, col), value in sorted(batch.items())
+            ]
+            try:
+                self.ws.batch_update(data)
+            except Exception as e:
+                with self._cond:
+                    # Возвращаем изменения в буфер, не затирая более свежие значения
+                    for key, value in batch.items():
+                        self._pending.setdefault(key, value)
+                    self._backoff = min(max(self._backoff * 2, self.initial_backoff), self.max_backoff)
+                    self._retry_at = time.monotonic() + self._backoff
+                print(f"Ошибка при пакетной записи в Google Sheets ({len(data)} ячеек), "
+                      f"повтор через {self._backoff:.1f} с: {e}")
+                return False
+            with self._cond:
+                self._backoff = 0.0
+                self._retry_at = 0.0
+            return True
+    
+    def pending(self):
+        """Возвращает копию ещё не записанных изменений {(row, col): value}."""
+        with self._cond:
+            return dict(self._pending)
+    
+    def close(self, attempts=3):
+        """Останавливает фоновый поток и сбрасывает оставшиеся изменения."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=self.flush_interval + 1)
+        for attempt in range(attempts):
+            if self.flush():
+                return True
+            time.sleep(min(self.initial_backoff * (2 ** attempt), self.max_backoff))
+        print(f"Не удалось записать {len(self)} изменений в Google Sheets при остановке")
+        return False
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._pending:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # Даём изменениям накопиться, а после ошибки ждём окончания задержки
+                delay = max(self.flush_interval, self._retry_at - time.monotonic())
+                self._cond.wait(timeout=delay)
+                if self._closed:
+                    return
+            self.flush()
+
+
+class GoogleSheetsReminder(ReminderStore):
+    def __init__(self, creds_path, spreadsheet_name, worksheet_name='reminders',
+                 cache_ttl=60, full_resync_interval=3600, write_flush_interval=2.0,
+                 write_buffer_size=500):
+        """
+        Args:
+            creds_path: Путь к credentials файлу сервисного аккаунта
+            spreadsheet_name: Название таблицы
+            worksheet_name: Название листа
+            cache_ttl: Сколько секунд локальная копия листа считается свежей
+            full_resync_interval: Как часто (в секундах) перечитывать лист целиком
+            write_flush_interval: Как часто (в секундах) отправлять накопленные изменения статусов;
+                0 — писать каждую ячейку сразу
+            write_buffer_size: Максимальное число ожидающих записи ячеек
+        """
         creds = Credentials.from_service_account_file(creds_path, scopes=SCOPES)
         self.gc = gspread.authorize(creds)
         self.sh = self.gc.open(spreadsheet_name)
         self.ws = self.sh.worksheet(worksheet_name)
+        
+        # Локальная копия листа: {номер строки: [значения колонок]}
+        self.cache_ttl = cache_ttl
+        self.full_resync_interval = full_resync_interval
+        self._rows = {}
+        self._row_count = 0  # Номер последней известной строки (включая заголовок)
+        self._due = {}  # {(datetime, timezone): UTC epoch} — время разбирается один раз
+        self._synced_at = None
+        self._full_synced_at = None
+        self._lock = threading.RLock()
+        
+        self.write_buffer = None
+        if write_flush_interval:
+            self.write_buffer = SheetWriteBuffer(self.ws, write_flush_interval, write_buffer_size)
+
+    def close(self):
+        """Сбрасывает отложенные записи (вызывать при остановке приложения)."""
+        if self.write_buffer:
+            self.write_buffer.close()
+
+    def _write_cell(self, row, col, value):
+        """Записывает ячейку через буфер отложенной записи (или сразу, если он выключен)."""
+        if self.write_buffer:
+            if not self.write_buffer.put(row, col, value):
+                return False
+        else:
+            self.ws.update_cell(row, col, value)
+        self._set_cell(row, col, value)
+        return True
+
+    def invalidate(self):
+        """Сбрасывает локальную копию: следующее чтение перечитает лист целиком."""
+        with self._lock:
+            self._synced_at = None
+            self._full_synced_at = None
+
+    def refresh(self, full=False):
+        """
+        Синхронизирует локальную копию с листом
+        
+        Без full запрашивает только новые строки и колонки sent/status уже известных строк
+        (один batch_get), поэтому трафик пропорционален изменениям, а не размеру листа.
+        Остальные ручные правки (удаление строк, смена текста/времени) подхватываются
+        полной синхронизацией раз в full_resync_interval или после invalidate().
+        
+        Args:
+            full: Перечитать лист целиком (например, после ручного удаления строк)
+        """
+        with self._lock:
+            now = time.monotonic()
+            if (full or self._full_synced_at is None
+                    or now - self._full_synced_at >= self.full_resync_interval):
+                self._load_values(self.ws.get_all_values())
+                self._apply_pending()
+                self._full_synced_at = self._synced_at = now
+                return
+            
+            known = self._row_count
+            new_rows, statuses = self.ws.batch_get([
+                f"A{known + 1}:{LAST_COLUMN}",
+                f"D2:E{known}" if known >= 2 else "D2:E2",
+            ])
+            if known >= 2:
+                for offset in range(known - 1):
+                    row = self._rows.get(offset + 2)
+                    if row is None:
+                        continue
+                    values = statuses[offset] if offset < len(statuses) else []
+                    row[3] = values[0] if len(values) > 0 else ''
+                    row[4] = values[1] if len(values) > 1 else ''
+            for offset, values in enumerate(new_rows):
+                self._set_row(known + 1 + offset, values)
+            self._row_count = max(self._row_count, known + len(new_rows))
+            self._apply_pending()
+            self._synced_at = now
+
+    def _ensure_fresh(self):
+        if self._synced_at is None or time.monotonic() - self._synced_at >= self.cache_ttl:
+            self.refresh()
+
+    def _load_values(self, all_values):
+        self._rows = {}
+        for i, values in enumerate(all_values[1:], start=2):  # первая строка — заголовки
+            self._set_row(i, values)
+        self._row_count = max(len(all_values), 1)
+
+    def _apply_pending(self):
+        # Незаписанные изменения важнее того, что сейчас лежит в листе
+        if self.write_buffer:
+            for (row, col), value in self.write_buffer.pending().items():
+                self._set_cell(row, col, value)
+
+    def _set_row(self, row, values):
+        values = list(values)[:len(COLUMNS)]
+        values += [''] * (len(COLUMNS) - len(values))
+        self._rows[row] = values
+
+    def _set_cell(self, row, col, value):
+        with self._lock:
+            values = self._rows.get(row)
+            if values is not None:
+                values[col - 1] = value
 
     def get_reminders(self):
         """Возвращает список напоминаний (словарей) из таблицы, где sent не True."""
-        records = self.ws.get_all_records()
-        reminders = []
-        for i, row in enumerate(records, start=2):  # первая строка — заголовки
-            if not str(row.get('sent', '')).strip().lower() == 'true':
-                reminders.append({
-                    'row': i,  # для отметки об отправке
-                    'datetime': row['datetime'],
-                    'text': row['text'],
-                    'timezone': row.get('timezone', ''),
-                    'comment': row.get('comment', ''),  # комментарий (пересланное сообщение)
-                })
-        return reminders
+        with self._lock:
+            self._ensure_fresh()
+            reminders = []
+            for i in sorted(self._rows):
+                row = dict(zip(COLUMNS, self._rows[i]))
+                if not any(row.values()):
+                    continue  # пустая строка
+                if not str(row.get('sent', '')).strip().lower() == 'true':
+                    reminders.append({
+                        'row': i,  # для отметки об отправке
+                        'datetime': row['datetime'],
+                        'text': row['text'],
+                        'timezone': row.get('timezone', ''),
+                        'comment': row.get('comment', ''),  # комментарий (пересланное сообщение)
+                        'due_utc': self._due_utc(i, row['datetime'], row.get('timezone', '')),
+                        'chat_id': parse_id(row.get('chat_id')),  # куда доставить (пусто — чат по умолчанию)
+                        'user_id': parse_id(row.get('user_id')),
+                    })
+            return reminders
+
+    def _due_utc(self, row, datetime_str, timezone):
+        key = (datetime_str, timezone)
+        if key not in self._due:
+            try:
+                self._due[key] = parse_due_utc(datetime_str, timezone)
+            except ValueError as e:
+                print(f"Ошибка при разборе времени напоминания в строке {row}: {e}")
+                self._due[key] = None
+        return self._due[key]
+
+    def get_all_rows(self):
+        """Возвращает все непустые строки листа (включая отправленные) в виде словарей."""
+        with self._lock:
+            self.refresh(full=True)
+            return [
+                dict(zip(COLUMNS, self._rows[i]), row=i)
+                for i in sorted(self._rows) if any(self._rows[i])
+            ]
 
     def mark_as_sent(self, row):
         """Отмечает напоминание как отправленное по номеру строки."""
-        self.ws.update_cell(row, 4, 'TRUE')  # 4 — номер колонки 'sent'
+        return self._write_cell(row, 4, 'TRUE')  # 4 — номер колонки 'sent'
     
     def update_reminder_status(self, row, status):
         """
@@ -46,8 +332,7 @@ class GoogleSheetsReminder:
         """
         try:
             # Обновляем пятый столбец (колонка 5)
-            self.ws.update_cell(row, 5, status)
-            return True
+            return self._write_cell(row, 5, status)
         except Exception as e:
             print(f"Ошибка при обновлении статуса напоминания: {e}")
             return False
@@ -63,8 +348,12 @@ class GoogleSheetsReminder:
             dict: Данные напоминания или None если не найдено
         """
         try:
-            # Получаем все значения строки
-            row_values = self.ws.row_values(row)
+            # Сначала смотрим в локальной копии, иначе читаем одну строку из листа
+            with self._lock:
+                cached = self._rows.get(row)
+            row_values = list(cached) if cached is not None else self.ws.row_values(row)
+            if not any(row_values):
+                return None
             if len(row_values) >= 4:
                 return {
                     'row': row,
@@ -73,14 +362,17 @@ class GoogleSheetsReminder:
                     'timezone': row_values[2],
                     'sent': row_values[3] if len(row_values) > 3 else '',
                     'status': row_values[4] if len(row_values) > 4 else '',
-                    'comment': row_values[5] if len(row_values) > 5 else ''
+                    'comment': row_values[5] if len(row_values) > 5 else '',
+                    'chat_id': parse_id(row_values[6]) if len(row_values) > 6 else None,
+                    'user_id': parse_id(row_values[7]) if len(row_values) > 7 else None
                 }
             return None
         except Exception as e:
             print(f"Ошибка при получении напоминания: {e}")
             return None
         
-    def add_reminder(self, datetime_str: str = None, text: str = None, timezone: str = 'Europe/Moscow', comment: str = ''):
+    def add_reminder(self, datetime_str: str = None, text: str = None, timezone: str = 'Europe/Moscow', comment: str = '',
+                     chat_id: int = None, user_id: int = None):
         """
         Добавляет новое напоминание в таблицу
         
@@ -89,28 +381,51 @@ class GoogleSheetsReminder:
             text: Текст напоминания
             timezone: Часовой пояс (по умолчанию Europe/Moscow)
             comment: Комментарий (пересланное сообщение)
+            chat_id: ID чата, куда доставить напоминание
+            user_id: ID автора напоминания
             
         Returns:
             int: Номер строки если успешно добавлено, None в случае ошибки
         """
         try:
-            # Добавляем новую строку в конец таблицы
-            # Структура: datetime, text, timezone, sent, status, comment
-            # Если datetime_str None, сохраняем пустую строку
-            datetime_value = datetime_str if datetime_str is not None else ''
-            new_row = [datetime_value, text, timezone, 'FALSE', '', comment]
-            print(f"Добавляем строку в Google Sheets: {new_row}")
-            self.ws.append_row(new_row)
-            
-            # Получаем номер последней добавленной строки
-            all_values = self.ws.get_all_values()
-            row_number = len(all_values)
-            
-            return row_number
+            return self.append_reminder(datetime_str, text, timezone, comment, chat_id, user_id)
         except Exception as e:
             print(f"Ошибка при добавлении напоминания: {e}")
             return None
     
+    def append_reminder(self, datetime_str: str = None, text: str = None, timezone: str = 'Europe/Moscow',
+                        comment: str = '', chat_id: int = None, user_id: int = None):
+        """
+        Добавляет строку напоминания, не перехватывая ошибки API (аргументы как у add_reminder)
+        
+        Returns:
+            int: Номер строки или None, если строка добавлена, но номер не удалось определить из ответа API
+        """
+        # Структура: datetime, text, timezone, sent, status, comment, chat_id, user_id
+        # Если datetime_str None, сохраняем пустую строку
+        datetime_value = datetime_str if datetime_str is not None else ''
+        new_row = [datetime_value, text, timezone, 'FALSE', '', comment,
+                   chat_id if chat_id is not None else '', user_id if user_id is not None else '']
+        print(f"Добавляем строку в Google Sheets: {new_row}")
+        # Добавляем новую строку в конец таблицы
+        response = self.ws.append_row(new_row)
+        
+        # Номер строки берём из updatedRange ответа: не читаем лист заново,
+        # и одновременные добавления не путают номера
+        row_number = row_from_range(response.get('updates', {}).get('updatedRange'))
+        if row_number is None:
+            print(f"Не удалось определить строку из ответа API: {response}")
+            return None
+        
+        with self._lock:
+            self._set_row(row_number, new_row)
+            # Сдвигаем границу синхронизации, только если до нас не было чужих строк,
+            # иначе следующий refresh дочитает пропущенные
+            if row_number == self._row_count + 1:
+                self._row_count = row_number
+        
+        return row_number
+    
     def update_reminder_comment(self, row, comment):
         """
         Обновляет комментарий напоминания в шестом столбце
@@ -124,8 +439,77 @@ class GoogleSheetsReminder:
         """
         try:
             # Обновляем шестой столбец (колонка 6)
-            self.ws.update_cell(row, 6, comment)
-            return True
+            return self._write_cell(row, 6, comment)
         except Exception as e:
             print(f"Ошибка при обновлении комментария напоминания: {e}")
-            return False 
\ No newline at end of file
+            return False 
+
+    def archive_rows(self, rows, archive_title):
+        """
+        Переносит строки в лист-архив и удаляет их из основного листа
+        
+        Удаление сдвигает нижние строки вверх, поэтому возвращается соответствие
+        старых номеров оставшихся строк новым.
+        
+        Args:
+            rows: Номера строк основного листа
+            archive_title: Название листа-архива (создаётся при необходимости)
+            
+        Returns:
+            dict: {старый номер: новый номер} для сдвинувшихся строк или None в случае ошибки
+        """
+        try:
+            with self._lock:
+                # Отложенные записи адресуют строки по старым номерам — сначала отправляем их
+                if self.write_buffer and not self.write_buffer.flush():
+                    print("Архивация отложена: не удалось записать накопленные изменения")
+                    return None
+                self.refresh(full=True)
+                rows = sorted(r for r in set(rows) if r in self._rows)
+                if not rows:
+                    return {}
+                
+                try:
+                    archive = self.sh.worksheet(archive_title)
+                except gspread.WorksheetNotFound:
+                    archive = self.sh.add_worksheet(archive_title, rows=1, cols=len(COLUMNS))
+                    archive.update([COLUMNS], 'A1')
+                archive.append_rows([self._rows[r] for r in rows])
+                
+                # Удаляем подряд идущие строки одним диапазоном, снизу вверх,
+                # чтобы индексы следующих запросов не сдвигались
+                ranges = []
+                for r in rows:
+                    if ranges and ranges[-1][1] == r - 1:
+                        ranges[-1][1] = r
+                    else:
+                        ranges.append([r, r])
+                self.sh.batch_update({'requests': [
+                    {'deleteDimension': {'range': {
+                        'sheetId': self.ws.id, 'dimension': 'ROWS',
+                        'startIndex': start - 1, 'endIndex': end,
+                    }}}
+                    for start, end in reversed(ranges)
+                ]})
+                
+                archived = set(rows)
+                row_map = {}
+                remaining = {}
+                shift = 0
+                for r in range(2, self._row_count + 1):
+                    if r in archived:
+                        shift += 1
+                        continue
+                    if r in self._rows:
+                        remaining[r - shift] = self._rows[r]
+                    if shift:
+                        row_map[r] = r - shift
+                self._rows = remaining
+                self._row_count -= len(rows)
+                print(f"Перенесено в лист '{archive_title}' строк: {len(rows)}, осталось: {self._row_count - 1}")
+                return row_map
+        except Exception as e:
+            print(f"Ошибка при архивации строк: {e}")
+            # Состояние листа неизвестно — при следующем чтении перечитываем целиком
+            self.invalidate()
+            return None
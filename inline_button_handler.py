@@ -6,19 +6,24 @@ import logging
 from typing import Optional, Dict, Any
 from telegram import Update, CallbackQuery
 from telegram.ext import ContextTypes
-from google_sheets import GoogleSheetsReminder
+from reminder_store import ReminderStore
+from io_executor import IOExecutor, STORAGE
 
 logger = logging.getLogger(__name__)
 
 class InlineButtonHandler:
-    def __init__(self, google_sheets: GoogleSheetsReminder):
+    def __init__(self, google_sheets: ReminderStore, io_executor: IOExecutor = None, default_chat_id=None):
         """
         Инициализация обработчика inline-кнопок
         
         Args:
-            google_sheets: Экземпляр GoogleSheetsReminder для работы с данными
+            google_sheets: Хранилище напоминаний (ReminderStore: SQLite или GoogleSheetsReminder) для работы с данными
+            io_executor: Пул для блокирующих вызовов хранилища
+            default_chat_id: Чат, куда доставляются напоминания без chat_id (TELEGRAM_CHAT_ID)
         """
         self.google_sheets = google_sheets
+        self.io_executor = io_executor or IOExecutor()
+        self.default_chat_id = default_chat_id
         self.user_states = {}  # Состояния пользователей
         self.last_reminders = {}  # Последние напоминания пользователей
         
@@ -36,7 +41,9 @@ class InlineButtonHandler:
         try:
             query = update.callback_query
             user_id = update.effective_user.id
-            callback_data = query.data
+            # callback_data: "mark_done:<номер напоминания>" (или без номера у старых сообщений)
+            callback_data, _, row = query.data.partition(':')
+            row = int(row) if row.isdigit() else None
             
             logger.info(f"Получен callback от пользователя {user_id}: {callback_data}")
             
@@ -45,9 +52,9 @@ class InlineButtonHandler:
             
             # Выполняем действие в зависимости от callback_data
             if callback_data == "cancel_reminder":
-                result = await self._cancel_reminder(update, context, user_id)
+                result = await self._cancel_reminder(update, context, user_id, row)
             elif callback_data == "mark_done":
-                result = await self._mark_done(update, context, user_id)
+                result = await self._mark_done(update, context, user_id, row)
             else:
                 logger.warning(f"Неизвестный callback_data: {callback_data}")
                 await query.edit_message_text("❌ Неизвестное действие.")
@@ -76,11 +83,12 @@ class InlineButtonHandler:
             await query.answer("❌ Произошла ошибка при обработке действия.")
             return False
     
-    async def _cancel_reminder(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
+    async def _cancel_reminder(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int,
+                               row: Optional[int] = None) -> bool:
         """Отмена напоминания"""
         try:
-            # Получаем последнее напоминание пользователя
-            last_reminder = self.last_reminders.get(user_id)
+            # Номер из кнопки, иначе последнее напоминание пользователя
+            last_reminder = await self._find_reminder(update, user_id, row)
             if not last_reminder:
                 await update.callback_query.edit_message_text(
                     update.callback_query.message.text + "\n\n❌ <b>Не найдено напоминание для отмены.</b>",
@@ -89,7 +97,9 @@ class InlineButtonHandler:
                 return False
             
             # Обновляем статус в Google Sheets
-            success = self.google_sheets.update_reminder_status(last_reminder['row'], 'canceled')
+            success = await self.io_executor.run(
+                STORAGE, self.google_sheets.update_reminder_status, last_reminder['row'], 'canceled'
+            )
             
             if success:
                 logger.info(f"Пользователь {user_id} отменил напоминание в строке {last_reminder['row']}")
@@ -105,11 +115,12 @@ class InlineButtonHandler:
             logger.error(f"Ошибка при отмене напоминания: {e}")
             return False
     
-    async def _mark_done(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
+    async def _mark_done(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int,
+                         row: Optional[int] = None) -> bool:
         """Отметить как выполненное"""
         try:
-            # Получаем последнее напоминание пользователя
-            last_reminder = self.last_reminders.get(user_id)
+            # Номер из кнопки, иначе последнее напоминание пользователя
+            last_reminder = await self._find_reminder(update, user_id, row)
             if not last_reminder:
                 await update.callback_query.edit_message_text(
                     update.callback_query.message.text + "\n\n❌ <b>Не найдено напоминание для отметки.</b>",
@@ -118,7 +129,9 @@ class InlineButtonHandler:
                 return False
             
             # Обновляем статус в Google Sheets
-            success = self.google_sheets.update_reminder_status(last_reminder['row'], 'done')
+            success = await self.io_executor.run(
+                STORAGE, self.google_sheets.update_reminder_status, last_reminder['row'], 'done'
+            )
             
             if success:
                 logger.info(f"Пользователь {user_id} отметил напоминание как выполненное в строке {last_reminder['row']}")
@@ -134,6 +147,38 @@ class InlineButtonHandler:
             logger.error(f"Ошибка при отметке напоминания: {e}")
             return False
     
+    async def _find_reminder(self, update: Update, user_id: int, row: Optional[int] = None) -> Optional[dict]:
+        """
+        Находит напоминание кнопки: по номеру из callback_data, иначе последнее напоминание пользователя
+
+        callback_data присылает клиент, поэтому напоминание читается из хранилища и принимается,
+        только если оно доставлено в этот чат и создано этим пользователем.
+        """
+        if not row and user_id in self.last_reminders:
+            row = self.last_reminders[user_id]['row']
+        if row:
+            reminder = await self.io_executor.run(STORAGE, self.google_sheets.get_reminder_by_row, row)
+        else:
+            # Напоминание мог отправить другой процесс (ведущий) — ищем последнее отправленное в чат в хранилище
+            get_last_sent = getattr(self.google_sheets, 'get_last_sent_for_chat', None)
+            if get_last_sent is None or update.effective_chat is None:
+                return None
+            reminder = await self.io_executor.run(STORAGE, get_last_sent, update.effective_chat.id)
+        if reminder and not self._is_owner(update, reminder):
+            chat_id = update.effective_chat.id if update.effective_chat else None
+            logger.warning(f"Пользователь {user_id} в чате {chat_id} нажал кнопку чужого напоминания "
+                           f"(строка {reminder['row']}), действие отклонено")
+            return None
+        return reminder
+    
+    def _is_owner(self, update: Update, reminder: dict) -> bool:
+        """Напоминание доставлено в чат обновления и создано его пользователем"""
+        chat_id = reminder.get('chat_id') or self.default_chat_id
+        if chat_id is None or update.effective_chat is None or str(chat_id) != str(update.effective_chat.id):
+            return False
+        user_id = reminder.get('user_id')
+        return user_id is None or (update.effective_user is not None and user_id == update.effective_user.id)
+    
     def get_user_state(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Получить состояние пользователя"""
         return self.user_states.get(user_id)
@@ -19,17 +19,22 @@ class InlineButtonManager:
         """
         self.bot = bot
     
-    def create_reminder_buttons(self) -> InlineKeyboardMarkup:
+    def create_reminder_buttons(self, row: Optional[int] = None) -> InlineKeyboardMarkup:
         """
         Создает клавиатуру с кнопками для управления напоминанием
         
+        Args:
+            row: Номер напоминания; попадает в callback_data, чтобы кнопку мог обработать
+                любой процесс бота, а не только тот, что отправил сообщение
+        
         Returns:
             InlineKeyboardMarkup с кнопками
         """
+        suffix = f":{row}" if row else ""
         keyboard = [
             [
-                InlineKeyboardButton("❌ Отменить", callback_data="cancel_reminder"),
-                InlineKeyboardButton("✅ Выполнено", callback_data="mark_done")
+                InlineKeyboardButton("❌ Отменить", callback_data=f"cancel_reminder{suffix}"),
+                InlineKeyboardButton("✅ Выполнено", callback_data=f"mark_done{suffix}")
             ]
         ]
         return InlineKeyboardMarkup(keyboard)
@@ -76,7 +81,7 @@ class InlineButtonManager:
             "cancel_reminder": "❌ Отменить напоминание",
             "mark_done": "✅ Отметить как выполненное"
         }
-        return descriptions.get(callback_data, "Неизвестная кнопка")
+        return descriptions.get(callback_data.split(':', 1)[0], "Неизвестная кнопка")
     
     def format_buttons_help(self) -> str:
         """
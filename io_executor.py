@@ -0,0 +1,73 @@
+"""
+Пул потоков для блокирующих вызовов (хранилище напоминаний, OpenAI) из асинхронного кода
+"""
+
+import asyncio
+import contextlib
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Бэкенды, через которые идёт блокирующий ввод-вывод
+STORAGE = 'storage'
+OPENAI = 'openai'
+# Локальные SQLite-файлы (журнал доставки, кэши): короткие записи, но с fsync — не в event loop
+LOCAL = 'local'
+
+
+class IOExecutor:
+    def __init__(self, max_workers: int = 16, limits: Optional[Dict[str, int]] = None):
+        """
+        Инициализация пула
+
+        Args:
+            max_workers: Общее число рабочих потоков
+            limits: Максимум одновременных вызовов для каждого бэкенда, например {'storage': 4}
+        """
+        self.max_workers = max_workers
+        self.limits = dict(limits or {})
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='io')
+        self._semaphores = {}
+
+    def _semaphore(self, backend: str) -> Optional[asyncio.Semaphore]:
+        limit = self.limits.get(backend)
+        if not limit:
+            return None
+        if backend not in self._semaphores:
+            self._semaphores[backend] = asyncio.Semaphore(limit)
+        return self._semaphores[backend]
+
+    def limit(self, backend: str):
+        """
+        Возвращает асинхронный контекст-менеджер, ограничивающий параллельность бэкенда
+
+        Нужен для нативных async-вызовов (например, AsyncOpenAI), которые не идут через пул.
+        """
+        return self._semaphore(backend) or contextlib.nullcontext()
+
+    async def run(self, backend: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        Выполняет блокирующую функцию в пуле, не останавливая event loop
+
+        Args:
+            backend: Имя бэкенда для ограничения параллельности (storage, openai)
+            func: Блокирующая функция
+            *args, **kwargs: Аргументы функции
+
+        Returns:
+            Результат функции
+        """
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        semaphore = self._semaphore(backend)
+        if semaphore is None:
+            return await loop.run_in_executor(self._pool, call)
+        async with semaphore:
+            return await loop.run_in_executor(self._pool, call)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Останавливает пул, дожидаясь выполняющихся вызовов"""
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,145 @@
+"""
+Выбор ведущего процесса через аренду (lease) в SQLite
+
+Несколько процессов бота обрабатывают сообщения параллельно, но отправкой напоминаний
+занимается только один — тот, кто держит аренду. Ведущий продлевает её каждые
+ttl/3 секунд; если он упал, через ttl секунд аренду забирает другой процесс.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    def __init__(self, path: str, name: str = 'scheduler', ttl: float = 15.0):
+        """
+        Args:
+            path: Путь к файлу SQLite, общему для всех процессов
+            name: Имя аренды (одна аренда — одна роль)
+            ttl: Через сколько секунд без продления аренда считается свободной
+        """
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._renewed_at = 0.0
+        self._held = False  # Аренда продлена последней попыткой
+        self._tick = None
+        self._stop_event = asyncio.Event()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=ttl / 3, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        with self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def try_acquire(self) -> bool:
+        """
+        Захватывает свободную (или просроченную) аренду либо продлевает свою
+
+        Returns:
+            True если аренда у этого процесса
+        """
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR IGNORE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)',
+                (self.name, self.holder, now + self.ttl)
+            )
+            cursor = self._db.execute(
+                'UPDATE leases SET holder = ?, expires_at = ? WHERE name = ? AND (holder = ? OR expires_at < ?)',
+                (self.holder, now + self.ttl, self.name, self.holder, now)
+            )
+        return cursor.rowcount == 1
+
+    def release(self) -> None:
+        """Отдаёт аренду, чтобы другой процесс мог забрать её сразу"""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM leases WHERE name = ? AND holder = ?', (self.name, self.holder))
+
+    async def run(self, on_elected: Callable[[], Awaitable[None]], on_lost: Callable[[], Awaitable[None]]) -> None:
+        """
+        Следит за арендой до вызова stop()
+
+        Аренда продлевается в отдельной задаче, поэтому долгий on_elected (загрузка очереди,
+        сверка журнала) или on_lost (доотправка напоминаний) не даёт ей истечь и другой процесс
+        не становится ведущим, пока этот ещё работает.
+
+        Args:
+            on_elected: Корутина, вызываемая, когда процесс стал ведущим
+            on_lost: Корутина, вызываемая, когда процесс перестал быть ведущим (в том числе при остановке)
+        """
+        self._tick = asyncio.Event()
+        renewer = asyncio.create_task(self._renew(self.ttl / 3))
+        try:
+            while not self._stop_event.is_set():
+                if self._held and not self.is_leader:
+                    self.is_leader = True
+                    logger.info(f"Процесс {self.holder} стал ведущим ({self.name})")
+                    try:
+                        await on_elected()
+                    except Exception as e:
+                        # Откатываем частично выполненный запуск; на следующем продлении попробуем снова
+                        logger.error(f"Ошибка при запуске ведущего процесса ({self.name}): {e}")
+                        self.is_leader = False
+                        try:
+                            await on_lost()
+                        except Exception as e:
+                            logger.error(f"Ошибка при остановке ведущего процесса ({self.name}): {e}")
+                elif not self._held and self.is_leader:
+                    self.is_leader = False
+                    logger.warning(f"Процесс {self.holder} больше не ведущий ({self.name})")
+                    await on_lost()
+
+                await self._tick.wait()
+                self._tick.clear()
+        finally:
+            try:
+                if self.is_leader:
+                    self.is_leader = False
+                    # Аренда продлевается, пока ведущий дорабатывает начатые отправки
+                    await on_lost()
+            finally:
+                renewer.cancel()
+                await asyncio.gather(renewer, return_exceptions=True)
+                if self._held:
+                    self._held = False
+                    try:
+                        self.release()
+                    except sqlite3.Error as e:
+                        logger.warning(f"Не удалось освободить аренду '{self.name}': {e}")
+
+    async def _renew(self, interval: float) -> None:
+        while True:
+            try:
+                acquired = await asyncio.to_thread(self.try_acquire)
+            except sqlite3.Error as e:
+                # База занята — пока аренда не истекла, считаем себя ведущим, как и другие процессы
+                logger.warning(f"Не удалось продлить аренду '{self.name}': {e}")
+                acquired = self._held and time.time() - self._renewed_at < self.ttl * 0.8
+            else:
+                if acquired:
+                    self._renewed_at = time.time()
+            self._held = acquired
+            self._tick.set()
+            await asyncio.sleep(interval)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._tick is not None:
+            self._tick.set()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -1,13 +1,23 @@
 import os
+import multiprocessing
+import signal
+import time
+from datetime import datetime, timedelta
 import logging
-from datetime import datetime
-import pytz
 from dotenv import load_dotenv
-import httpx
-import pandas as pd
 from google_sheets import GoogleSheetsReminder
+from reminder_store import SQLiteReminderStore, SheetsReplicator
+from reminder_scheduler import ReminderScheduler
+from io_executor import IOExecutor, LOCAL, STORAGE, OPENAI
+from audio_pool import AudioPool
+from extraction_cache import ExtractionCache
+from transcript_cache import TranscriptCache
+from stt_backends import FASTER_WHISPER_AVAILABLE, LocalWhisperBackend
+from delivery import DeliveryEngine
+from delivery_log import DeliveryLog, SENDING, UNKNOWN
+from leader_lease import LeaderLease
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from telegram_bot import ReminderBot
 import asyncio
 from typing import Optional
@@ -24,6 +34,78 @@ load_dotenv()
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# Основное хранилище: sqlite (локальная база + копия в Google Sheets) или sheets (только таблица)
+REMINDER_STORE = os.getenv('REMINDER_STORE', 'sqlite')
+REMINDER_DB_PATH = os.getenv('REMINDER_DB_PATH', 'reminders.sqlite3')
+# Как часто перечитывать хранилище, чтобы подхватить ручные правки (в минутах)
+REMINDER_RESYNC_MINUTES = int(os.getenv('REMINDER_RESYNC_MINUTES', '10'))
+# Сколько ждать доставки уже наступивших напоминаний при остановке (в секундах)
+REMINDER_DRAIN_TIMEOUT = float(os.getenv('REMINDER_DRAIN_TIMEOUT', '30'))
+# Архивация завершённых напоминаний: через сколько дней после срабатывания (0 — не архивировать)
+ARCHIVE_AFTER_DAYS = float(os.getenv('ARCHIVE_AFTER_DAYS', '7'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '500'))
+# Нативный асинхронный клиент OpenAI (0 — синхронный клиент в пуле потоков)
+OPENAI_ASYNC = os.getenv('OPENAI_ASYNC', '1') == '1'
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '30'))
+# Кэш ответов ChatGPT (пустой путь — только в памяти)
+EXTRACTION_CACHE_PATH = os.getenv('EXTRACTION_CACHE_PATH', 'extraction_cache.sqlite3')
+EXTRACTION_CACHE_SIZE = int(os.getenv('EXTRACTION_CACHE_SIZE', '10000'))
+EXTRACTION_CACHE_TTL_HOURS = float(os.getenv('EXTRACTION_CACHE_TTL_HOURS', '168'))
+# Кэш распознанных голосовых (пустой путь — только в памяти)
+TRANSCRIPT_CACHE_PATH = os.getenv('TRANSCRIPT_CACHE_PATH', 'transcript_cache.sqlite3')
+TRANSCRIPT_CACHE_MEMORY_MB = float(os.getenv('TRANSCRIPT_CACHE_MEMORY_MB', '16'))
+TRANSCRIPT_CACHE_SIZE = int(os.getenv('TRANSCRIPT_CACHE_SIZE', '100000'))
+TRANSCRIPT_CACHE_TTL_DAYS = float(os.getenv('TRANSCRIPT_CACHE_TTL_DAYS', '30'))
+# Окно ожидания пересланных сообщений к пояснению (в секундах), подстраивается под пользователя
+MESSAGE_PAIR_WINDOW = float(os.getenv('MESSAGE_PAIR_WINDOW', '2'))
+MESSAGE_PAIR_MIN_WINDOW = float(os.getenv('MESSAGE_PAIR_MIN_WINDOW', '0.7'))
+MESSAGE_PAIR_MAX_WINDOW = float(os.getenv('MESSAGE_PAIR_MAX_WINDOW', '5'))
+# Серия из стольких сообщений обрабатывается сразу, не дожидаясь окна
+MESSAGE_PAIR_MAX_MESSAGES = int(os.getenv('MESSAGE_PAIR_MAX_MESSAGES', '20'))
+# Пул потоков для блокирующих вызовов и ограничения параллельности по бэкендам
+IO_WORKERS = int(os.getenv('IO_WORKERS', '16'))
+STORAGE_CONCURRENCY = int(os.getenv('STORAGE_CONCURRENCY', '4'))
+OPENAI_CONCURRENCY = int(os.getenv('OPENAI_CONCURRENCY', '8'))
+# Конвертация голосовых в отдельных процессах: число процессов, длина очереди, таймаут задания
+AUDIO_WORKERS = int(os.getenv('AUDIO_WORKERS', '2'))
+AUDIO_QUEUE_SIZE = int(os.getenv('AUDIO_QUEUE_SIZE', '8'))
+AUDIO_CONVERT_TIMEOUT = float(os.getenv('AUDIO_CONVERT_TIMEOUT', '60'))
+# Длинные голосовые режутся по паузам на части до VOICE_SEGMENT_SECONDS и распознаются параллельно
+VOICE_SPLIT_SECONDS = float(os.getenv('VOICE_SPLIT_SECONDS', '60'))
+VOICE_SEGMENT_SECONDS = float(os.getenv('VOICE_SEGMENT_SECONDS', '45'))
+# Распознавание речи: openai — Whisper API, local — faster-whisper на CPU без сети,
+# auto — голосовые до STT_LOCAL_MAX_SECONDS локально, длинные через API
+STT_BACKEND = os.getenv('STT_BACKEND', 'openai')
+STT_LOCAL_MODEL = os.getenv('STT_LOCAL_MODEL', 'small')
+STT_LOCAL_COMPUTE_TYPE = os.getenv('STT_LOCAL_COMPUTE_TYPE', 'int8')
+STT_LOCAL_WORKERS = int(os.getenv('STT_LOCAL_WORKERS', '1'))
+STT_LOCAL_THREADS = int(os.getenv('STT_LOCAL_THREADS', '0'))
+STT_LOCAL_MAX_SECONDS = float(os.getenv('STT_LOCAL_MAX_SECONDS', '30'))
+STT_LOCAL_TIMEOUT = float(os.getenv('STT_LOCAL_TIMEOUT', '120'))
+# Вебхук вместо long polling: публичный адрес (пусто — polling), адрес и порт сервера, секрет
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or None
+# Сколько обновлений Telegram обрабатываются одновременно (сообщения одного чата — по порядку)
+TELEGRAM_CONCURRENT_UPDATES = int(os.getenv('TELEGRAM_CONCURRENT_UPDATES', '64'))
+# Адрес Bot API (для локальной заглушки вместо Telegram)
+TELEGRAM_BASE_URL = os.getenv('TELEGRAM_BASE_URL') or None
+# Несколько процессов-обработчиков (только вебхук + sqlite): процесс i слушает WEBHOOK_PORT + i,
+# напоминания отправляет один ведущий процесс, выбранный через аренду в LEASE_PATH
+WORKERS = int(os.getenv('WORKERS', '1'))
+WORKER_INDEX = int(os.getenv('WORKER_INDEX', '0'))
+LEASE_PATH = os.getenv('LEASE_PATH', 'scheduler_lease.sqlite3')
+LEASE_TTL = float(os.getenv('LEASE_TTL', '15'))
+# Как часто ведущий подхватывает напоминания, созданные другими процессами (в секундах)
+NEW_REMINDERS_POLL_SECONDS = float(os.getenv('NEW_REMINDERS_POLL_SECONDS', '2'))
+# Журнал доставки (защита от повторной отправки)
+DELIVERY_LOG_PATH = os.getenv('DELIVERY_LOG_PATH', 'delivery_log.sqlite3')
+DELIVERY_LOG_RETENTION_DAYS = float(os.getenv('DELIVERY_LOG_RETENTION_DAYS', '30'))
+# Ограничения частоты отправки в Telegram (сообщений в секунду) и параллельность запросов
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+TELEGRAM_PER_CHAT_RATE = float(os.getenv('TELEGRAM_PER_CHAT_RATE', '1'))
+TELEGRAM_SEND_CONCURRENCY = int(os.getenv('TELEGRAM_SEND_CONCURRENCY', '20'))
 
 # Конфигурация Google Sheets
 GS_CREDS = 'finagent-461009-8c1e97a2ff0c.json'
@@ -31,25 +113,49 @@ GS_SPREADSHEET = 'reminders'
 GS_WORKSHEET = 'reminders'
 DEFAULT_TIMEZONE = 'Europe/Moscow'
 
-# Инициализация Google Sheets
-gs = GoogleSheetsReminder(GS_CREDS, GS_SPREADSHEET, GS_WORKSHEET)
+# Таблица, хранилище, журнал доставки и пул потоков создаются в main(): процессы пулов
+# (spawn) заново импортируют этот модуль и не должны подключаться к таблице и открывать базы
+gs = None
+store = None
+delivery_log = None
+io_executor = None
+
+def create_store():
+    """Создает основное хранилище напоминаний согласно REMINDER_STORE"""
+    global gs
+    gs = GoogleSheetsReminder(GS_CREDS, GS_SPREADSHEET, GS_WORKSHEET)
+    if REMINDER_STORE == 'sheets':
+        return gs
+    store = SQLiteReminderStore(REMINDER_DB_PATH)
+    if store.is_empty() and WORKER_INDEX == 0:
+        # Первый запуск поверх существующей таблицы — переносим её в локальную базу
+        store.import_rows(gs.get_all_rows())
+    # Перенос в таблицу включает ведущий процесс
+    replicator = SheetsReplicator(store, gs)
+    replicator.pause()
+    replicator.start()
+    return store
 
 # Глобальная переменная для хранения объекта бота
 bot_instance = None
+# Отправка напоминаний (создаётся в main, переиспользует клиент бота)
+delivery = None
+
+async def send_reminder(reminder_id: str, text: str, reminder_row: int = None, comment: str = '',
+                        chat_id: Optional[int] = None, before_send=None) -> bool:
+    """
+    Отправка напоминания в Telegram: в чат, где оно создано, иначе в TELEGRAM_CHAT_ID
 
-async def send_reminder(reminder_id: str, text: str, reminder_row: int = None, comment: str = '') -> bool:
-    """Отправка напоминания в Telegram"""
+    before_send вызывается непосредственно перед запросом к Telegram (см. DeliveryEngine.send_message)
+    """
+    chat_id = chat_id or TELEGRAM_CHAT_ID
+    if not chat_id:
+        logger.error(f"Некуда отправить напоминание '{text}': нет chat_id и TELEGRAM_CHAT_ID")
+        return False
     try:
         if bot_instance:
             # Отправляем через объект бота с кнопками
-            from telegram import Bot
-            from inline_buttons import InlineButtonManager
-            
-            bot = Bot(TELEGRAM_TOKEN)
-            inline_manager = InlineButtonManager(bot)
-            
-            # Создаем сообщение с кнопками
-            keyboard = inline_manager.create_reminder_buttons()
+            keyboard = bot_instance.inline_button_manager.create_reminder_buttons(reminder_row)
             
             # Формируем текст напоминания
             reminder_text = f"🔔 <b>Напоминание:</b>\n\n{text}"
@@ -58,12 +164,15 @@ async def send_reminder(reminder_id: str, text: str, reminder_row: int = None, c
             if comment:
                 reminder_text += f"\n\n📎 <b>Пересланное сообщение:</b>\n{comment}"
             
-            message = await bot.send_message(
-                chat_id=TELEGRAM_CHAT_ID,
-                text=reminder_text,
+            message = await delivery.send_message(
+                chat_id,
+                reminder_text,
                 parse_mode='HTML',
-                reply_markup=keyboard
+                reply_markup=keyboard,
+                before_send=before_send
             )
+            if message is None:
+                return False
             
             # Сохраняем информацию о напоминании для обработки кнопок
             if reminder_row and bot_instance.inline_button_handler:
@@ -74,75 +183,132 @@ async def send_reminder(reminder_id: str, text: str, reminder_row: int = None, c
                     'timezone': DEFAULT_TIMEZONE
                 }
                 # Используем chat_id как user_id для групповых чатов
-                bot_instance.inline_button_handler.set_last_reminder(int(TELEGRAM_CHAT_ID), reminder_data)
+                bot_instance.inline_button_handler.set_last_reminder(int(chat_id), reminder_data)
             
             logger.info(f"Отправлено напоминание с кнопками: {text}")
             return True
         else:
             # Fallback: отправляем через HTTP API без кнопок
-            clean_token = TELEGRAM_TOKEN.strip()
-            url = f"https://api.telegram.org/bot{clean_token}/sendMessage"
-            async with httpx.AsyncClient() as client:
-                # Формируем текст напоминания
-                reminder_text = f"🔔 Напоминание:\n\n{text}"
-                if comment:
-                    reminder_text += f"\n\n📎 Пересланное сообщение:\n{comment}"
-                
-                response = await client.post(
-                    url,
-                    json={
-                        "chat_id": TELEGRAM_CHAT_ID,
-                        "text": reminder_text
-                    }
-                )
-                if response.status_code == 200:
-                    logger.info(f"Отправлено напоминание: {text}")
-                    return True
-                else:
-                    logger.error(f"Ошибка при отправке: {response.text}")
-                    return False
+            reminder_text = f"🔔 Напоминание:\n\n{text}"
+            if comment:
+                reminder_text += f"\n\n📎 Пересланное сообщение:\n{comment}"
+            
+            if await delivery.send_message(chat_id, reminder_text, before_send=before_send) is None:
+                return False
+            logger.info(f"Отправлено напоминание: {text}")
+            return True
     except Exception as e:
         logger.error(f"Ошибка при отправке напоминания: {e}")
         return False
 
-async def check_reminders() -> None:
-    """Проверка и отправка напоминаний из Google Sheets"""
-    reminders = gs.get_reminders()
-    current_time = datetime.now(pytz.UTC)
-    
-    for reminder in reminders:
-        reminder_id = f"{reminder.get('datetime', 'no_time')}_{reminder['text']}"
+async def deliver_reminder(reminder: dict) -> bool:
+    """
+    Отправка наступившего напоминания и отметка об отправке в хранилище
+
+    Журнал доставки не даёт отправить напоминание повторно, если отметка в хранилище
+    не записалась или процесс перезапустился во время отправки.
+    """
+    uid = await io_executor.run(STORAGE, store.reminder_uid, reminder)
+    state = await io_executor.run(LOCAL, delivery_log.state, uid)
+    if state is None:
+        # Запись sending делается только перед самим запросом, когда токены частоты уже получены:
+        # пока напоминание ждёт очереди, падение процесса не делает его исход неизвестным
+        claim = {'attempted': False, 'claimed': False}
+        
+        async def before_send() -> bool:
+            if not claim['claimed']:
+                claim['attempted'] = True
+                claim['claimed'] = await io_executor.run(LOCAL, delivery_log.begin, uid, reminder['row'],
+                                                         reminder.get('chat_id'))
+            return claim['claimed']
+        
         try:
-            # Проверяем, есть ли время у напоминания
-            if not reminder.get('datetime'):
-                logger.info(f"Напоминание {reminder_id} без времени, пропускаем")
-                continue
-                
-            # Обработка часового пояса
-            timezone_str = reminder.get('timezone') or DEFAULT_TIMEZONE
-            try:
-                timezone = pytz.timezone(timezone_str)
-            except pytz.exceptions.UnknownTimeZoneError:
-                logger.warning(f"Неизвестный часовой пояс '{timezone_str}', используем {DEFAULT_TIMEZONE}")
-                timezone = pytz.timezone(DEFAULT_TIMEZONE)
-            
-            # Парсинг и конвертация времени
-            dt = pd.to_datetime(reminder['datetime'])
-            if dt.tzinfo is None or dt.tzinfo.utcoffset(dt) is None:
-                reminder_time = dt.tz_localize(timezone)
-            else:
-                reminder_time = dt.tz_convert(timezone)
-            
-            reminder_time_utc = reminder_time.astimezone(pytz.UTC)
-            
-            # Проверка времени и отправка
-            if current_time >= reminder_time_utc:
-                success = await send_reminder(reminder_id, reminder['text'], reminder['row'], reminder.get('comment', ''))
-                if success:
-                    gs.mark_as_sent(reminder['row'])
-                    
-        except Exception as e:
-            logger.error(f"Ошибка при обработке напоминания {reminder_id}: {e}")
+            success = await send_reminder(uid, reminder['text'], reminder['row'], reminder.get('comment', ''),
+                                          reminder.get('chat_id'), before_send)
+        except asyncio.CancelledError:
+            # Остановка процесса: после перезапуска напоминание отправится снова
+            if claim['claimed']:
+                # Отметка должна успеть записаться, даже если отмена пришла снова
+                await asyncio.shield(io_executor.run(LOCAL, delivery_log.failed, uid))
+            raise
+        if claim['attempted'] and not claim['claimed']:
+            return True  # уже отправляется другим вызовом
+        if not success:
+            if claim['claimed']:
+                await io_executor.run(LOCAL, delivery_log.failed, uid)
+            return False
+        await io_executor.run(LOCAL, delivery_log.delivered, uid)
+    elif state == SENDING:
+        return True
+    elif state == UNKNOWN:
+        logger.warning(f"Напоминание '{reminder['text']}' (строка {reminder['row']}) не отправляется повторно: "
+                       f"исход прошлой отправки неизвестен")
+    else:
+        logger.info(f"Напоминание '{reminder['text']}' уже отправлено, повторяем только отметку в хранилище")
+
+    if await io_executor.run(STORAGE, store.mark_as_sent, reminder['row']):
+        await io_executor.run(LOCAL, delivery_log.acknowledged, uid)
+        return True
+    return False
+
+async def reconcile_delivery_log() -> None:
+    """Дописывает в хранилище отметки об отправке, не записанные до перезапуска"""
+    await io_executor.run(LOCAL, delivery_log.recover)
+    for entry in await io_executor.run(LOCAL, delivery_log.unacknowledged):
+        reminder = await io_executor.run(STORAGE, store.get_reminder_by_row, entry['row'])
+        # Строка могла смениться (ручное удаление строк листа) — сверяем идентификатор
+        if (not reminder or await io_executor.run(STORAGE, store.reminder_uid, reminder) != entry['uid']
+                or str(reminder.get('sent', '')).strip().upper() == 'TRUE'
+                or await io_executor.run(STORAGE, store.mark_as_sent, entry['row'])):
+            await io_executor.run(LOCAL, delivery_log.acknowledged, entry['uid'])
+    pruned = await io_executor.run(LOCAL, delivery_log.prune, DELIVERY_LOG_RETENTION_DAYS * 24 * 3600)
+    if pruned:
+        logger.info(f"Журнал доставки: удалено старых записей: {pruned}")
+
+async def load_pending_reminders() -> list:
+    """
+    Загрузка неотправленных напоминаний, срабатывающих до следующей сверки (с запасом)
+
+    Более поздние напоминания попадут в очередь на одной из следующих сверок.
+    """
+    horizon = 2 * REMINDER_RESYNC_MINUTES * 60
+    return await io_executor.run(STORAGE, store.get_due, time.time() + horizon)
+
+async def compact_reminders() -> None:
+    """Перенос завершённых напоминаний из активной таблицы в архив"""
+    try:
+        await io_executor.run(STORAGE, store.compact, ARCHIVE_AFTER_DAYS * 24 * 3600, ARCHIVE_BATCH_SIZE)
+    except Exception as e:
+        logger.error(f"Ошибка при архивации напоминаний: {e}")
+
+async def poll_new_reminders(reminder_scheduler: ReminderScheduler, state: dict) -> None:
+    """Ставит в очередь напоминания, созданные другими процессами после последней проверки"""
+    try:
+        reminders = await io_executor.run(STORAGE, store.get_added_after, state['last_row'])
+    except Exception as e:
+        logger.error(f"Ошибка при проверке новых напоминаний: {e}")
+        return
+    for reminder in reminders:
+        state['last_row'] = max(state['last_row'], reminder['row'])
+        reminder_scheduler.add(reminder)
+
+def create_local_stt() -> Optional[LocalWhisperBackend]:
+    """Локальный бэкенд распознавания речи (STT_BACKEND=local или auto)"""
+    if STT_BACKEND not in ('local', 'auto'):
+        return None
+    if not FASTER_WHISPER_AVAILABLE:
+        logger.error(f"STT_BACKEND={STT_BACKEND} требует пакет faster-whisper, распознавание идёт через OpenAI")
+        return None
+    logger.info(f"Локальное распознавание речи: модель {STT_LOCAL_MODEL} ({STT_LOCAL_COMPUTE_TYPE}), "
+                f"процессов: {STT_LOCAL_WORKERS}")
+    backend = LocalWhisperBackend(STT_LOCAL_MODEL, STT_LOCAL_COMPUTE_TYPE, max_workers=STT_LOCAL_WORKERS,
+                                  cpu_threads=STT_LOCAL_THREADS, timeout=STT_LOCAL_TIMEOUT)
+    backend.warm_up()
+    return backend
+
+def _on_shutdown_signal(bot: ReminderBot, sig: signal.Signals) -> None:
+    logger.info(f"Получен сигнал {sig.name}, завершаем работу...")
+    bot.stop()
 
 async def main() -> None:
     """Основная функция"""
@@ -155,38 +321,182 @@ async def main() -> None:
             missing.append('OPENAI_API_KEY')
         logger.error(f"Отсутствуют необходимые переменные окружения: {', '.join(missing)}")
         return
+    
+    global store, delivery_log, io_executor
+    store = create_store()
+    delivery_log = DeliveryLog(DELIVERY_LOG_PATH)
+    # Все вызовы хранилища и OpenAI идут через общий пул, чтобы не блокировать event loop
+    io_executor = IOExecutor(IO_WORKERS, {STORAGE: STORAGE_CONCURRENCY, OPENAI: OPENAI_CONCURRENCY})
         
+    # Очередь напоминаний: загружается, когда процесс становится ведущим, дальше спим до ближайшего
+    reminder_scheduler = ReminderScheduler(load_pending_reminders, deliver_reminder)
+    
+    extraction_cache = ExtractionCache(EXTRACTION_CACHE_PATH or None, EXTRACTION_CACHE_SIZE,
+                                       EXTRACTION_CACHE_TTL_HOURS * 3600)
+    transcript_cache = TranscriptCache(TRANSCRIPT_CACHE_PATH or None, int(TRANSCRIPT_CACHE_MEMORY_MB * 1024 * 1024),
+                                       TRANSCRIPT_CACHE_SIZE, TRANSCRIPT_CACHE_TTL_DAYS * 24 * 3600)
+    audio_pool = AudioPool(AUDIO_WORKERS, AUDIO_QUEUE_SIZE, AUDIO_CONVERT_TIMEOUT)
+    local_stt = create_local_stt()
+    
     # Создание и запуск компонентов
-    bot = ReminderBot(TELEGRAM_TOKEN, OPENAI_API_KEY, gs)
+    bot = ReminderBot(TELEGRAM_TOKEN, OPENAI_API_KEY, store,
+                      reminder_scheduler=reminder_scheduler, io_executor=io_executor,
+                      openai_async=OPENAI_ASYNC, openai_timeout=OPENAI_TIMEOUT,
+                      extraction_cache=extraction_cache, transcript_cache=transcript_cache,
+                      pairing_window=MESSAGE_PAIR_WINDOW,
+                      pairing_min_window=MESSAGE_PAIR_MIN_WINDOW, pairing_max_window=MESSAGE_PAIR_MAX_WINDOW,
+                      pairing_max_messages=MESSAGE_PAIR_MAX_MESSAGES,
+                      telegram_base_url=TELEGRAM_BASE_URL, audio_pool=audio_pool,
+                      voice_split_duration=VOICE_SPLIT_SECONDS, voice_segment_duration=VOICE_SEGMENT_SECONDS,
+                      local_stt=local_stt,
+                      local_stt_max_duration=None if STT_BACKEND == 'local' else STT_LOCAL_MAX_SECONDS,
+                      workers=WORKERS if TELEGRAM_WEBHOOK_URL and REMINDER_STORE == 'sqlite' else 1,
+                      worker_index=WORKER_INDEX, concurrent_updates=TELEGRAM_CONCURRENT_UPDATES,
+                      default_chat_id=TELEGRAM_CHAT_ID)
     
     # Устанавливаем глобальную переменную для использования в планировщике
-    global bot_instance
+    global bot_instance, delivery
     bot_instance = bot
+    delivery = DeliveryEngine(bot.application.bot, global_rate=TELEGRAM_GLOBAL_RATE,
+                              per_chat_rate=TELEGRAM_PER_CHAT_RATE, max_concurrency=TELEGRAM_SEND_CONCURRENCY)
+    await delivery.start()
     
-    # Настройка планировщика
+    # Периодические задачи ведущего процесса; до избрания планировщик на паузе
     scheduler = AsyncIOScheduler()
+    # Перезагрузка очереди из хранилища: в очередь попадают напоминания на два интервала вперёд,
+    # поэтому без неё более поздние не будут отправлены. В режиме sheets она же подхватывает ручные
+    # правки таблицы; в режиме sqlite таблица — только копия, и её правки в очередь не попадают
+
     scheduler.add_job(
-        check_reminders,
-        CronTrigger(minute='*'),
-        id='check_reminders',
+        reminder_scheduler.load,
+        IntervalTrigger(minutes=REMINDER_RESYNC_MINUTES),
+        id='resync_reminders',
         replace_existing=True
     )
-    scheduler.start()
-    logger.info("Планировщик напоминаний запущен")
+    if ARCHIVE_AFTER_DAYS > 0 and isinstance(store, SQLiteReminderStore):
+        # Раз в сутки, первый раз — вскоре после старта
+        scheduler.add_job(
+            compact_reminders,
+            IntervalTrigger(hours=24),
+            id='compact_reminders',
+            next_run_time=datetime.now() + timedelta(minutes=1),
+            replace_existing=True
+        )
+    poll_state = {'last_row': 0}
+    if WORKERS > 1:
+        scheduler.add_job(
+            poll_new_reminders,
+            IntervalTrigger(seconds=NEW_REMINDERS_POLL_SECONDS),
+            args=(reminder_scheduler, poll_state),
+            id='poll_new_reminders',
+            replace_existing=True
+        )
+    scheduler.start(paused=True)
+    scheduler_task = None
+    
+    async def on_elected():
+        nonlocal scheduler_task
+        await reconcile_delivery_log()
+        if WORKERS > 1:
+            poll_state['last_row'] = await io_executor.run(STORAGE, store.last_row)
+        # Цикл запускается до загрузки: add() принимает напоминания только у работающего планировщика,
+        # а созданные во время чтения хранилища load() применяет поверх прочитанного
+        scheduler_task = asyncio.create_task(reminder_scheduler.run())
+        await reminder_scheduler.load()
+        scheduler.resume()
+        if getattr(store, 'replicator', None):
+            store.replicator.resume()
+    
+    async def on_lost():
+        nonlocal scheduler_task
+        scheduler.pause()
+        if getattr(store, 'replicator', None):
+            store.replicator.pause()
+        reminder_scheduler.stop()
+        if scheduler_task:
+            await scheduler_task
+            scheduler_task = None
+        # Доставка уже наступивших напоминаний дорабатывает, пока хранилище и журнал открыты
+        await reminder_scheduler.drain(REMINDER_DRAIN_TIMEOUT)
+    
+    leader_lease = LeaderLease(LEASE_PATH, ttl=LEASE_TTL)
+    lease_task = None
+    
+    async def start_lease():
+        # Ведущим процесс может стать только когда клиент бота готов отправлять напоминания
+        nonlocal lease_task
+        lease_task = asyncio.create_task(leader_lease.run(on_elected, on_lost))
+    
+    async def stop_lease():
+        # Вызывается до закрытия клиента бота: on_lost дожидается уже начатых отправок
+        if lease_task is not None:
+            leader_lease.stop()
+            await lease_task
+    
+    # SIGINT/SIGTERM — штатная остановка: бот дорабатывает принятые сообщения
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, _on_shutdown_signal, bot, sig)
+        except NotImplementedError:
+            pass  # Windows
     
     # Запуск бота
     logger.info("Telegram бот запущен")
     
     try:
-        bot_task = asyncio.create_task(bot.run_async())
-        await bot_task
-    except KeyboardInterrupt:
-        logger.info("Получен сигнал завершения...")
+        await bot.run_async(TELEGRAM_WEBHOOK_URL or None, WEBHOOK_LISTEN, WEBHOOK_PORT + WORKER_INDEX,
+                            WEBHOOK_SECRET, on_start=start_lease, on_stop=stop_lease)
     except Exception as e:
         logger.error(f"Ошибка в main: {e}")
     finally:
+        # Аренда отдана другому процессу ещё в run_async (stop_lease), пока бот мог отправлять
+        await stop_lease()
+        leader_lease.close()
         scheduler.shutdown()
+        # Дописываем отложенные изменения (репликация и буфер записи в Google Sheets)
+        store.close()
+        io_executor.shutdown()
+        logger.info(f"Конвертация аудио: {audio_pool.stats()}")
+        audio_pool.shutdown()
+        if local_stt is not None:
+            local_stt.close()
+        await delivery.close()
+        delivery_log.close()
+        logger.info(f"Кэш извлечения: {extraction_cache.stats()}")
+        extraction_cache.close()
+        logger.info(f"Кэш распознанных голосовых: {transcript_cache.stats()}")
+        transcript_cache.close()
         logger.info("Работа завершена")
 
+def run_worker() -> None:
+    """Точка входа дополнительного процесса-обработчика (номер берётся из WORKER_INDEX)"""
+    asyncio.run(main())
+
+def run() -> None:
+    """Запуск одного или нескольких процессов бота (WORKERS)"""
+    workers = []
+    if WORKERS > 1:
+        if not TELEGRAM_WEBHOOK_URL or REMINDER_STORE != 'sqlite':
+            logger.error("WORKERS > 1 работает только с вебхуком (TELEGRAM_WEBHOOK_URL) и REMINDER_STORE=sqlite, "
+                         "запускаем один процесс")
+        else:
+            context = multiprocessing.get_context('spawn')
+            for index in range(1, WORKERS):
+                # Дочерний процесс заново читает настройки при импорте main
+                os.environ['WORKER_INDEX'] = str(index)
+                process = context.Process(target=run_worker, name=f'worker-{index}')
+                process.start()
+                workers.append(process)
+            os.environ['WORKER_INDEX'] = '0'
+            logger.info(f"Запущено процессов: {WORKERS}, порты {WEBHOOK_PORT}-{WEBHOOK_PORT + WORKERS - 1}")
+    try:
+        asyncio.run(main())
+    finally:
+        for process in workers:
+            process.join(timeout=60)
+            if process.is_alive():
+                process.terminate()
+
 if __name__ == '__main__':
-    asyncio.run(main()) 
\ No newline at end of file
+    run() 
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+Объединение серии сообщений пользователя (пояснение + пересланные) в одну единицу обработки
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MessageCoalescer:
+    def __init__(self, on_flush: Callable[[int, List[Dict]], Awaitable[None]],
+                 window: float = 2.0, min_window: float = 0.7, max_window: float = 5.0,
+                 max_items: int = 20, is_complete: Optional[Callable[[List[Dict]], bool]] = None):
+        """
+        Инициализация
+
+        Args:
+            on_flush: Корутина обработки серии: (user_id, список сообщений)
+            window: Начальное окно ожидания следующего сообщения (в секундах)
+            min_window: Нижняя граница адаптивного окна
+            max_window: Верхняя граница адаптивного окна
+            max_items: Серия из стольких сообщений обрабатывается сразу, не дожидаясь окна
+            is_complete: Функция, по которой серию можно обработать сразу, не дожидаясь окна
+        """
+        self.on_flush = on_flush
+        self.window = window
+        self.min_window = min_window
+        self.max_window = max_window
+        self.max_items = max_items
+        self.is_complete = is_complete or (lambda items: False)
+
+        self._bursts = {}  # {user_id: {'items': [...], 'timer': TimerHandle}}
+        self._windows = {}  # {user_id: адаптивное окно}
+        self._tasks = set()
+        self._last = {}  # {user_id: последняя задача обработки серии пользователя}
+
+    def window_for(self, user_id: int) -> float:
+        """Текущее окно ожидания для пользователя"""
+        return self._windows.get(user_id, self.window)
+
+    def add(self, user_id: int, item: Dict) -> None:
+        """
+        Добавляет сообщение в серию пользователя
+
+        Args:
+            user_id: ID пользователя
+            item: Словарь с ключами message, is_forwarded, update, context
+        """
+        item = dict(item, timestamp=time.monotonic())
+        burst = self._bursts.get(user_id)
+
+        if burst and not item['is_forwarded'] and any(not i['is_forwarded'] for i in burst['items']):
+            # Новое пояснение начинает новую серию — предыдущую обрабатываем сразу
+            self._flush(user_id)
+            burst = None
+
+        if burst is None:
+            burst = {'items': [], 'timer': None}
+            self._bursts[user_id] = burst
+        elif burst['timer'] is not None:
+            burst['timer'].cancel()
+            self._learn(user_id, item['timestamp'] - burst['items'][-1]['timestamp'])
+
+        burst['items'].append(item)
+        if len(burst['items']) >= self.max_items or self.is_complete(burst['items']):
+            self._flush(user_id)
+            return
+
+        loop = asyncio.get_running_loop()
+        burst['timer'] = loop.call_later(self.window_for(user_id), self._flush, user_id)
+
+    async def drain(self) -> None:
+        """Обрабатывает все ожидающие серии и дожидается завершения обработки"""
+        for user_id in list(self._bursts):
+            self._flush(user_id)
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def _learn(self, user_id: int, gap: float) -> None:
+        # Окно подстраивается под реальные паузы между сообщениями в серии (с запасом x3)
+        current = self.window_for(user_id)
+        target = min(max(gap * 3, self.min_window), self.max_window)
+        self._windows[user_id] = 0.7 * current + 0.3 * target
+
+    def _flush(self, user_id: int) -> None:
+        burst = self._bursts.pop(user_id, None)
+        if not burst:
+            return
+        if burst['timer'] is not None:
+            burst['timer'].cancel()
+        items = burst['items']
+        if len(items) == 1:
+            # Никто не пришёл в пару — в следующий раз ждём чуть меньше
+            current = self.window_for(user_id)
+            self._windows[user_id] = max(self.min_window, 0.9 * current)
+
+        # Серии одного пользователя обрабатываются по очереди: следующая ждёт предыдущую
+        task = asyncio.create_task(self._run(user_id, items, self._last.get(user_id)))
+        self._last[user_id] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda t: self._last.get(user_id) is t and self._last.pop(user_id))
+
+    async def _run(self, user_id: int, items: List[Dict], previous: Optional[asyncio.Task]) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await self.on_flush(user_id, items)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке серии сообщений пользователя {user_id}: {e}")
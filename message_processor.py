@@ -1,17 +1,40 @@
 import os
+import json
 import logging
 import openai
 from datetime import datetime, timedelta
 import pytz
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+from time_utils import get_timezone
+from time_parser import parse_reminder
+from extraction_cache import ExtractionCache
+from io_executor import IOExecutor, LOCAL
 
 logger = logging.getLogger(__name__)
 
 class MessageProcessor:
-    def __init__(self, api_key: str):
-        """Инициализация процессора сообщений с OpenAI API"""
+    def __init__(self, api_key: str, async_client: Optional[openai.AsyncOpenAI] = None,
+                 request_timeout: float = 30.0, fast_path: bool = True,
+                 cache: Optional[ExtractionCache] = None, io_executor: Optional[IOExecutor] = None):
+        """
+        Инициализация процессора сообщений с OpenAI API
+        
+        Args:
+            api_key: API ключ OpenAI
+            async_client: Общий AsyncOpenAI клиент; если задан, доступен extract_reminder_info_async
+            request_timeout: Таймаут одного запроса к ChatGPT (в секундах)
+            fast_path: Сначала пробовать локальный разбор простых фраз (time_parser), и только
+                если он не уверен — обращаться к ChatGPT
+            cache: Кэш результатов ChatGPT по тексту сообщения
+            io_executor: Пул, в котором асинхронный вариант обращается к кэшу (SQLite)
+        """
         openai.api_key = api_key
         self.client = openai.OpenAI(api_key=api_key)
+        self.async_client = async_client
+        self.request_timeout = request_timeout
+        self.fast_path = fast_path
+        self.cache = cache
+        self.io_executor = io_executor or IOExecutor()
         
     def extract_reminder_info(self, message: str) -> Optional[Dict]:
         """
@@ -23,103 +46,180 @@ class MessageProcessor:
         Returns:
             Словарь с информацией о напоминании или None, если не удалось распознать
         """
+        local = self._parse_locally(message)
+        if local:
+            return local
         try:
-            # Получаем текущую дату и время в московском часовом поясе
-            moscow_tz = pytz.timezone('Europe/Moscow')
-            current_time = datetime.now(moscow_tz)
-            current_time_str = current_time.strftime('%Y-%m-%d %H:%M:%S')
-            
-            system_prompt = f"""
-            Ты помощник для извлечения информации о напоминаниях из текстовых сообщений.
-            
-            ТЕКУЩАЯ ДАТА И ВРЕМЯ: {current_time_str} (Europe/Moscow)
-            
-            Проанализируй сообщение и извлеки следующую информацию:
-            1. Текст напоминания (что нужно напомнить). Важно, чтобы ты писал напоминание с большой буквы, а также описывал именно суть действия, не просто слова "напомнить что-тот там в конкретное время". К примеру, "Напомни мне зарегистрироваться на марафон завтра": суть напоминания это "Зарегистрироваться на марафон"
-            2. Дата и время (в формате YYYY-MM-DD HH:MM:SS) - РАССЧИТЫВАЙ ОТНОСИТЕЛЬНО ТЕКУЩЕЙ ДАТЫ и времени.
-            3. Часовой пояс (если указан, иначе используй Europe/Moscow)
-            4. Если в сообщении НЕТ четкой информации о времени (например, "напомни про что-то" без указания когда), то установи datetime: null (без времени).
-            
-            АЛГОРИТМ ДЛЯ СЛОЖНЫХ КОНСТРУКЦИЙ:
-            1. Найди основное событие и его время
-            2. Найди интервал "за X времени до события"
-            3. Вычти интервал из времени события
-            4. Результат - это время напоминания
-            
-            Пример: "за 30 часов до вылета, вылет послезавтра в 18:00"
-            - Событие: вылет послезавтра в 18:00
-            - Интервал: 30 часов до события
-            - Расчет: послезавтра 18:00 - 30 часов = завтра 12:00
-            - Время напоминания: завтра в 12:00
-            
-            ВАЖНО: Всегда рассчитывай время относительно текущей даты {current_time_str}.
-            ПРАВИЛО ДЛЯ «БЛИЖАЙШИХ» И ДНЕЙ НЕДЕЛИ/МЕСЯЦЕВ:
-            - Слова «ближайший/ближайшее/ближайшая», «следующий/следующее/следующая»,
-              а также упоминания конкретных дней недели и месяцев БЕЗ уточнения
-              трактуй как БУДУЩЕЕ время относительно текущего момента.
-            - Например, «в воскресенье» → ближайшее будущее воскресенье; «в январе» → ближайший будущий январь.
-            - Никогда не возвращай прошедшую дату: если расчёт дал прошлое, сдвинь на ближайшую будущую дату.
-            
-            Примеры расчетов:
-            - "через 1 час" = текущее время + 1 час
-            - "завтра в 15:00" = завтра в 15:00
-            - "в пятницу в 14:30" = ближайшая пятница в 14:30
-            - "через 30 минут" = текущее время + 30 минут
-            - "напомни про встречу" = datetime: null (без времени)
-            
-            СЛОЖНЫЕ ВРЕМЕННЫЕ КОНСТРУКЦИИ:
-            - "за 2 часа до встречи, которая завтра в 15:00" = завтра в 13:00
-            - "за 30 часов до вылета, вылет послезавтра в 18:00" = завтра в 12:00
-            - "за день до события, которое в пятницу" = четверг в то же время
-            - "за 3 часа до начала, начало завтра в 20:00" = завтра в 17:00
-            
-            ВАЖНО: При расчете "за X времени до события" всегда вычитай указанное время из времени события!
-            
-            ВОЗВРАЩАЙ JSON С КЛЮЧАМИ НА АНГЛИЙСКОМ:
-            {{"text": "текст напоминания", "datetime": "YYYY-MM-DD HH:MM:SS", "timezone": "Europe/Moscow"}}
-            
-            ВАЖНО: Если в сообщении НЕТ информации о времени, установи datetime: null
-            
-            Возвращай только JSON объект или null, если не удалось распознать напоминание.
-            """
-            
             response = self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": message}
-                ],
+                messages=self._build_messages(message),
                 temperature=0.1,
-                max_tokens=200
+                max_tokens=200,
+                timeout=self.request_timeout
             )
+            return self._remember(message, self._parse_response(response.choices[0].message.content.strip()))
+                
+        except Exception as e:
+            logger.error(f"Ошибка при обработке сообщения с ChatGPT: {e}")
+            return None
+    
+    async def extract_reminder_info_async(self, message: str) -> Optional[Dict]:
+        """
+        Асинхронный вариант extract_reminder_info через общий AsyncOpenAI клиент
+        
+        Не блокирует event loop; при отмене задачи запрос к API тоже отменяется.
+        
+        Args:
+            message: Текстовое сообщение пользователя
             
-            result = response.choices[0].message.content.strip()
-            
-            # Пытаемся распарсить JSON ответ
-            import json
+        Returns:
+            Словарь с информацией о напоминании или None, если не удалось распознать
+        """
+        if self.async_client is None:
+            raise RuntimeError("AsyncOpenAI клиент не настроен")
+        local = self._parse_fast(message)
+        if not local and self.cache is not None:
+            local = await self.io_executor.run(LOCAL, self._lookup_cache, message)
+        if local:
+            return local
+        try:
+            response = await self.async_client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=self._build_messages(message),
+                temperature=0.1,
+                max_tokens=200,
+                timeout=self.request_timeout
+            )
+            reminder_info = self._parse_response(response.choices[0].message.content.strip())
+                
+        except Exception as e:
+            logger.error(f"Ошибка при обработке сообщения с ChatGPT: {e}")
+            return None
+        if reminder_info and self.cache is not None:
+            await self.io_executor.run(LOCAL, self._remember, message, reminder_info)
+        return reminder_info
+    
+    def _parse_locally(self, message: str) -> Optional[Dict]:
+        """Локальный разбор простых фраз и поиск в кэше — без обращения к API"""
+        return self._parse_fast(message) or self._lookup_cache(message)
+    
+    def _parse_fast(self, message: str) -> Optional[Dict]:
+        """Локальный разбор простых фраз (time_parser)"""
+        if not self.fast_path:
+            return None
+        try:
+            return parse_reminder(message)
+        except Exception as e:
+            logger.error(f"Ошибка локального разбора сообщения: {e}")
+        return None
+    
+    def _lookup_cache(self, message: str) -> Optional[Dict]:
+        """Поиск в кэше (блокирующий: SQLite)"""
+        if self.cache is None:
+            return None
+        try:
+            return self.cache.get(message)
+        except Exception as e:
+            logger.error(f"Ошибка чтения кэша извлечения: {e}")
+        return None
+    
+    def _remember(self, message: str, reminder_info: Optional[Dict]) -> Optional[Dict]:
+        """Сохраняет ответ ChatGPT в кэш"""
+        if reminder_info and self.cache is not None:
             try:
-                reminder_info = json.loads(result)
-                if reminder_info is None:
-                    return None
-                    
-                # Проверяем обязательные поля
-                if 'text' not in reminder_info or 'datetime' not in reminder_info:
-                    logger.warning(f"Неполная информация о напоминании: {reminder_info}")
-                    return None
-                    
-                # Добавляем часовой пояс по умолчанию, если не указан
-                if 'timezone' not in reminder_info:
-                    reminder_info['timezone'] = 'Europe/Moscow'
-                    
-                logger.info(f"Успешно извлечена информация о напоминании: {reminder_info}")
-                return reminder_info
+                self.cache.put(message, reminder_info)
+            except Exception as e:
+                logger.error(f"Ошибка записи в кэш извлечения: {e}")
+        return reminder_info
+    
+    def _build_messages(self, message: str) -> List[Dict]:
+        """Формирует системный промпт с текущей датой и сообщение пользователя"""
+        # Получаем текущую дату и время в московском часовом поясе
+        moscow_tz = get_timezone('Europe/Moscow')
+        current_time = datetime.now(moscow_tz)
+        current_time_str = current_time.strftime('%Y-%m-%d %H:%M:%S')
+        
+        system_prompt = f"""
+        Ты помощник для извлечения информации о напоминаниях из текстовых сообщений.
+        
+        ТЕКУЩАЯ ДАТА И ВРЕМЯ: {current_time_str} (Europe/Moscow)
+        
+        Проанализируй сообщение и извлеки следующую информацию:
+        1. Текст напоминания (что нужно напомнить). Важно, чтобы ты писал напоминание с большой буквы, а также описывал именно суть действия, не просто слова "напомнить что-тот там в конкретное время". К примеру, "Напомни мне зарегистрироваться на марафон завтра": суть напоминания это "Зарегистрироваться на марафон"
+        2. Дата и время (в формате YYYY-MM-DD HH:MM:SS) - РАССЧИТЫВАЙ ОТНОСИТЕЛЬНО ТЕКУЩЕЙ ДАТЫ и времени.
+        3. Часовой пояс (если указан, иначе используй Europe/Moscow)
+        4. Если в сообщении НЕТ четкой информации о времени (например, "напомни про что-то" без указания когда), то установи datetime: null (без времени).
+        
+        АЛГОРИТМ ДЛЯ СЛОЖНЫХ КОНСТРУКЦИЙ:
+        1. Найди основное событие и его время
+        2. Найди интервал "за X времени до события"
+        3. Вычти интервал из времени события
+        4. Результат - это время напоминания
+        
+        Пример: "за 30 часов до вылета, вылет послезавтра в 18:00"
+        - Событие: вылет послезавтра в 18:00
+        - Интервал: 30 часов до события
+        - Расчет: послезавтра 18:00 - 30 часов = завтра 12:00
+        - Время напоминания: завтра в 12:00
+        
+        ВАЖНО: Всегда рассчитывай время относительно текущей даты {current_time_str}.
+        ПРАВИЛО ДЛЯ «БЛИЖАЙШИХ» И ДНЕЙ НЕДЕЛИ/МЕСЯЦЕВ:
+        - Слова «ближайший/ближайшее/ближайшая», «следующий/следующее/следующая»,
+          а также упоминания конкретных дней недели и месяцев БЕЗ уточнения
+          трактуй как БУДУЩЕЕ время относительно текущего момента.
+        - Например, «в воскресенье» → ближайшее будущее воскресенье; «в январе» → ближайший будущий январь.
+        - Никогда не возвращай прошедшую дату: если расчёт дал прошлое, сдвинь на ближайшую будущую дату.
+        
+        Примеры расчетов:
+        - "через 1 час" = текущее время + 1 час
+        - "завтра в 15:00" = завтра в 15:00
+        - "в пятницу в 14:30" = ближайшая пятница в 14:30
+        - "через 30 минут" = текущее время + 30 минут
+        - "напомни про встречу" = datetime: null (без времени)
+        
+        СЛОЖНЫЕ ВРЕМЕННЫЕ КОНСТРУКЦИИ:
+        - "за 2 часа до встречи, которая завтра в 15:00" = завтра в 13:00
+        - "за 30 часов до вылета, вылет послезавтра в 18:00" = завтра в 12:00
+        - "за день до события, которое в пятницу" = четверг в то же время
+        - "за 3 часа до начала, начало завтра в 20:00" = завтра в 17:00
+        
+        ВАЖНО: При расчете "за X времени до события" всегда вычитай указанное время из времени события!
+        
+        ВОЗВРАЩАЙ JSON С КЛЮЧАМИ НА АНГЛИЙСКОМ:
+        {{"text": "текст напоминания", "datetime": "YYYY-MM-DD HH:MM:SS", "timezone": "Europe/Moscow"}}
+        
+        ВАЖНО: Если в сообщении НЕТ информации о времени, установи datetime: null
+        
+        Возвращай только JSON объект или null, если не удалось распознать напоминание.
+        """
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": message}
+        ]
+    
+    def _parse_response(self, result: str) -> Optional[Dict]:
+        """Разбирает JSON-ответ ChatGPT и проверяет обязательные поля"""
+        # Пытаемся распарсить JSON ответ
+        try:
+            reminder_info = json.loads(result)
+            if reminder_info is None:
+                return None
                 
-            except json.JSONDecodeError:
-                logger.error(f"Ошибка парсинга JSON ответа: {result}")
+            # Проверяем обязательные поля
+            if 'text' not in reminder_info or 'datetime' not in reminder_info:
+                logger.warning(f"Неполная информация о напоминании: {reminder_info}")
                 return None
                 
-        except Exception as e:
-            logger.error(f"Ошибка при обработке сообщения с ChatGPT: {e}")
+            # Добавляем часовой пояс по умолчанию, если не указан
+            if 'timezone' not in reminder_info:
+                reminder_info['timezone'] = 'Europe/Moscow'
+                
+            logger.info(f"Успешно извлечена информация о напоминании: {reminder_info}")
+            return reminder_info
+            
+        except json.JSONDecodeError:
+            logger.error(f"Ошибка парсинга JSON ответа: {result}")
             return None
     
     def validate_reminder_info(self, reminder_info: Dict) -> Tuple[bool, str]:
@@ -160,7 +260,7 @@ class MessageProcessor:
             # Проверяем часовой пояс
             if 'timezone' in reminder_info:
                 try:
-                    pytz.timezone(reminder_info['timezone'])
+                    get_timezone(reminder_info['timezone'])
                 except pytz.exceptions.UnknownTimeZoneError:
                     return False, f"Неизвестный часовой пояс: {reminder_info['timezone']}"
                     
@@ -0,0 +1,37 @@
+"""
+Общий асинхронный клиент OpenAI для обработки текста и голоса
+"""
+
+import logging
+import os
+from typing import Optional
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+
+def create_async_client(api_key: str, base_url: Optional[str] = None,
+                        timeout: float = 30.0, max_retries: int = 2) -> openai.AsyncOpenAI:
+    """
+    Создает AsyncOpenAI клиент с одним пулом соединений на всё приложение
+
+    Args:
+        api_key: API ключ OpenAI
+        base_url: Адрес API (например, локальный stub-сервер для тестов);
+            по умолчанию берется из OPENAI_BASE_URL или официальный
+        timeout: Таймаут одного запроса (в секундах)
+        max_retries: Число автоматических повторов при сетевых ошибках
+
+    Returns:
+        Экземпляр AsyncOpenAI, который можно передавать в MessageProcessor и VoiceProcessor
+    """
+    base_url = base_url or os.getenv('OPENAI_BASE_URL') or None
+    if base_url:
+        logger.info(f"OpenAI API: используется адрес {base_url}")
+    return openai.AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=timeout,
+        max_retries=max_retries,
+    )
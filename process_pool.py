@@ -0,0 +1,118 @@
+"""
+Пул процессов (spawn) для тяжёлых заданий: конвертация аудио, локальное распознавание речи
+
+Общий для AudioPool и LocalWhisperBackend: процессы создаются при первом задании, число
+заданий в очереди и в работе считается до фактического завершения процесса, а сломанный
+(упавший процесс) или зависший пул останавливается и при следующем задании создаётся заново.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SpawnPool:
+    def __init__(self, max_workers: int, initializer: Optional[Callable] = None, initargs: Tuple = (),
+                 kill_on_timeout: bool = False):
+        """
+        Args:
+            max_workers: Число процессов
+            initializer: Функция, выполняемая при запуске каждого процесса (например, загрузка модели)
+            initargs: Аргументы initializer
+            kill_on_timeout: По таймауту завершать процессы пула: задание в процессе не отменить,
+                и без этого процесс остаётся занят до конца задания
+        """
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self.kill_on_timeout = kill_on_timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Задания в очереди и в работе (включая те, чей результат уже не ждут после таймаута)
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: форк процесса с event loop и потоками небезопасен
+                self._executor = ProcessPoolExecutor(
+                    self.max_workers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=self.initializer, initargs=self.initargs
+                )
+            return self._executor
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, func: Callable, *args) -> Future:
+        """Отправляет задание в пул (пул, сломанный ранее, создаётся заново)"""
+        return self._submit(func, *args)[0]
+
+    def _submit(self, func: Callable, *args) -> Tuple[Future, ProcessPoolExecutor]:
+        with self._lock:
+            self._pending += 1
+        for attempt in (1, 2):
+            executor = self._get_executor()
+            try:
+                future = executor.submit(func, *args)
+                break
+            except BrokenProcessPool:
+                self._discard(executor)
+                if attempt == 2:
+                    self._release(None)
+                    raise
+            except Exception:
+                self._release(None)
+                raise
+        # Слот освобождается, только когда процесс действительно закончил работу
+        future.add_done_callback(self._release)
+        return future, executor
+
+    async def run(self, timeout: Optional[float], func: Callable, *args):
+        """
+        Выполняет задание в пуле и ждёт результата не дольше timeout
+
+        Raises:
+            asyncio.TimeoutError: Задание не уложилось в timeout (при kill_on_timeout процессы
+                пула завершены, и пул будет создан заново)
+            BrokenProcessPool: Процесс пула аварийно завершился; пул будет создан заново
+        """
+        future, executor = self._submit(func, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            if not future.cancel() and self.kill_on_timeout:
+                self._discard(executor, kill=True)
+            raise
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+
+    def _discard(self, executor: ProcessPoolExecutor, kill: bool = False) -> None:
+        """Останавливает пул (если его ещё не заменили); kill — завершить процессы, не дожидаясь заданий"""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        if kill:
+            for process in list((executor._processes or {}).values()):
+                process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Останавливает процессы пула"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
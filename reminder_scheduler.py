@@ -0,0 +1,218 @@
+"""
+Планировщик напоминаний на основе очереди с приоритетом по времени UTC
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from time_utils import parse_due_utc
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderScheduler:
+    def __init__(self, load_reminders: Callable[[], Awaitable[List[Dict]]],
+                 deliver: Callable[[Dict], Awaitable[bool]],
+                 retry_delay: float = 60, max_sleep: float = 60):
+        """
+        Инициализация планировщика
+
+        Args:
+            load_reminders: Корутина, возвращающая список неотправленных напоминаний
+            deliver: Корутина доставки напоминания, возвращает True при успехе
+            retry_delay: Через сколько секунд повторить неудачную доставку
+            max_sleep: Максимальное время сна между проверками очереди (в секундах)
+        """
+        self.load_reminders = load_reminders
+        self.deliver = deliver
+        self.retry_delay = retry_delay
+        self.max_sleep = max_sleep
+
+        self._heap = []  # [(due_utc, seq, row)]
+        self._reminders = {}  # {row: reminder}
+        self._in_flight = set()  # Строки, которые сейчас доставляются
+        self._tasks = set()  # Пакеты, которые сейчас доставляются
+        self._loads = []  # Изменения очереди во время каждой идущей загрузки: [{row: reminder или None}]
+        self._counter = itertools.count()
+        self._wakeup = None
+        self._running = False
+
+    def __len__(self):
+        return len(self._reminders)
+
+    async def load(self) -> int:
+        """
+        Полностью перестраивает очередь по данным из хранилища
+
+        Напоминания, добавленные или убранные, пока хранилище читалось, применяются
+        поверх прочитанного: ответ хранилища мог их ещё не содержать.
+
+        Returns:
+            Количество напоминаний в очереди
+        """
+        changes = {}
+        self._loads.append(changes)
+        try:
+            reminders = await self.load_reminders()
+        finally:
+            self._loads.remove(changes)
+        self._heap = []
+        self._reminders = {}
+        for reminder in reminders:
+            if reminder['row'] in self._in_flight:
+                continue
+            self._push(reminder)
+        for row, reminder in changes.items():
+            if reminder is None:
+                self._reminders.pop(row, None)
+            elif row not in self._in_flight:
+                self._push(reminder)
+        heapq.heapify(self._heap)
+        self._wake()
+        logger.info(f"Очередь напоминаний загружена: {len(self._reminders)} шт.")
+        return len(self._reminders)
+
+    def add(self, reminder: Dict) -> bool:
+        """
+        Добавляет (или заменяет) напоминание в очереди
+
+        Args:
+            reminder: Словарь с ключами row, datetime, text, timezone, comment
+
+        Returns:
+            True если напоминание поставлено в очередь
+        """
+        if not self._running:
+            # Планировщик работает в другом (ведущем) процессе — он подхватит напоминание сам
+            return False
+        for changes in self._loads:
+            changes[reminder['row']] = reminder
+        if self._push(reminder):
+            self._wake()
+            return True
+        return False
+
+    def remove(self, row: int) -> None:
+        """Убирает напоминание из очереди (ленивое удаление из кучи)"""
+        for changes in self._loads:
+            changes[row] = None
+        self._reminders.pop(row, None)
+
+    def next_due(self) -> Optional[float]:
+        """Возвращает ближайшее время срабатывания (UTC epoch) или None"""
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    async def run(self) -> None:
+        """Основной цикл: спит до ближайшего напоминания и отправляет его"""
+        self._wakeup = asyncio.Event()
+        self._running = True
+        logger.info("Планировщик напоминаний запущен")
+        while self._running:
+            self._wakeup.clear()
+            batch = self._pop_due(time.time())
+            if batch:
+                task = asyncio.create_task(self._deliver_batch(batch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            due = self.next_due()
+            timeout = self.max_sleep if due is None else min(max(due - time.time(), 0), self.max_sleep)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self) -> None:
+        """Останавливает основной цикл"""
+        self._running = False
+        self._wake()
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """
+        Дожидается пакетов, которые уже доставляются (вызывается после stop(), до закрытия
+        хранилища и журнала доставки)
+
+        Args:
+            timeout: Сколько ждать (в секундах); незавершённые пакеты затем отменяются
+        """
+        if not self._tasks:
+            return
+        tasks = set(self._tasks)
+        logger.info(f"Ожидаем доставку пакетов напоминаний: {len(tasks)} шт.")
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            logger.warning(f"Доставка не завершилась за {timeout:.0f} с, отменяем пакетов: {len(pending)}")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def _push(self, reminder: Dict) -> bool:
+        row = reminder['row']
+        try:
+            due_utc = reminder.get('due_utc')
+            if due_utc is None:
+                due_utc = parse_due_utc(reminder.get('datetime'), reminder.get('timezone'))
+        except Exception as e:
+            logger.error(f"Ошибка при разборе времени напоминания в строке {row}: {e}")
+            return False
+        if due_utc is None:
+            # Напоминания без времени не планируются
+            return False
+        self._reminders[row] = dict(reminder, due_utc=due_utc)
+        heapq.heappush(self._heap, (due_utc, next(self._counter), row))
+        return True
+
+    def _drop_stale(self) -> None:
+        # Пропускаем удалённые и заменённые записи на вершине кучи
+        while self._heap:
+            due_utc, _, row = self._heap[0]
+            reminder = self._reminders.get(row)
+            if reminder is not None and reminder['due_utc'] == due_utc:
+                return
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now: float) -> List:
+        due = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            _, _, row = heapq.heappop(self._heap)
+            due.append((row, self._reminders.pop(row)))
+
+    async def _deliver_batch(self, batch: List) -> None:
+        # Напоминания, наступившие одновременно, отправляются параллельно;
+        # ограничения частоты Telegram соблюдает deliver
+        started = time.time()
+        earliest = min(reminder['due_utc'] for _, reminder in batch)
+        results = await asyncio.gather(*(self._deliver(row, reminder) for row, reminder in batch))
+        finished = time.time()
+        logger.info(f"Пакет напоминаний: доставлено {sum(results)}/{len(batch)} за {finished - started:.2f} с, "
+                    f"максимальное опоздание {finished - earliest:.2f} с")
+
+    async def _deliver(self, row: int, reminder: Dict) -> bool:
+        self._in_flight.add(row)
+        try:
+            success = await self.deliver(reminder)
+        except Exception as e:
+            logger.error(f"Ошибка при доставке напоминания в строке {row}: {e}")
+            success = False
+        finally:
+            self._in_flight.discard(row)
+
+        if not success and row not in self._reminders:
+            # Повторяем попытку позже, как раньше делала ежеминутная проверка
+            retry = dict(reminder, due_utc=time.time() + self.retry_delay)
+            self._reminders[row] = retry
+            heapq.heappush(self._heap, (retry['due_utc'], next(self._counter), row))
+            self._wake()
+        return bool(success)
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
@@ -0,0 +1,756 @@
+"""
+Хранилище напоминаний: общий интерфейс, локальная SQLite-база и репликация в Google Sheets
+"""
+
+import bisect
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from time_utils import parse_due_utc
+
+logger = logging.getLogger(__name__)
+
+
+def parse_id(value) -> Optional[int]:
+    """Переводит ID чата/пользователя из ячейки таблицы в int (пустая ячейка — None)"""
+    try:
+        return int(str(value).strip()) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+class ReminderStore:
+    """
+    Интерфейс хранилища напоминаний
+
+    Номер 'row' — идентификатор напоминания внутри хранилища: для Google Sheets это
+    номер строки листа, для SQLite — первичный ключ.
+    """
+
+    def get_reminders(self) -> List[Dict]:
+        """Возвращает неотправленные напоминания"""
+        raise NotImplementedError
+
+    def add_reminder(self, datetime_str: str = None, text: str = None, timezone: str = 'Europe/Moscow',
+                     comment: str = '', chat_id: int = None, user_id: int = None) -> Optional[int]:
+        """
+        Добавляет напоминание и возвращает его номер или None в случае ошибки
+
+        chat_id/user_id — чат и автор, которым напоминание будет доставлено.
+        """
+        raise NotImplementedError
+
+    def mark_as_sent(self, row) -> bool:
+        """Отмечает напоминание как отправленное"""
+        raise NotImplementedError
+
+    def update_reminder_status(self, row, status) -> bool:
+        """Обновляет статус напоминания ('done' или 'canceled')"""
+        raise NotImplementedError
+
+    def update_reminder_comment(self, row, comment) -> bool:
+        """Обновляет комментарий напоминания"""
+        raise NotImplementedError
+
+    def get_reminder_by_row(self, row) -> Optional[Dict]:
+        """Возвращает напоминание по номеру или None"""
+        raise NotImplementedError
+
+    def get_due(self, until_utc: float) -> List[Dict]:
+        """
+        Возвращает неотправленные напоминания со временем срабатывания до until_utc
+
+        Базовая реализация фильтрует get_reminders(); SQLite отвечает по индексу.
+        """
+        due = []
+        for reminder in self.get_reminders():
+            if 'due_utc' in reminder:
+                if reminder['due_utc'] is not None and reminder['due_utc'] <= until_utc:
+                    due.append(reminder)
+                continue
+            try:
+                due_utc = parse_due_utc(reminder.get('datetime'), reminder.get('timezone'))
+            except Exception as e:
+                logger.error(f"Ошибка при разборе времени напоминания {reminder.get('row')}: {e}")
+                continue
+            if due_utc is not None and due_utc <= until_utc:
+                due.append(dict(reminder, due_utc=due_utc))
+        return due
+
+    def reminder_uid(self, reminder: Dict) -> str:
+        """
+        Постоянный идентификатор напоминания для журнала доставки
+
+        Базовая реализация — хэш номера строки и содержимого: одинаковые напоминания в разных
+        строках не должны делить одну запись журнала, а изменённое вручную время или текст —
+        это уже другое напоминание. Если строка сместилась (ручное удаление строк листа),
+        идентификатор меняется, и сверка журнала считает запись устаревшей.
+        """
+        if reminder.get('uid'):
+            return reminder['uid']
+        key = '|'.join(str(reminder.get(field) or '')
+                       for field in ('row', 'datetime', 'text', 'timezone', 'comment', 'chat_id'))
+        return 'h' + hashlib.sha1(key.encode('utf-8')).hexdigest()[:31]
+
+    def close(self) -> None:
+        """Освобождает ресурсы и дописывает отложенные изменения"""
+
+
+class SQLiteReminderStore(ReminderStore):
+    """
+    Локальное хранилище в SQLite (WAL)
+
+    Каждое изменение в той же транзакции попадает в очередь sheet_outbox, которую
+    SheetsReplicator в фоне переносит в Google Sheets.
+    """
+
+    # Колонки, добавленные после первой версии схемы: (имя, тип)
+    ADDED_COLUMNS = (('due_utc', 'REAL'), ('chat_id', 'INTEGER'), ('user_id', 'INTEGER'), ('uid', 'TEXT'))
+
+    # Постоянный идентификатор напоминания (для журнала доставки), генерируется в SQL
+    NEW_UID = 'lower(hex(randomblob(16)))'
+
+    # Завершённое напоминание: отправлено или закрыто кнопкой
+    FINISHED = "(sent = 1 OR status IN ('done', 'canceled'))"
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Путь к файлу базы данных
+        """
+        self.path = path
+        self.replicator = None
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._create_schema()
+
+    def _create_schema(self):
+        with self._lock, self._db:
+            self._db.executescript('''
+                CREATE TABLE IF NOT EXISTS reminders (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    datetime TEXT NOT NULL DEFAULT '',
+                    text TEXT NOT NULL DEFAULT '',
+                    timezone TEXT NOT NULL DEFAULT '',
+                    sent INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT '',
+                    comment TEXT NOT NULL DEFAULT '',
+                    sheet_row INTEGER,
+                    created_at REAL NOT NULL
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_reminders_sheet_row ON reminders (sheet_row);
+
+                CREATE TABLE IF NOT EXISTS sheet_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    reminder_id INTEGER NOT NULL,
+                    op TEXT NOT NULL,
+                    payload TEXT NOT NULL DEFAULT '{}'
+                );
+
+                -- Архивация, начатая в листе, но ещё не записанная в базу (восстанавливается после падения)
+                CREATE TABLE IF NOT EXISTS sheet_archive_intent (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    reminder_ids TEXT NOT NULL,
+                    sheet_rows TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+            ''')
+            # Колонки, добавленные после первой версии схемы
+            columns = self._columns('reminders')
+            for name, ddl in self.ADDED_COLUMNS:
+                if name not in columns:
+                    self._db.execute(f'ALTER TABLE reminders ADD COLUMN {name} {ddl}')
+            if 'due_utc' not in columns:
+                self._backfill_due_utc()
+            if 'uid' not in columns:
+                self._db.execute(f'UPDATE reminders SET uid = {self.NEW_UID} WHERE uid IS NULL')
+
+            # Архив завершённых напоминаний: те же колонки и те же id, чтобы кнопки
+            # старых сообщений продолжали находить свои напоминания
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS reminders_archive AS '
+                'SELECT *, 0.0 AS archived_at FROM reminders WHERE 0'
+            )
+            archive_columns = self._columns('reminders_archive')
+            for name, ddl in self.ADDED_COLUMNS:
+                if name not in archive_columns:
+                    self._db.execute(f'ALTER TABLE reminders_archive ADD COLUMN {name} {ddl}')
+            self._db.executescript('''
+                DROP INDEX IF EXISTS idx_reminders_sent;
+                -- "что сработает в ближайшую минуту": диапазон по due_utc среди неотправленных
+                CREATE INDEX IF NOT EXISTS idx_reminders_sent_due ON reminders (sent, due_utc);
+                CREATE INDEX IF NOT EXISTS idx_reminders_status ON reminders (status);
+                -- "открытые напоминания пользователя"
+                CREATE INDEX IF NOT EXISTS idx_reminders_chat ON reminders (chat_id, status);
+                CREATE INDEX IF NOT EXISTS idx_reminders_user ON reminders (user_id, status);
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_reminders_uid ON reminders (uid);
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_reminders_archive_id ON reminders_archive (id);
+                CREATE INDEX IF NOT EXISTS idx_sheet_outbox_reminder ON sheet_outbox (reminder_id);
+            ''')
+
+    def _columns(self, table: str) -> List[str]:
+        return [row['name'] for row in self._db.execute(f'PRAGMA table_info({table})')]
+
+    def _backfill_due_utc(self):
+        rows = self._db.execute('SELECT id, datetime, timezone FROM reminders').fetchall()
+        self._db.executemany(
+            'UPDATE reminders SET due_utc = ? WHERE id = ?',
+            [(self._due_utc(r['datetime'], r['timezone']), r['id']) for r in rows]
+        )
+
+    @staticmethod
+    def _due_utc(datetime_str, timezone) -> Optional[float]:
+        try:
+            return parse_due_utc(datetime_str, timezone)
+        except Exception as e:
+            logger.warning(f"Не удалось разобрать время напоминания '{datetime_str}': {e}")
+            return None
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict:
+        return {
+            'row': row['id'],
+            'datetime': row['datetime'],
+            'text': row['text'],
+            'timezone': row['timezone'],
+            'sent': 'TRUE' if row['sent'] else 'FALSE',
+            'status': row['status'],
+            'comment': row['comment'],
+            'due_utc': row['due_utc'],
+            'chat_id': row['chat_id'],
+            'user_id': row['user_id'],
+            'uid': row['uid'],
+        }
+
+    def _notify(self):
+        if self.replicator is not None:
+            self.replicator.notify()
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM reminders LIMIT 1').fetchone() is None
+
+    def import_rows(self, rows: List[Dict]) -> int:
+        """
+        Загружает уже существующие строки листа (первый запуск поверх старой таблицы)
+
+        Args:
+            rows: Словари с ключами row, datetime, text, timezone, sent, status, comment, chat_id, user_id
+
+        Returns:
+            Количество импортированных напоминаний
+        """
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                'INSERT OR IGNORE INTO reminders '
+                '(datetime, text, timezone, sent, status, comment, sheet_row, created_at, due_utc, chat_id, user_id, uid) '
+                f'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, {self.NEW_UID})',
+                [
+                    (
+                        r.get('datetime') or '', r.get('text') or '', r.get('timezone') or '',
+                        1 if str(r.get('sent', '')).strip().lower() == 'true' else 0,
+                        r.get('status') or '', r.get('comment') or '', r['row'], now,
+                        self._due_utc(r.get('datetime'), r.get('timezone')),
+                        parse_id(r.get('chat_id')), parse_id(r.get('user_id'))
+                    )
+                    for r in rows
+                ]
+            )
+        logger.info(f"Импортировано напоминаний из Google Sheets: {len(rows)}")
+        return len(rows)
+
+    def get_reminders(self) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM reminders WHERE sent = 0 ORDER BY id').fetchall()
+        return [self._to_dict(r) for r in rows]
+
+    def get_reminder_by_row(self, row) -> Optional[Dict]:
+        try:
+            with self._lock:
+                found = self._db.execute('SELECT * FROM reminders WHERE id = ?', (row,)).fetchone()
+                if found is None:
+                    found = self._db.execute('SELECT * FROM reminders_archive WHERE id = ?', (row,)).fetchone()
+            return self._to_dict(found) if found else None
+        except Exception as e:
+            logger.error(f"Ошибка при получении напоминания: {e}")
+            return None
+
+    def reminder_uid(self, reminder: Dict) -> str:
+        if reminder.get('uid'):
+            return reminder['uid']
+        # Напоминание поставлено в очередь сразу после создания, uid ещё не прочитан
+        found = self.get_reminder_by_row(reminder['row'])
+        if found and found['uid']:
+            return found['uid']
+        return super().reminder_uid(reminder)
+
+    def get_due(self, until_utc: float) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT * FROM reminders WHERE sent = 0 AND due_utc IS NOT NULL AND due_utc <= ? ORDER BY due_utc',
+                (until_utc,)
+            ).fetchall()
+        return [self._to_dict(r) for r in rows]
+
+    def get_added_after(self, row: int) -> List[Dict]:
+        """Возвращает неотправленные напоминания с номером больше row (созданные другими процессами)"""
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM reminders WHERE id > ? AND sent = 0 ORDER BY id', (row,)).fetchall()
+        return [self._to_dict(r) for r in rows]
+
+    def last_row(self) -> int:
+        """Номер последнего добавленного напоминания"""
+        with self._lock:
+            return self._db.execute('SELECT COALESCE(MAX(id), 0) FROM reminders').fetchone()[0]
+
+    def get_open_for_chat(self, chat_id: int) -> List[Dict]:
+        """Возвращает незакрытые (не done/canceled) напоминания чата"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT * FROM reminders WHERE chat_id = ? AND status = \'\' ORDER BY due_utc IS NULL, due_utc, id',
+                (chat_id,)
+            ).fetchall()
+        return [self._to_dict(r) for r in rows]
+
+    def get_last_sent_for_chat(self, chat_id: int) -> Optional[Dict]:
+        """Возвращает последнее отправленное в чат напоминание (его мог отправить другой процесс)"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT * FROM reminders WHERE chat_id = ? AND sent = 1 ORDER BY due_utc DESC, id DESC LIMIT 1',
+                (chat_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def get_open_for_user(self, user_id: int) -> List[Dict]:
+        """Возвращает незакрытые (не done/canceled) напоминания пользователя"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT * FROM reminders WHERE user_id = ? AND status = \'\' ORDER BY due_utc IS NULL, due_utc, id',
+                (user_id,)
+            ).fetchall()
+        return [self._to_dict(r) for r in rows]
+
+    def get_by_status(self, status: str) -> List[Dict]:
+        """Возвращает напоминания с указанным статусом ('done', 'canceled' или '' — открытые)"""
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM reminders WHERE status = ? ORDER BY id', (status,)).fetchall()
+        return [self._to_dict(r) for r in rows]
+
+    def get_no_time(self) -> List[Dict]:
+        """Возвращает открытые напоминания без времени"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT * FROM reminders WHERE sent = 0 AND due_utc IS NULL AND status = \'\' ORDER BY id'
+            ).fetchall()
+        return [self._to_dict(r) for r in rows]
+
+    def add_reminder(self, datetime_str: str = None, text: str = None, timezone: str = 'Europe/Moscow',
+                     comment: str = '', chat_id: int = None, user_id: int = None) -> Optional[int]:
+        try:
+            with self._lock, self._db:
+                cursor = self._db.execute(
+                    'INSERT INTO reminders '
+                    '(datetime, text, timezone, sent, status, comment, created_at, due_utc, chat_id, user_id, uid) '
+                    f'VALUES (?, ?, ?, 0, \'\', ?, ?, ?, ?, ?, {self.NEW_UID})',
+                    (datetime_str or '', text or '', timezone or '', comment or '', time.time(),
+                     self._due_utc(datetime_str, timezone), chat_id, user_id)
+                )
+                reminder_id = cursor.lastrowid
+                self._db.execute(
+                    'INSERT INTO sheet_outbox (reminder_id, op) VALUES (?, \'add\')', (reminder_id,)
+                )
+            self._notify()
+            return reminder_id
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении напоминания: {e}")
+            return None
+
+    def _update(self, row, column: str, value) -> bool:
+        try:
+            with self._lock, self._db:
+                cursor = self._db.execute(f'UPDATE reminders SET {column} = ? WHERE id = ?', (value, row))
+                if cursor.rowcount == 0:
+                    # Кнопка старого сообщения: напоминание уже в архиве, строка листа перенесена
+                    cursor = self._db.execute(
+                        f'UPDATE reminders_archive SET {column} = ? WHERE id = ?', (value, row)
+                    )
+                    return cursor.rowcount > 0
+                self._db.execute(
+                    'INSERT INTO sheet_outbox (reminder_id, op, payload) VALUES (?, \'update\', ?)',
+                    (row, json.dumps({'field': column, 'value': value}, ensure_ascii=False))
+                )
+            self._notify()
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении напоминания {row} ({column}): {e}")
+            return False
+
+    def mark_as_sent(self, row) -> bool:
+        return self._update(row, 'sent', 1)
+
+    def update_reminder_status(self, row, status) -> bool:
+        return self._update(row, 'status', status)
+
+    def update_reminder_comment(self, row, comment) -> bool:
+        return self._update(row, 'comment', comment)
+
+    # --- Очередь репликации ---
+
+    def pending_replication(self, limit: int = 100) -> List[Dict]:
+        """Возвращает первые изменения, ещё не перенесённые в Google Sheets"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT o.id, o.reminder_id, o.op, o.payload, r.datetime, r.text, r.timezone, r.comment, r.sheet_row, '
+                'r.chat_id, r.user_id '
+                'FROM sheet_outbox o LEFT JOIN reminders r ON r.id = o.reminder_id ORDER BY o.id LIMIT ?',
+                (limit,)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def complete_replication(self, outbox_id: int, reminder_id: int = None, sheet_row: int = None) -> None:
+        """Убирает изменение из очереди и запоминает строку листа для нового напоминания"""
+        with self._lock, self._db:
+            if sheet_row is not None:
+                self._db.execute('UPDATE reminders SET sheet_row = ? WHERE id = ?', (sheet_row, reminder_id))
+            self._db.execute('DELETE FROM sheet_outbox WHERE id = ?', (outbox_id,))
+
+    # --- Архивация ---
+
+    def compact(self, min_age: float = 7 * 24 * 3600, batch_size: int = 500) -> Dict:
+        """
+        Переносит завершённые напоминания (отправленные, done, canceled) в архив
+
+        Строки листа переносятся в лист-архив за месяц, остальные строки перенумеровываются.
+        Номера напоминаний (id) не меняются, поэтому кнопки старых сообщений продолжают работать.
+
+        Args:
+            min_age: Сколько секунд после срабатывания (или создания) напоминание остаётся в активных
+            batch_size: Сколько напоминаний переносить за один проход
+
+        Returns:
+            Словарь со счётчиками: archived, active_before, active_after
+        """
+        with self._lock:
+            active_before = self._db.execute('SELECT COUNT(*) FROM reminders').fetchone()[0]
+        cutoff = time.time() - min_age
+        archived = 0
+        while True:
+            with self._lock:
+                # Напоминания с неперенесёнными в лист изменениями ждут следующего раза
+                candidates = self._db.execute(
+                    f'SELECT id, sheet_row FROM reminders WHERE {self.FINISHED} '
+                    'AND COALESCE(due_utc, created_at) < ? '
+                    'AND id NOT IN (SELECT reminder_id FROM sheet_outbox) ORDER BY id LIMIT ?',
+                    (cutoff, batch_size)
+                ).fetchall()
+            if not candidates:
+                break
+            ids = [c['id'] for c in candidates]
+            if self.replicator is not None:
+                # Удаление строк листа и перенумерация в базе — под одной блокировкой репликации
+                sheet_rows = [c['sheet_row'] for c in candidates if c['sheet_row'] is not None]
+                if not self.replicator.archive_sheet_rows(ids, sheet_rows):
+                    break
+            else:
+                self._archive(ids, {})
+            archived += len(candidates)
+            if len(candidates) < batch_size:
+                break
+
+        active_after = active_before - archived
+        logger.info(f"Архивация: перенесено {archived} напоминаний, активных {active_before} -> {active_after}")
+        return {'archived': archived, 'active_before': active_before, 'active_after': active_after}
+
+    def begin_archive(self, ids: List[int], sheet_rows: List[int]) -> int:
+        """
+        Запоминает, какие строки листа сейчас будут удалены (до изменения листа)
+
+        Returns:
+            Номер записи для finish_archive/cancel_archive
+        """
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                'INSERT INTO sheet_archive_intent (reminder_ids, sheet_rows, created_at) VALUES (?, ?, ?)',
+                (json.dumps(ids), json.dumps(sorted(sheet_rows)), time.time())
+            )
+        return cursor.lastrowid
+
+    def get_sheet_rows(self, ids: List[int]) -> Dict[int, Dict]:
+        """Возвращает {строка листа: напоминание} для напоминаний с указанными номерами"""
+        placeholders = ', '.join('?' * len(ids))
+        with self._lock:
+            rows = self._db.execute(
+                f'SELECT * FROM reminders WHERE sheet_row IS NOT NULL AND id IN ({placeholders})', ids
+            ).fetchall()
+        return {r['sheet_row']: self._to_dict(r) for r in rows}
+
+    def pending_archives(self) -> List[Dict]:
+        """Архивации, прерванные между изменением листа и записью в базу"""
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM sheet_archive_intent ORDER BY id').fetchall()
+        return [{'id': r['id'], 'reminder_ids': json.loads(r['reminder_ids']),
+                 'sheet_rows': json.loads(r['sheet_rows'])} for r in rows]
+
+    def cancel_archive(self, intent_id: int) -> None:
+        """Лист не изменился — архивация будет повторена со следующей попытки"""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM sheet_archive_intent WHERE id = ?', (intent_id,))
+
+    def finish_archive(self, intent_id: Optional[int], ids: List[int], sheet_rows: List[int],
+                       row_map: Optional[Dict[int, int]] = None) -> None:
+        """
+        Переносит напоминания в архив после удаления их строк из листа
+
+        Args:
+            intent_id: Запись begin_archive (удаляется в той же транзакции) или None
+            ids: Номера напоминаний
+            sheet_rows: Удалённые строки листа
+            row_map: {старый номер строки: новый}; None — вычислить по удалённым строкам
+        """
+        self._archive(ids, row_map, intent_id, sheet_rows)
+
+    def _archive(self, ids: List[int], row_map: Optional[Dict[int, int]], intent_id: Optional[int] = None,
+                 sheet_rows: List[int] = ()) -> None:
+        columns = ', '.join(self._columns('reminders'))
+        placeholders = ', '.join('?' * len(ids))
+        with self._lock, self._db:
+            if row_map is None:
+                # Каждая оставшаяся строка поднимается на число удалённых строк выше неё
+                deleted = sorted(sheet_rows)
+                row_map = {}
+                for (row,) in self._db.execute(
+                        f'SELECT sheet_row FROM reminders WHERE sheet_row IS NOT NULL AND id NOT IN ({placeholders})',
+                        ids):
+                    shift = bisect.bisect_left(deleted, row)
+                    if shift:
+                        row_map[row] = row - shift
+            self._db.execute(
+                f'INSERT OR REPLACE INTO reminders_archive ({columns}, archived_at) '
+                f'SELECT {columns}, ? FROM reminders WHERE id IN ({placeholders})',
+                (time.time(), *ids)
+            )
+            # Строка в основном листе больше не принадлежит напоминанию
+            self._db.execute(f'UPDATE reminders_archive SET sheet_row = NULL WHERE id IN ({placeholders})', ids)
+            self._db.execute(f'DELETE FROM reminders WHERE id IN ({placeholders})', ids)
+            # Строки сдвигаются только вверх: идём по возрастанию, чтобы не нарушить уникальность
+            for old_row in sorted(row_map):
+                self._db.execute(
+                    'UPDATE reminders SET sheet_row = ? WHERE sheet_row = ?', (row_map[old_row], old_row)
+                )
+            if intent_id is not None:
+                self._db.execute('DELETE FROM sheet_archive_intent WHERE id = ?', (intent_id,))
+
+    def close(self) -> None:
+        if self.replicator is not None:
+            self.replicator.stop()
+        with self._lock:
+            self._db.close()
+
+
+class SheetsReplicator:
+    """
+    Фоновый перенос изменений из SQLiteReminderStore в Google Sheets
+
+    Лист остаётся копией для людей: бот не ждёт Google API ни при создании напоминания,
+    ни при отправке. При ошибке перенос повторяется с экспоненциальной задержкой.
+    """
+
+    def __init__(self, store: SQLiteReminderStore, sheets, interval: float = 2.0, max_backoff: float = 300.0):
+        """
+        Args:
+            store: Локальное хранилище
+            sheets: GoogleSheetsReminder, куда переносятся изменения
+            interval: Пауза между проверками очереди (в секундах)
+            max_backoff: Максимальная задержка после ошибок (в секундах)
+        """
+        self.store = store
+        self.sheets = sheets
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self._backoff = 0.0
+        self.paused = False  # переносом занимается только ведущий процесс
+        self._lock = threading.Lock()  # перенос изменений и архивация не должны пересекаться
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sheets-replicator', daemon=True)
+        store.replicator = self
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def notify(self) -> None:
+        """Будит поток после нового изменения"""
+        self._wakeup.set()
+
+    def pause(self) -> None:
+        """Приостанавливает перенос (процесс перестал быть ведущим)"""
+        self.paused = True
+
+    def resume(self) -> None:
+        self.paused = False
+        self._wakeup.set()
+
+    def stop(self) -> None:
+        """Останавливает поток, перенося оставшиеся изменения"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=30)
+        self.replicate()
+        self.sheets.close()
+
+    def replicate(self) -> bool:
+        """
+        Переносит накопленные изменения
+
+        Returns:
+            True если очередь разобрана полностью (или перенос приостановлен)
+        """
+        if self.paused:
+            return True
+        with self._lock:
+            # Изменения адресуют строки по номерам — сначала номера должны совпасть с листом
+            if not self.recover_archives():
+                return False
+            while True:
+                batch = self.store.pending_replication()
+                if not batch:
+                    return True
+                for item in batch:
+                    if not self._apply(item):
+                        return False
+                    if item['op'] == 'add':
+                        # У следующих изменений этого напоминания теперь есть строка листа — перечитываем очередь
+                        break
+
+    def archive_sheet_rows(self, ids: List[int], rows: List[int]) -> bool:
+        """
+        Переносит строки листа в архив за текущий месяц и перенумеровывает строки в базе
+
+        Всё выполняется под блокировкой репликации: изменения из очереди не попадут в строки,
+        которые уже сдвинулись в листе, но ещё не перенумерованы в базе. Намерение записывается
+        в базу до изменения листа, чтобы после падения между шагами перенумерацию можно было
+        восстановить (recover_archives).
+
+        Args:
+            ids: Номера архивируемых напоминаний
+            rows: Их строки в листе
+
+        Returns:
+            True если напоминания перенесены в архив
+        """
+        with self._lock:
+            if not self.recover_archives():
+                return False
+            if not rows:
+                self.store.finish_archive(None, ids, [], {})
+                return True
+            intent_id = self.store.begin_archive(ids, rows)
+            row_map = self.sheets.archive_rows(rows, time.strftime('archive-%Y-%m'))
+            if row_map is None:
+                # Лист мог измениться до ошибки — разберётся recover_archives перед следующим переносом
+                return False
+            self.store.finish_archive(intent_id, ids, rows, row_map)
+            return True
+
+    def recover_archives(self) -> bool:
+        """
+        Завершает архивации, прерванные между удалением строк из листа и записью в базу
+
+        Если строки ещё на месте (в них те же напоминания), архивация просто отменяется,
+        иначе строки в базе перенумеровываются так, как их сдвинуло удаление.
+
+        Returns:
+            True если незавершённых архиваций не осталось
+        """
+        pending = self.store.pending_archives()
+        if not pending:
+            return True
+        try:
+            self.sheets.refresh(full=True)
+            for intent in pending:
+                if self._rows_still_present(intent['reminder_ids'], intent['sheet_rows']):
+                    self.store.cancel_archive(intent['id'])
+                else:
+                    logger.warning(f"Завершаем прерванную архивацию строк листа {intent['sheet_rows']}")
+                    self.store.finish_archive(intent['id'], intent['reminder_ids'], intent['sheet_rows'])
+        except Exception as e:
+            logger.error(f"Ошибка при восстановлении архивации: {e}")
+            return False
+        return True
+
+    def _rows_still_present(self, ids: List[int], rows: List[int]) -> bool:
+        expected = self.store.get_sheet_rows(ids)
+        for row in rows:
+            reminder, found = expected.get(row), self.sheets.get_reminder_by_row(row)
+            if not reminder or not found:
+                return False
+            if (found['datetime'], found['text']) != (reminder['datetime'], reminder['text']):
+                return False
+        return True
+
+    def _apply(self, item: Dict) -> bool:
+        try:
+            if item['op'] == 'add':
+                if item['sheet_row'] is not None:
+                    self.store.complete_replication(item['id'])
+                    return True
+                # Ошибка API — исключение, add повторится; None — строка уже добавлена
+                sheet_row = self.sheets.append_reminder(
+                    datetime_str=item['datetime'] or None,
+                    text=item['text'],
+                    timezone=item['timezone'],
+                    comment=item['comment'],
+                    chat_id=item['chat_id'],
+                    user_id=item['user_id']
+                )
+                if not sheet_row:
+                    # Повтор добавил бы в лист дубликат — считаем add выполненным без номера строки
+                    logger.error(f"Напоминание {item['reminder_id']} добавлено в Google Sheets, "
+                                 f"но номер строки неизвестен; его изменения в лист не попадут")
+                self.store.complete_replication(item['id'], item['reminder_id'], sheet_row or None)
+                return True
+
+            if item['sheet_row'] is None:
+                # Очередь разбирается по порядку, так что add этого напоминания уже выполнен:
+                # напоминание удалено из базы или номер его строки не удалось определить
+                if item['text'] is not None:
+                    logger.warning(f"Изменение напоминания {item['reminder_id']} пропущено: строка листа неизвестна")
+                self.store.complete_replication(item['id'])
+                return True
+            payload = json.loads(item['payload'])
+            field, value = payload['field'], payload['value']
+            if field == 'sent':
+                ok = self.sheets.mark_as_sent(item['sheet_row']) if value else True
+            elif field == 'status':
+                ok = self.sheets.update_reminder_status(item['sheet_row'], value)
+            else:
+                ok = self.sheets.update_reminder_comment(item['sheet_row'], value)
+            if ok:
+                self.store.complete_replication(item['id'])
+            return bool(ok)
+        except Exception as e:
+            logger.error(f"Ошибка репликации в Google Sheets: {e}")
+            return False
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            if self.replicate():
+                self._backoff = 0.0
+                delay = self.interval
+            else:
+                self._backoff = min(max(self._backoff * 2, self.interval), self.max_backoff)
+                delay = self._backoff
+                logger.warning(f"Репликация в Google Sheets отложена на {delay:.1f} с")
+            # Во время задержки после ошибки новые изменения не будят поток
+            (self._stopped if self._backoff else self._wakeup).wait(timeout=delay)
+            self._wakeup.clear()
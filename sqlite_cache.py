@@ -0,0 +1,172 @@
+"""
+Общий кэш "ключ → JSON-значение": LRU в памяти и (необязательно) SQLite на диске
+
+Используется кэшем извлечения (ExtractionCache) и кэшем распознанных голосовых
+(TranscriptCache). Память ограничена числом записей и объёмом, диск — числом записей;
+записи старше ttl не отдаются и вытесняются. Время последнего использования копится
+в памяти и пишется на диск пачкой вместе со следующей записью, а не коммитом на каждое попадание.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько отметок использования копится в памяти до записи на диск
+TOUCH_BATCH = 100
+
+
+class SQLiteCache:
+    def __init__(self, table: str, path: Optional[str] = None, max_entries: int = 10000,
+                 ttl: float = 7 * 24 * 3600, max_bytes: Optional[int] = None):
+        """
+        Инициализация кэша
+
+        Args:
+            table: Имя таблицы SQLite
+            path: Путь к файлу SQLite; None — только память (до перезапуска)
+            max_entries: Максимальное число записей (вытесняются давно не использованные)
+            ttl: Время жизни записи (в секундах)
+            max_bytes: Объём значений в памяти; None — без ограничения
+        """
+        self.table = table
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._memory = OrderedDict()  # {key: (created_at, value, size)}
+        self._memory_bytes = 0
+        self._touched = {}  # {key: used_at}, ещё не записанные на диск
+        self._lock = threading.RLock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._create_table()
+
+    def _create_table(self) -> None:
+        columns = [row[1] for row in self._db.execute(f'PRAGMA table_info({self.table})')]
+        if columns and columns != ['key', 'value', 'created_at', 'used_at']:
+            # Таблица старого формата: это кэш, содержимое можно не переносить
+            logger.info(f"Кэш {self.table}: таблица старого формата пересоздаётся")
+            self._db.execute(f'DROP TABLE {self.table}')
+        self._db.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.table} ('
+            ' key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, used_at REAL NOT NULL)'
+        )
+        self._db.execute(f'CREATE INDEX IF NOT EXISTS idx_{self.table}_used ON {self.table} (used_at)')
+        self._db.commit()
+
+    def lookup(self, key: str) -> Optional[Any]:
+        """Значение по ключу или None (нет записи или она просрочена); счётчики не меняет"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    f'SELECT created_at, value FROM {self.table} WHERE key = ?', (key,)
+                ).fetchone()
+                if row:
+                    entry = (row[0], json.loads(row[1]), len(key) + len(row[1].encode()))
+                    self._remember(key, entry)
+            if entry is None:
+                return None
+            created_at, value, _ = entry
+            if now - created_at > self.ttl:
+                self.delete(key)
+                return None
+            self._memory.move_to_end(key)
+            if self._db is not None:
+                self._touched[key] = now
+                if len(self._touched) >= TOUCH_BATCH:
+                    self._flush_touched()
+                    self._db.commit()
+            return value
+
+    def store(self, keys: Iterable[str], value: Any) -> None:
+        """Сохраняет значение под всеми ключами и вытесняет лишние записи"""
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            for key in keys:
+                self._remember(key, (now, value, len(key) + len(payload.encode())))
+                self._touched.pop(key, None)
+                if self._db is not None:
+                    self._db.execute(
+                        f'INSERT OR REPLACE INTO {self.table} (key, value, created_at, used_at) VALUES (?, ?, ?, ?)',
+                        (key, payload, now, now)
+                    )
+            if self._db is not None:
+                self._flush_touched()
+                # Вытесняем давно не использованные и просроченные записи
+                self._db.execute(f'DELETE FROM {self.table} WHERE created_at < ?', (now - self.ttl,))
+                cursor = self._db.execute(
+                    f'DELETE FROM {self.table} WHERE rowid IN ('
+                    f' SELECT rowid FROM {self.table} ORDER BY used_at DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,)
+                )
+                self.evictions += max(cursor.rowcount, 0)
+                self._db.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._forget(key)
+            self._touched.pop(key, None)
+            if self._db is not None:
+                self._db.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        """Счётчики попаданий и промахов"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': len(self._memory),
+            'bytes': self._memory_bytes,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._flush_touched()
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+    def _flush_touched(self) -> None:
+        if self._touched:
+            self._db.executemany(
+                f'UPDATE {self.table} SET used_at = ? WHERE key = ?',
+                [(used_at, key) for key, used_at in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _remember(self, key: str, entry) -> None:
+        self._forget(key)
+        self._memory[key] = entry
+        self._memory_bytes += entry[2]
+        while len(self._memory) > 1 and (
+                len(self._memory) > self.max_entries
+                or (self.max_bytes is not None and self._memory_bytes > self.max_bytes)):
+            _, (_, _, size) = self._memory.popitem(last=False)
+            self._memory_bytes -= size
+            if self._db is None:
+                self.evictions += 1
+
+    def _forget(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[2]
@@ -0,0 +1,216 @@
+"""
+Бэкенды распознавания речи для голосовых сообщений
+
+- WhisperAPIBackend — OpenAI whisper-1 (сеть, по умолчанию);
+- LocalWhisperBackend — faster-whisper на CPU (квантованная модель) в отдельных процессах,
+  без сети; нужен пакет faster-whisper (необязательная зависимость);
+- DurationRouter — выбирает бэкенд по длительности аудио: короткие сообщения распознаются
+  локально без сетевого запроса, длинные (или когда локальный бэкенд занят) — через API.
+"""
+
+import asyncio
+import importlib.util
+import io
+import logging
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import openai
+
+from process_pool import SpawnPool
+
+logger = logging.getLogger(__name__)
+
+FASTER_WHISPER_AVAILABLE = importlib.util.find_spec('faster_whisper') is not None
+
+
+class TranscriptionBackend:
+    """Интерфейс бэкенда распознавания речи"""
+
+    name = 'base'
+
+    @property
+    def busy(self) -> bool:
+        """True, если новый запрос придётся ждать в очереди"""
+        return False
+
+    async def transcribe(self, audio: io.BytesIO, duration: Optional[float] = None) -> Optional[str]:
+        """
+        Распознаёт речь
+
+        Args:
+            audio: Файлоподобный объект с аудио (атрибут name задаёт формат)
+            duration: Длительность аудио в секундах, если известна
+
+        Returns:
+            Распознанный текст или None в случае ошибки
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class WhisperAPIBackend(TranscriptionBackend):
+    name = 'openai'
+
+    def __init__(self, api_key: str, async_client: Optional[openai.AsyncOpenAI] = None,
+                 timeout: float = 60.0, model: str = 'whisper-1', language: str = 'ru'):
+        """
+        Args:
+            api_key: API ключ OpenAI
+            async_client: Общий AsyncOpenAI клиент; без него синхронный вызов уходит в отдельный поток
+            timeout: Таймаут запроса (в секундах)
+            model: Модель распознавания
+            language: Язык речи
+        """
+        self.client = openai.OpenAI(api_key=api_key)
+        self.async_client = async_client
+        self.timeout = timeout
+        self.model = model
+        self.language = language
+
+    async def transcribe(self, audio: io.BytesIO, duration: Optional[float] = None) -> Optional[str]:
+        try:
+            params = dict(
+                model=self.model,
+                file=audio,
+                language=self.language,  # Указываем язык для лучшего распознавания
+                timeout=self.timeout
+            )
+            if self.async_client is not None:
+                transcript = await self.async_client.audio.transcriptions.create(**params)
+            else:
+                transcript = await asyncio.to_thread(self.client.audio.transcriptions.create, **params)
+            return transcript.text.strip()
+        except Exception as e:
+            logger.error(f"Ошибка при распознавании речи (OpenAI): {e}")
+            return None
+
+
+# Модель faster-whisper, загруженная в процессе пула
+_local_model = None
+
+
+def _load_local_model(model_size: str, compute_type: str, cpu_threads: int) -> None:
+    """Загружает модель один раз при запуске процесса пула"""
+    global _local_model
+    from faster_whisper import WhisperModel
+
+    _local_model = WhisperModel(model_size, device='cpu', compute_type=compute_type, cpu_threads=cpu_threads)
+
+
+def _ping() -> bool:
+    return _local_model is not None
+
+
+def _transcribe_local(data: bytes, language: str) -> str:
+    """Распознаёт аудио локальной моделью (выполняется в процессе пула)"""
+    segments, _ = _local_model.transcribe(io.BytesIO(data), language=language, beam_size=1, vad_filter=True)
+    return ' '.join(segment.text.strip() for segment in segments).strip()
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    name = 'local'
+
+    def __init__(self, model_size: str = 'small', compute_type: str = 'int8', language: str = 'ru',
+                 max_workers: int = 1, cpu_threads: int = 0, timeout: float = 120.0):
+        """
+        Args:
+            model_size: Модель faster-whisper (tiny, base, small, medium или путь к модели)
+            compute_type: Квантование весов (int8 — быстрее всего на CPU)
+            language: Язык речи
+            max_workers: Число процессов (в каждом своя копия модели)
+            cpu_threads: Потоков на процесс; 0 — по числу ядер
+            timeout: Максимальное время распознавания одного сообщения (в секундах)
+        """
+        if not FASTER_WHISPER_AVAILABLE:
+            raise RuntimeError("faster-whisper не установлен (pip install faster-whisper)")
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.language = language
+        self.max_workers = max_workers
+        self.cpu_threads = cpu_threads
+        self.timeout = timeout
+        # Распознавание в процессе не прервать, поэтому по таймауту процессы пула завершаются
+        self._pool = SpawnPool(max_workers, _load_local_model, (model_size, compute_type, cpu_threads),
+                               kill_on_timeout=True)
+
+    @property
+    def busy(self) -> bool:
+        return self._pool.pending >= self.max_workers
+
+    def warm_up(self) -> None:
+        """
+        Запускает процессы и загружает модель заранее, а не при первом сообщении
+
+        Процессы (spawn) заново импортируют запускаемый модуль, поэтому у него не должно быть
+        побочных эффектов при импорте (в main.py всё создаётся внутри main()).
+        """
+        self._pool.submit(_ping).add_done_callback(self._on_warm_up)
+
+    def _on_warm_up(self, future) -> None:
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Не удалось загрузить локальную модель {self.model_size}: {error!r}")
+        else:
+            logger.info(f"Локальная модель {self.model_size} загружена")
+
+    async def transcribe(self, audio: io.BytesIO, duration: Optional[float] = None) -> Optional[str]:
+        try:
+            return await self._pool.run(self.timeout, _transcribe_local, audio.getvalue(), self.language)
+        except asyncio.TimeoutError:
+            logger.error(f"Локальное распознавание не уложилось в {self.timeout:.0f} с, пул будет пересоздан")
+            return None
+        except BrokenProcessPool:
+            logger.error("Процесс локального распознавания аварийно завершился, пул будет пересоздан")
+            return None
+        except Exception as e:
+            logger.error(f"Ошибка при распознавании речи (локально): {e!r}")
+            return None
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+class DurationRouter(TranscriptionBackend):
+    name = 'router'
+
+    def __init__(self, short_backend: TranscriptionBackend, long_backend: TranscriptionBackend,
+                 max_short_duration: float = 30.0, fallback: bool = True):
+        """
+        Args:
+            short_backend: Бэкенд для коротких сообщений (обычно локальный)
+            long_backend: Бэкенд для длинных сообщений и сообщений неизвестной длины (обычно API)
+            max_short_duration: Граница длительности (в секундах)
+            fallback: При ошибке одного бэкенда пробовать другой
+        """
+        self.short_backend = short_backend
+        self.long_backend = long_backend
+        self.max_short_duration = max_short_duration
+        self.fallback = fallback
+
+    def select(self, duration: Optional[float]) -> TranscriptionBackend:
+        """Выбирает бэкенд для аудио заданной длительности"""
+        if duration is None or duration > self.max_short_duration:
+            return self.long_backend
+        # Пока короткий бэкенд занят, не ждём очереди
+        if self.short_backend.busy and not self.long_backend.busy:
+            return self.long_backend
+        return self.short_backend
+
+    async def transcribe(self, audio: io.BytesIO, duration: Optional[float] = None) -> Optional[str]:
+        backend = self.select(duration)
+        text = await backend.transcribe(audio, duration)
+        if text is None and self.fallback:
+            other = self.long_backend if backend is self.short_backend else self.short_backend
+            logger.warning(f"Бэкенд {backend.name} не распознал речь, пробуем {other.name}")
+            audio.seek(0)
+            text = await other.transcribe(audio, duration)
+        return text
+
+    def close(self) -> None:
+        self.short_backend.close()
+        self.long_backend.close()
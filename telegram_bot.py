@@ -1,43 +1,108 @@
 import logging
 from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
+from telegram.ext import (Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler,
+                          TypeHandler)
 from message_processor import MessageProcessor
-from google_sheets import GoogleSheetsReminder
+from reminder_store import ReminderStore
 from voice_processor import VoiceProcessor
+from audio_pool import AudioPool, PoolSaturated
 from inline_button_handler import InlineButtonHandler
 from inline_buttons import InlineButtonManager
+from io_executor import IOExecutor, STORAGE, OPENAI
+from openai_client import create_async_client
+from time_parser import roll_forward
+from message_coalescer import MessageCoalescer
+from update_router import ChatUpdateProcessor, UpdateRouter
 import os
 import asyncio
+from typing import Awaitable, Callable, Optional
+from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
 class ReminderBot:
-    def __init__(self, telegram_token: str, openai_api_key: str, google_sheets: GoogleSheetsReminder):
+    def __init__(self, telegram_token: str, openai_api_key: str, google_sheets: ReminderStore,
+                 reminder_scheduler=None, io_executor: IOExecutor = None, openai_async: bool = True,
+                 openai_timeout: float = 30.0, extraction_cache=None, transcript_cache=None,
+                 pairing_window: float = 2.0, pairing_min_window: float = 0.7, pairing_max_window: float = 5.0,
+                 pairing_max_messages: int = 20,
+                 telegram_base_url: str = None, audio_pool: AudioPool = None,
+                 voice_split_duration: float = 60.0, voice_segment_duration: float = 45.0,
+                 local_stt=None, local_stt_max_duration: float = 30.0, workers: int = 1, worker_index: int = 0,
+                 concurrent_updates: int = 64, default_chat_id=None):
         """
         Инициализация бота
         
         Args:
             telegram_token: Токен Telegram бота
             openai_api_key: API ключ OpenAI
-            google_sheets: Экземпляр GoogleSheetsReminder
+            google_sheets: Хранилище напоминаний (ReminderStore: SQLite или GoogleSheetsReminder)
+            reminder_scheduler: Очередь напоминаний (ReminderScheduler), куда попадают новые напоминания
+            io_executor: Пул для блокирующих вызовов хранилища и OpenAI
+            openai_async: Использовать нативный AsyncOpenAI клиент вместо синхронного в пуле потоков
+            openai_timeout: Таймаут запроса к ChatGPT (в секундах)
+            extraction_cache: Кэш результатов ChatGPT (ExtractionCache)
+            transcript_cache: Кэш распознанных голосовых сообщений (TranscriptCache)
+            pairing_window: Начальное окно ожидания пересланных сообщений к пояснению (в секундах)
+            pairing_min_window: Нижняя граница адаптивного окна
+            pairing_max_window: Верхняя граница адаптивного окна
+            pairing_max_messages: Серия из стольких сообщений обрабатывается сразу, не дожидаясь окна
+            telegram_base_url: Адрес Bot API (например, локальная заглушка для тестов),
+                по умолчанию https://api.telegram.org/bot
+            audio_pool: Пул процессов для конвертации голосовых сообщений
+            voice_split_duration: Голосовые длиннее (в секундах) распознаются частями параллельно; 0 — целиком
+            voice_segment_duration: Максимальная длина части голосового сообщения (в секундах)
+            local_stt: Локальный бэкенд распознавания речи (LocalWhisperBackend); None — только OpenAI
+            local_stt_max_duration: Голосовые до этой длительности распознаются локально; None — все
+            workers: Число процессов-обработчиков (вебхук); каждый чат обрабатывает один процесс
+            worker_index: Номер этого процесса
+            concurrent_updates: Сколько обновлений обрабатываются одновременно (обновления одного
+                чата — всё равно по порядку)
+            default_chat_id: Чат, куда доставляются напоминания без chat_id (TELEGRAM_CHAT_ID)
         """
         self.telegram_token = telegram_token
         self.google_sheets = google_sheets
-        self.message_processor = MessageProcessor(openai_api_key)
-        self.voice_processor = VoiceProcessor(openai_api_key)
-        self.inline_button_handler = InlineButtonHandler(google_sheets)
+        self.reminder_scheduler = reminder_scheduler
+        self.io_executor = io_executor or IOExecutor()
+        # Один AsyncOpenAI клиент (и пул соединений) на текст и голос
+        self.openai_client = create_async_client(openai_api_key, timeout=openai_timeout) if openai_async else None
+        self.message_processor = MessageProcessor(openai_api_key, self.openai_client, openai_timeout,
+                                                  cache=extraction_cache, io_executor=self.io_executor)
+        self.voice_processor = VoiceProcessor(openai_api_key, self.openai_client, audio_pool=audio_pool,
+                                              split_duration=voice_split_duration,
+                                              segment_duration=voice_segment_duration,
+                                              cache=transcript_cache, local_backend=local_stt,
+                                              local_max_duration=local_stt_max_duration,
+                                              io_executor=self.io_executor)
+        self.inline_button_handler = InlineButtonHandler(google_sheets, self.io_executor, default_chat_id)
+        self.workers = workers
+        self.worker_index = worker_index
+        self.update_router = None
         
         # Создаем приложение
-        self.application = Application.builder().token(telegram_token).build()
+        # Голосовое одного пользователя (конвертация, распознавание) не задерживает остальных
+        builder = Application.builder().token(telegram_token).concurrent_updates(
+            ChatUpdateProcessor(concurrent_updates)
+        )
+        if telegram_base_url:
+            builder = builder.base_url(telegram_base_url)
+        self.application = builder.build()
+        
+        # Сигнал остановки для run_async
+        self._stop_event = asyncio.Event()
         
         # Инициализируем менеджер inline-кнопок
         self.inline_button_manager = InlineButtonManager(self.application.bot)
         
-        # Временное хранение последнего сообщения от каждого пользователя
-        self.last_user_messages = {}  # {user_id: {'message': text, 'timestamp': time, 'update': update_obj}}
-        
-        # Таймаут для связывания сообщений (в секундах)
-        self.MESSAGE_LINK_TIMEOUT = 2  # 2 секунды
+        # Серии сообщений пользователя (пояснение + пересланные) обрабатываются как одно целое
+        self.message_coalescer = MessageCoalescer(
+            self.process_message_burst,
+            window=pairing_window,
+            min_window=pairing_min_window,
+            max_window=pairing_max_window,
+            max_items=pairing_max_messages,
+            is_complete=self._is_burst_complete
+        )
         
         # Добавляем обработчики
         self.application.add_handler(CommandHandler("start", self.start_command))
@@ -58,25 +123,38 @@ class ReminderBot:
             f"{forwarded_text}"
         )
 
-    def _extract_and_validate(self, text: str):
+    async def _extract(self, text: str):
+        """Вызов GPT-извлечения: нативно через AsyncOpenAI или в пуле потоков."""
+        if self.message_processor.async_client is not None:
+            async with self.io_executor.limit(OPENAI):
+                return await self.message_processor.extract_reminder_info_async(text)
+        return await self.io_executor.run(OPENAI, self.message_processor.extract_reminder_info, text)
+
+    async def _extract_and_validate(self, text: str):
         """
         Унифицированный вызов GPT-извлечения и последующей валидации.
         Возвращает кортеж (reminder_info | None, error_message | "").
         """
-        reminder_info = self.message_processor.extract_reminder_info(text)
+        reminder_info = await self._extract(text)
         if reminder_info is None:
             return None, "Не удалось распознать напоминание"
         is_valid, error_message = self.message_processor.validate_reminder_info(reminder_info)
         if is_valid:
             return reminder_info, ""
-        # Если время в прошлом – пробуем один раз пересчитать, принудительно смещая в будущее
+        # Если время в прошлом – сначала сдвигаем локально по правилу «ближайший»,
+        # и только если сдвиг неоднозначен – один раз пересчитываем через GPT
         if error_message == "Время напоминания не может быть в прошлом":
+            corrected = roll_forward(text, reminder_info)
+            if corrected is not None:
+                is_valid, _ = self.message_processor.validate_reminder_info(corrected)
+                if is_valid:
+                    return corrected, ""
             adjusted_text = (
                 f"{text}\n\n"
                 "ВНИМАНИЕ: Предыдущее вычисление дало прошедшее время. Пересчитай дату/время так, "
                 "чтобы оно было в ближайшем будущем относительно текущего момента, сохранив исходный смысл."
             )
-            second = self.message_processor.extract_reminder_info(adjusted_text)
+            second = await self._extract(adjusted_text)
             if second is None:
                 return None, error_message
             is_valid2, err2 = self.message_processor.validate_reminder_info(second)
@@ -85,18 +163,29 @@ class ReminderBot:
             return None, err2
         return None, error_message
     
-    def cleanup_expired_messages(self):
-        """Очищает устаревшие последние сообщения"""
-        import time
-        current_time = time.time()
-        expired_users = []
-        
-        for user_id, data in self.last_user_messages.items():
-            if current_time - data['timestamp'] > self.MESSAGE_LINK_TIMEOUT:
-                expired_users.append(user_id)
-        
-        for user_id in expired_users:
-            del self.last_user_messages[user_id]
+    def _schedule_reminder(self, row_number, reminder_info, comment: str = '', update: Update = None):
+        """Ставит только что сохранённое напоминание в очередь отправки (в чат, где оно создано)"""
+        if not self.reminder_scheduler or not row_number:
+            return
+        self.reminder_scheduler.add({
+            'row': row_number,
+            'datetime': reminder_info.get('datetime'),
+            'text': reminder_info['text'],
+            'timezone': reminder_info.get('timezone', 'Europe/Moscow'),
+            'comment': comment,
+            'chat_id': update.effective_chat.id if update else None,
+            'user_id': update.effective_user.id if update else None,
+        })
+    
+    @staticmethod
+    def _is_burst_complete(items) -> bool:
+        """
+        Можно ли обработать серию, не дожидаясь окна.
+        Ответ (reply) на сообщение уже несёт свой контекст, пересланных к нему не ждём.
+        За пояснением может идти сколько угодно пересланных — такая серия закрывается по окну
+        (или по MessageCoalescer.max_items), чтобы стать одним напоминанием.
+        """
+        return len(items) == 1 and not items[0]['is_forwarded'] and items[0]['reply_to'] is not None
         
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
@@ -155,10 +244,10 @@ class ReminderBot:
         Единый обработчик всех текстовых сообщений (обычных и пересланных).
         
         Логика:
-        1. Сохраняет сообщение в буфер
-        2. Ждёт 2 секунды
-        3. Если пришло пересланное - обрабатывает пару
-        4. Если не пришло - обрабатывает как одиночное
+        1. Добавляет сообщение в серию пользователя (MessageCoalescer) и сразу возвращается
+        2. Серия закрывается, когда за адаптивное окно не пришло продолжения,
+           когда начинается новое пояснение или когда серия заведомо полная
+        3. Серия обрабатывается в process_message_burst
         """
         user_id = update.effective_user.id
         message = update.message
@@ -171,65 +260,43 @@ class ReminderBot:
         else:
             logger.info(f"Получено обычное сообщение от пользователя {user_id}: {message_text}")
         
-        # Очищаем устаревшие сообщения
-        self.cleanup_expired_messages()
-        
-        # Проверяем, есть ли уже сообщение в буфере от этого пользователя
-        # (это означает, что пришло второе сообщение в паре)
-        existing_message = self.last_user_messages.get(user_id)
-        
-        import time
-        current_time = time.time()
-        
-        # Если есть предыдущее сообщение от этого пользователя и оно не старше 2 секунд
-        if existing_message and (current_time - existing_message['timestamp']) < 2:
-            # Это вторая часть пары!
-            first_is_forwarded = existing_message.get('is_forwarded', False)
-            # Пара: обычное + пересланное (в любом порядке)
-            if (not first_is_forwarded and is_forwarded) or (first_is_forwarded and not is_forwarded):
-                first_message = existing_message['message']
-                second_message = message_text
-                # Если первое было пересланным - меняем порядок
-                if first_is_forwarded:
-                    first_message, second_message = second_message, first_message
-                logger.info(f"Обрабатываем пару: первое='{first_message}', второе='{second_message}'")
-                await self.handle_message_pair(first_message, second_message, existing_message['update'], existing_message['context'])
-                # Очищаем буфер
-                self.last_user_messages.pop(user_id, None)
-                return
-        
-        # Сохраняем сообщение в буфер
-        self.last_user_messages[user_id] = {
+        self.message_coalescer.add(user_id, {
             'message': message_text,
             'is_forwarded': is_forwarded,
-            'timestamp': current_time,
+            'reply_to': message.reply_to_message,
             'update': update,
             'context': context
-        }
-        
-        # Пауза 2 секунды для возможности получения следующего сообщения
-        await asyncio.sleep(2)
+        })
+    
+    async def process_message_burst(self, user_id: int, items):
+        """
+        Обрабатывает серию сообщений пользователя как одно напоминание
         
-        # Проверяем, не было ли удалено наше сообщение из буфера (значит, обработалось как пара)
-        if user_id not in self.last_user_messages:
-            logger.info(f"Сообщение {user_id} уже обработано как пара")
-            return
+        Args:
+            user_id: ID пользователя
+            items: Сообщения серии в порядке получения
+        """
+        notes = [item for item in items if not item['is_forwarded']]
+        forwards = [item for item in items if item['is_forwarded']]
         
-        # Проверяем, не появилось ли более свежее сообщение от этого пользователя
-        current_data = self.last_user_messages.get(user_id)
-        if current_data and current_data['timestamp'] > current_time:
-            # Появилось более свежее сообщение - значит, наше уже обрабатывается парой
-            logger.info(f"Обнаружено более свежее сообщение - наше уже в паре")
+        if len(items) == 1:
+            item = items[0]
+            if item['is_forwarded']:
+                await self.process_single_forwarded(item['update'], item['context'], item['message'])
+            else:
+                await self.process_single_message(item['message'], item['update'], item['context'])
             return
         
-        # Не пришло второго сообщения - обрабатываем как одиночное
-        if is_forwarded:
-            await self.process_single_forwarded(update, context, message_text)
+        if notes:
+            # Пояснение + пересланные (в любом порядке): пересланные уходят в комментарий
+            first_message = "\n".join(item['message'] for item in notes)
+            second_message = "\n\n".join(item['message'] for item in forwards)
+            logger.info(f"Обрабатываем серию из {len(items)} сообщений: первое='{first_message}', второе='{second_message}'")
+            await self.handle_message_pair(first_message, second_message, notes[0]['update'], notes[0]['context'])
         else:
-            await self.process_single_message(message_text, update, context)
-        
-        # Очищаем буфер
-        self.last_user_messages.pop(user_id, None)
+            # Несколько пересланных подряд без пояснения — одно напоминание по всем
+            forwarded_text = "\n\n".join(item['message'] for item in forwards)
+            await self.process_single_forwarded(forwards[0]['update'], forwards[0]['context'], forwarded_text)
     
     async def process_single_forwarded(self, update: Update, context: ContextTypes.DEFAULT_TYPE, forwarded_text: str):
         """Обрабатывает одиночное пересланное сообщение"""
@@ -241,7 +308,7 @@ class ReminderBot:
         try:
             # Готовим ввод и извлекаем через общий метод
             gpt_input = self._build_forwarded_gpt_input(forwarded_text)
-            reminder_info, err = self._extract_and_validate(gpt_input)
+            reminder_info, err = await self._extract_and_validate(gpt_input)
             if not reminder_info:
                 await processing_message.edit_text(
                     (f"❌ Не удалось распознать напоминание в пересылаемом сообщении:\n<i>{forwarded_text}</i>"
@@ -280,12 +347,17 @@ class ReminderBot:
             forward_from_str = _format_forward_origin(forwarded_message)
 
             # Сохраняем: текст из reminder_info, а ПОЛНЫЙ пересланный + источник — в comment (6 столбец)
-            row_number = self.google_sheets.add_reminder(
+            comment = f"От: {forward_from_str}\n\n{forwarded_text}"
+            row_number = await self.io_executor.run(
+                STORAGE, self.google_sheets.add_reminder,
                 datetime_str=reminder_info.get('datetime'),
                 text=reminder_info['text'],
                 timezone=reminder_info.get('timezone', 'Europe/Moscow'),
-                comment=f"От: {forward_from_str}\n\n{forwarded_text}"
+                comment=comment,
+                chat_id=update.effective_chat.id,
+                user_id=update.effective_user.id
             )
+            self._schedule_reminder(row_number, reminder_info, comment, update)
             
             if row_number:
                 # Сохраняем для inline-кнопок
@@ -339,7 +411,7 @@ class ReminderBot:
         
         try:
             # Извлекаем информацию о напоминании из первого сообщения (общий метод)
-            reminder_info, err = self._extract_and_validate(first_message)
+            reminder_info, err = await self._extract_and_validate(first_message)
             if not reminder_info:
                 await processing_message.edit_text(
                     ("❌ Не удалось распознать напоминание в первом сообщении.\n\nПопробуйте указать время более четко."
@@ -351,12 +423,16 @@ class ReminderBot:
                 
             # Добавляем напоминание в Google Sheets с комментарием
             logger.info(f"Добавляем напоминание с комментарием: '{second_message}'")
-            row_number = self.google_sheets.add_reminder(
+            row_number = await self.io_executor.run(
+                STORAGE, self.google_sheets.add_reminder,
                 datetime_str=reminder_info.get('datetime'),  # Может быть None
                 text=reminder_info['text'],
                 timezone=reminder_info.get('timezone', 'Europe/Moscow'),
-                comment=second_message  # Второе сообщение как комментарий
+                comment=second_message,  # Второе сообщение как комментарий
+                chat_id=update.effective_chat.id,
+                user_id=update.effective_user.id
             )
+            self._schedule_reminder(row_number, reminder_info, second_message, update)
             
             if row_number:
                 # Сохраняем информацию о последнем напоминании для кнопок
@@ -411,7 +487,7 @@ class ReminderBot:
         
         try:
             # Унифицированное извлечение + валидация
-            reminder_info, err = self._extract_and_validate(user_message)
+            reminder_info, err = await self._extract_and_validate(user_message)
             if not reminder_info:
                 await processing_message.edit_text(
                     ("❌ Не удалось распознать напоминание в вашем сообщении.\n\n"
@@ -425,12 +501,16 @@ class ReminderBot:
                 return
                 
             # Добавляем напоминание в Google Sheets
-            row_number = self.google_sheets.add_reminder(
+            row_number = await self.io_executor.run(
+                STORAGE, self.google_sheets.add_reminder,
                 datetime_str=reminder_info.get('datetime'),  # Может быть None
                 text=reminder_info['text'],
                 timezone=reminder_info.get('timezone', 'Europe/Moscow'),
-                comment=''  # Пустой комментарий для обычных сообщений
+                comment='',  # Пустой комментарий для обычных сообщений
+                chat_id=update.effective_chat.id,
+                user_id=update.effective_user.id
             )
+            self._schedule_reminder(row_number, reminder_info, update=update)
             
             if row_number:
                 # Сохраняем информацию о последнем напоминании для кнопок
@@ -485,9 +565,23 @@ class ReminderBot:
         # Отправляем сообщение о том, что обрабатываем
         processing_message = await update.message.reply_text("🎤 Обрабатываю голосовое сообщение...")
         
+        # Части длинного сообщения разбираются на напоминания, не дожидаясь остальных частей
+        segment_tasks = {}
+        
+        def on_segment(index: int, text: str):
+            segment_tasks[index] = asyncio.create_task(self._extract_and_validate(text))
+        
         try:
             # Распознаем речь
-            recognized_text = await self.voice_processor.process_voice_message(update, context)
+            try:
+                recognized_text = await self.voice_processor.process_voice_message(update, context, on_segment)
+            except PoolSaturated:
+                logger.warning(f"Очередь конвертации заполнена, голосовое сообщение пользователя {user_id} отклонено")
+                await processing_message.edit_text(
+                    "⏳ Сейчас обрабатывается слишком много голосовых сообщений.\n\n"
+                    "Отправьте сообщение ещё раз через минуту или напишите его текстом."
+                )
+                return
             
             if not recognized_text:
                 await processing_message.edit_text(
@@ -502,8 +596,14 @@ class ReminderBot:
             # Обновляем сообщение о распознанном тексте
             await processing_message.edit_text(f"🎤 <b>Распознанный текст:</b>\n<i>{recognized_text}</i>\n\n🤔 Обрабатываю напоминание...", parse_mode='HTML')
             
+            # Продиктованный список: каждая часть со своим временем становится отдельным напоминанием
+            segment_reminders = await self._collect_segment_reminders(segment_tasks)
+            if segment_reminders:
+                await self._save_voice_reminders(update, processing_message, recognized_text, segment_reminders)
+                return
+            
             # Унифицированное извлечение + валидация
-            reminder_info, err = self._extract_and_validate(recognized_text)
+            reminder_info, err = await self._extract_and_validate(recognized_text)
             if not reminder_info:
                 await processing_message.edit_text(
                     (f"❌ Не удалось распознать напоминание в тексте:\n<i>{recognized_text}</i>\n\n"
@@ -517,11 +617,15 @@ class ReminderBot:
                 return
                 
             # Добавляем напоминание в Google Sheets
-            success = self.google_sheets.add_reminder(
+            success = await self.io_executor.run(
+                STORAGE, self.google_sheets.add_reminder,
                 datetime_str=reminder_info.get('datetime'),  # Может быть None
                 text=reminder_info['text'],
-                timezone=reminder_info.get('timezone', 'Europe/Moscow')
+                timezone=reminder_info.get('timezone', 'Europe/Moscow'),
+                chat_id=update.effective_chat.id,
+                user_id=update.effective_user.id
             )
+            self._schedule_reminder(success, reminder_info, update=update)
             
             if success:
                 # Форматируем время для отображения
@@ -557,6 +661,59 @@ class ReminderBot:
             await processing_message.edit_text(
                 "❌ Произошла ошибка при обработке голосового сообщения. Попробуйте позже."
             )
+        finally:
+            for task in segment_tasks.values():
+                task.cancel()
+    
+    async def _collect_segment_reminders(self, segment_tasks):
+        """
+        Собирает напоминания, извлечённые из частей длинного голосового сообщения
+        
+        Returns:
+            Список reminder_info в порядке частей, если хотя бы в двух частях есть напоминание со временем;
+            иначе пустой список — тогда сообщение разбирается целиком как одно напоминание
+        """
+        if len(segment_tasks) < 2:
+            return []
+        indexes = sorted(segment_tasks)
+        results = await asyncio.gather(*(segment_tasks[i] for i in indexes), return_exceptions=True)
+        reminders = [info for info, _ in (r for r in results if isinstance(r, tuple)) if info]
+        if sum(1 for info in reminders if info.get('datetime')) < 2:
+            return []
+        return reminders
+    
+    async def _save_voice_reminders(self, update: Update, processing_message, recognized_text: str, reminders):
+        """Сохраняет несколько напоминаний из одного голосового сообщения и отвечает общим списком"""
+        from datetime import datetime
+        # По одному, чтобы строки в таблице шли в порядке диктовки
+        rows = []
+        for info in reminders:
+            rows.append(await self.io_executor.run(
+                STORAGE, self.google_sheets.add_reminder,
+                datetime_str=info.get('datetime'),
+                text=info['text'],
+                timezone=info.get('timezone', 'Europe/Moscow'),
+                chat_id=update.effective_chat.id,
+                user_id=update.effective_user.id
+            ))
+        
+        lines = []
+        for row, info in zip(rows, reminders):
+            self._schedule_reminder(row, info, update=update)
+            if not row:
+                lines.append(f"❌ {info['text']} — не сохранено")
+            elif info.get('datetime'):
+                dt = datetime.strptime(info['datetime'], '%Y-%m-%d %H:%M:%S')
+                lines.append(f"⏰ {dt.strftime('%d.%m.%Y в %H:%M')} — {info['text']}")
+            else:
+                lines.append(f"⚠️ без времени — {info['text']}")
+        saved = sum(1 for row in rows if row)
+        
+        await processing_message.edit_text(
+            f"✅ <b>Добавлено напоминаний из голосового сообщения: {saved} из {len(reminders)}</b>\n\n"
+            f"🎤 <b>Распознанный текст:</b> {recognized_text}\n\n" + "\n".join(lines),
+            parse_mode='HTML'
+        )
     
     async def handle_callback_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик inline-кнопок"""
@@ -575,161 +732,82 @@ class ReminderBot:
             logger.error(f"Ошибка при обработке callback: {e}")
             await update.callback_query.answer("❌ Произошла ошибка при обработке действия.")
     
-    # async def handle_forwarded_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-    #     """Обработчик пересылаемых сообщений"""
-        user_id = update.effective_user.id
-        forwarded_message = update.message
-        
-        logger.info(f"Получено пересылаемое сообщение от пользователя {user_id}")
-        
-        # Получаем текст пересылаемого сообщения
-        forwarded_text = forwarded_message.text or forwarded_message.caption or "Пересланное сообщение без текста"
-        
-        # Проверяем, было ли недавно обычное сообщение от этого пользователя
-        if user_id in self.last_user_messages:
-            import time
-            last_msg_data = self.last_user_messages[user_id]
-            time_diff = time.time() - last_msg_data['timestamp']
-            
-            # Если прошло меньше таймаута - связываем сообщения
-            if time_diff < self.MESSAGE_LINK_TIMEOUT:
-                # НЕ удаляем здесь - это сделает handle_message_pair
-                
-                # Обрабатываем пару сообщений
-                await self.handle_message_pair(
-                    last_msg_data['message'], 
-                    forwarded_text, 
-                    last_msg_data['update'], 
-                    last_msg_data['context']
-                )
-                return
-        
-        # Нет недавнего сообщения - обрабатываем пересылаемое как обычное напоминание
-        processing_message = await update.message.reply_text("📎 Обрабатываю пересылаемое сообщение...")
-        
-        try:
-            # Проверяем, есть ли ожидающее поясняющее сообщение для этого пользователя (старая логика)
-            if False:  # Отключаем старую логику
-                # Есть ожидающее поясняющее сообщение - объединяем их
-                explanatory_data = self.pending_explanatory_messages[user_id]
-                explanatory_message = explanatory_data['message']
-                reminder_data = explanatory_data['reminder_data']
-                
-                # Обновляем напоминание с комментарием
-                success = self.google_sheets.update_reminder_comment(reminder_data['row'], forwarded_text)
-                
-                if success:
-                    # Очищаем ожидающее сообщение
-                    del self.pending_explanatory_messages[user_id]
-                    
-                    # Формируем сообщение об успехе
-                    success_message = (
-                        f"✅ <b>Напоминание обновлено с пересылаемым сообщением!</b>\n\n"
-                        f"📝 <b>Текст напоминания:</b> {reminder_data['text']}\n"
-                        f"📎 <b>Пересланное сообщение:</b> {forwarded_text[:100]}{'...' if len(forwarded_text) > 100 else ''}\n\n"
-                        f"🔔 Напоминание будет отправлено в указанное время с пересылаемым сообщением."
-                    )
-                    
-                    await processing_message.edit_text(success_message, parse_mode='HTML')
-                    return
-                else:
-                    await processing_message.edit_text("❌ Ошибка при обновлении напоминания. Попробуйте позже.")
-                    return
-            
-            # Нет ожидающего поясняющего сообщения - обрабатываем как обычное напоминание
-            # Извлекаем информацию о напоминании с помощью ChatGPT
-            reminder_info = self.message_processor.extract_reminder_info(forwarded_text)
-            
-            if reminder_info is None:
-                await processing_message.edit_text(
-                    f"❌ Не удалось распознать напоминание в пересылаемом сообщении:\n<i>{forwarded_text}</i>\n\n"
-                    "Попробуйте добавить поясняющее сообщение с указанием времени.",
-                    parse_mode='HTML'
-                )
-                return
-                
-            # Валидируем информацию
-            is_valid, error_message = self.message_processor.validate_reminder_info(reminder_info)
-            
-            if not is_valid:
-                logger.warning(f"Ошибка валидации для пользователя {user_id}: {error_message}")
-                await processing_message.edit_text(
-                    f"🤔 <b>Не удалось создать напоминание</b>\n\n"
-                    f"<i>Причина:</i> {error_message}\n\n"
-                    f"💡 <b>Попробуйте добавить поясняющее сообщение с указанием времени.</b>",
-                    parse_mode='HTML'
-                )
-                return
-                
-            # Добавляем напоминание в Google Sheets с комментарием
-            row_number = self.google_sheets.add_reminder(
-                datetime_str=reminder_info['datetime'],
-                text=reminder_info['text'],
-                timezone=reminder_info.get('timezone', 'Europe/Moscow'),
-                comment=forwarded_text  # Пересылаемое сообщение как комментарий
-            )
-            
-            if row_number:
-                # Сохраняем информацию о последнем напоминании для кнопок
-                reminder_data = {
-                    'row': row_number,
-                    'datetime': reminder_info.get('datetime'),  # Может быть None
-                    'text': reminder_info['text'],
-                    'timezone': reminder_info.get('timezone', 'Europe/Moscow')
-                }
-                self.inline_button_handler.set_last_reminder(user_id, reminder_data)
-                
-                # Форматируем время для отображения
-                from datetime import datetime
-                timezone = reminder_info.get('timezone', 'Europe/Moscow')
-                text = reminder_info['text']
-                
-                # Проверяем, есть ли время
-                if reminder_info.get('datetime'):
-                    dt = datetime.strptime(reminder_info['datetime'], '%Y-%m-%d %H:%M:%S')
-                    formatted_time = dt.strftime('%d.%m.%Y в %H:%M')
-                    time_info = f"⏰ <b>Время:</b> {formatted_time}\n🌍 <b>Часовой пояс:</b> {timezone}\n\n🔔 Вы получите уведомление в указанное время."
-                    table_info = f"<code>{reminder_info['datetime']} | {text} | {timezone} | FALSE | | {forwarded_text[:50]}...</code>"
-                else:
-                    time_info = "⚠️ <b>Время не указано</b> - напоминание создано без даты и времени"
-                    table_info = f"<code> | {text} | {timezone} | FALSE | | {forwarded_text[:50]}...</code>"
-                
-                success_message = (
-                    f"✅ <b>Напоминание добавлено из пересылаемого сообщения!</b>\n\n"
-                    f"📎 <b>Пересланное сообщение:</b> {forwarded_text[:100]}{'...' if len(forwarded_text) > 100 else ''}\n\n"
-                    f"📝 <b>Текст напоминания:</b> {text}\n"
-                    f"{time_info}\n\n"
-                    f"📊 <i>Строка в таблице:</i>\n"
-                    f"{table_info}"
-                )
-                
-                await processing_message.edit_text(success_message, parse_mode='HTML')
-            else:
-                await processing_message.edit_text("❌ Ошибка при сохранении напоминания. Попробуйте позже.")
-                
-        except Exception as e:
-            logger.error(f"Ошибка при обработке пересылаемого сообщения: {e}")
-            await processing_message.edit_text(
-                "❌ Произошла ошибка при обработке пересылаемого сообщения. Попробуйте позже."
-            )
-            
     def run(self):
         """Запуск бота"""
         logger.info("Запуск Telegram бота...")
         self.application.run_polling()
 
-    async def run_async(self):
-        """Запуск Telegram бота в существующем event loop"""
+    async def run_async(self, webhook_url: str = None, listen: str = '0.0.0.0', port: int = 8443,
+                        secret_token: str = None, on_start: Optional[Callable[[], Awaitable[None]]] = None,
+                        on_stop: Optional[Callable[[], Awaitable[None]]] = None):
+        """
+        Запуск Telegram бота в существующем event loop
+
+        Работает до вызова stop(), затем дожидается обработки уже полученных сообщений.
+
+        Args:
+            webhook_url: Публичный адрес вебхука; None — long polling
+            listen: Адрес, на котором слушает сервер вебхука
+            port: Порт сервера вебхука
+            secret_token: Секрет, который Telegram передаёт в заголовке X-Telegram-Bot-Api-Secret-Token
+            on_start: Корутина, вызываемая, когда клиент бота готов к отправке сообщений
+            on_stop: Корутина, вызываемая при остановке, пока клиент бота ещё открыт
+                (например, чтобы дождаться отправки напоминаний)
+        """
         logger.info("Запуск Telegram бота (async)...")
         try:
             # Инициализируем и запускаем бота
+            if webhook_url and self.workers > 1:
+                # Серии сообщений и кнопки чата обрабатывает процесс, за которым чат закреплён
+                self.update_router = UpdateRouter(self.worker_index, self.workers, listen, port - self.worker_index,
+                                                  urlparse(webhook_url).path.lstrip('/'), secret_token)
+                self.application.add_handler(TypeHandler(Update, self.update_router.route), group=-1)
             await self.application.initialize()
             await self.application.start()
-            await self.application.updater.start_polling()
+            if on_start is not None:
+                await on_start()
+            if webhook_url:
+                # Сервер слушает тот же путь, что указан в публичном адресе
+                url_path = urlparse(webhook_url).path.lstrip('/')
+                await self.application.updater.start_webhook(
+                    listen=listen,
+                    port=port,
+                    url_path=url_path,
+                    webhook_url=webhook_url,
+                    secret_token=secret_token
+                )
+                logger.info(f"Вебхук: {webhook_url} (слушаем {listen}:{port}/{url_path})")
+            else:
+                await self.application.updater.start_polling()
             
-            # Ждем бесконечно (бот будет работать в фоне)
-            while True:
-                await asyncio.sleep(1)
+            await self._stop_event.wait()
         except Exception as e:
             logger.error(f"Ошибка запуска Telegram бота: {e}")
-            raise 
\ No newline at end of file
+            raise
+        finally:
+            await self._shutdown(on_stop)
+
+    def stop(self):
+        """Просит run_async завершиться (можно вызывать из обработчика сигнала)"""
+        self._stop_event.set()
+
+    async def _shutdown(self, on_stop: Optional[Callable[[], Awaitable[None]]] = None):
+        # Сначала перестаём принимать обновления, затем дорабатываем уже принятые:
+        # очередь обновлений, серии сообщений в коалесцере, отправку напоминаний (on_stop),
+        # и только потом закрываем бота вместе с его HTTP-клиентом
+        logger.info("Остановка Telegram бота: дожидаемся обработки полученных сообщений...")
+        try:
+            if self.application.updater and self.application.updater.running:
+                await self.application.updater.stop()
+            if self.application.running:
+                await self.application.stop()
+            await self.message_coalescer.drain()
+        finally:
+            try:
+                if on_stop is not None:
+                    await on_stop()
+            finally:
+                await self.application.shutdown()
+                if self.update_router is not None:
+                    await self.update_router.close()
+        logger.info("Telegram бот остановлен")
@@ -66,18 +66,43 @@ async def test_message_processor():
         logger.error(f"❌ Ошибка тестирования MessageProcessor: {e}")
         return False
 
+def test_extraction_cache():
+    """Проверка кэша извлечения: относительное время со временем суток не переносится на другой момент"""
+    logger.info("🧪 Проверка кэша извлечения напоминаний...")
+    
+    from datetime import datetime
+    from extraction_cache import ExtractionCache
+    
+    cache = ExtractionCache()
+    asked = datetime(2025, 1, 10, 10, 0)
+    cache.put("Через 2 дня вечером позвонить маме",
+              {'text': 'Позвонить маме', 'datetime': '2025-01-12 19:00:00'}, asked)
+    cache.put("Через 2 часа выключить духовку",
+              {'text': 'Выключить духовку', 'datetime': '2025-01-10 12:00:00'}, asked)
+    
+    # На следующий день "через 2 дня вечером" — уже другая дата, а "через 2 часа" — смещение от запроса
+    later = datetime(2025, 1, 11, 9, 0)
+    day_part = cache.get("через 2 дня вечером позвонить маме", later)
+    offset = cache.get("через 2 часа выключить духовку", later)
+    if day_part is not None:
+        logger.error(f"❌ Относительное время со временем суток взято из кэша: {day_part}")
+        return False
+    if not offset or offset['datetime'] != '2025-01-11 11:00:00':
+        logger.error(f"❌ Смещение пересчитано неверно: {offset}")
+        return False
+    logger.info("✅ Кэш извлечения работает")
+    return True
+
 def test_dependencies():
     """Проверка зависимостей"""
     logger.info("🧪 Проверка зависимостей...")
     
     dependencies = [
-        ('requests', 'requests'),
         ('openai', 'openai'),
         ('telegram', 'python-telegram-bot'),
         ('pydub', 'pydub'),
         ('dotenv', 'python-dotenv'),
         ('gspread', 'gspread'),
-        ('pandas', 'pandas'),
         ('pytz', 'pytz'),
         ('apscheduler', 'apscheduler')
     ]
@@ -136,6 +161,18 @@ async def test_audio_conversion():
     
     return True
 
+def test_local_stt():
+    """Проверка локального распознавания речи (необязательно)"""
+    logger.info("🧪 Проверка локального распознавания речи...")
+    
+    from stt_backends import FASTER_WHISPER_AVAILABLE
+    
+    if not FASTER_WHISPER_AVAILABLE:
+        logger.info("ℹ️ faster-whisper не установлен — распознавание только через OpenAI (STT_BACKEND=openai)")
+    else:
+        logger.info("✅ faster-whisper доступен (STT_BACKEND=local или auto)")
+    return True
+
 async def main():
     """Основная функция тестирования"""
     logger.info("🚀 Начинаем локальное тестирование...")
@@ -145,7 +182,9 @@ async def main():
         ("Переменные окружения", test_environment),
         ("VoiceProcessor", test_voice_processor),
         ("MessageProcessor", test_message_processor),
-        ("Конвертация аудио", test_audio_conversion)
+        ("Кэш извлечения", test_extraction_cache),
+        ("Конвертация аудио", test_audio_conversion),
+        ("Локальное распознавание", test_local_stt)
     ]
     
     results = []
@@ -0,0 +1,75 @@
+"""
+Общие заглушки для тестов: локальный HTTP-сервер вместо OpenAI и Telegram Bot API
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    HTTP-сервер, отвечающий JSON по пути запроса
+
+    routes: {путь: функция(тело запроса) -> объект ответа}; delay — пауза перед каждым ответом.
+    Все запросы записываются в calls как (путь, тело).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, routes):
+        super().__init__(('127.0.0.1', 0), _StubHandler)
+        self.routes = routes
+        self.delay = 0.0
+        self.calls = []
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.calls.append((self.path, body))
+        time.sleep(self.server.delay)
+        route = self.server.routes.get(self.path)
+        if route is None:
+            self.send_error(404)
+            return
+        out = json.dumps(route(body)).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # клиент уже отключился (таймаут или отмена)
+
+
+@pytest.fixture
+def stub_server():
+    """Фабрика заглушек: stub_server({путь: обработчик}) запускает сервер до конца теста"""
+    servers = []
+
+    def start(routes):
+        server = StubServer(routes)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
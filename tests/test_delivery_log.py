@@ -0,0 +1,123 @@
+"""
+Журнал доставки: восстановление после падения во время отправки и сверка с хранилищем
+"""
+
+import asyncio
+
+import pytest
+from telegram import Bot
+
+import main
+from delivery import DeliveryEngine
+from delivery_log import ACKED, DELIVERED, SENDING, UNKNOWN, DeliveryLog
+from io_executor import IOExecutor
+from reminder_store import SQLiteReminderStore
+
+TOKEN = '123:stub'
+
+
+def _ok(result) -> dict:
+    return {'ok': True, 'result': result}
+
+
+@pytest.fixture
+def telegram(stub_server):
+    return stub_server({
+        f'/bot{TOKEN}/getMe': lambda body: _ok({'id': 1, 'is_bot': True, 'first_name': 'stub', 'username': 'stub_bot'}),
+        f'/bot{TOKEN}/sendMessage': lambda body: _ok({'message_id': 1, 'date': 0,
+                                                       'chat': {'id': 42, 'type': 'private'}, 'text': 'ok'}),
+    })
+
+
+@pytest.fixture
+def app(tmp_path, telegram, monkeypatch):
+    """Глобальные объекты main.py: SQLite-хранилище, журнал доставки и отправка в заглушку Telegram"""
+    store = SQLiteReminderStore(str(tmp_path / 'reminders.sqlite3'))
+    log = DeliveryLog(str(tmp_path / 'delivery_log.sqlite3'))
+    executor = IOExecutor(4)
+    monkeypatch.setattr(main, 'store', store)
+    monkeypatch.setattr(main, 'delivery_log', log)
+    monkeypatch.setattr(main, 'io_executor', executor)
+    monkeypatch.setattr(main, 'bot_instance', None)
+    monkeypatch.setattr(main, 'delivery', DeliveryEngine(Bot(TOKEN, base_url=f"{telegram.url}/bot")))
+    yield main
+    executor.shutdown()
+    log.close()
+    store.close()
+
+
+def _sends(telegram) -> int:
+    return sum(1 for path, _ in telegram.calls if path.endswith('/sendMessage'))
+
+
+def _due_reminder(app) -> dict:
+    row = app.store.add_reminder('2020-01-01 10:00:00', 'Позвонить маме', chat_id=42, user_id=42)
+    return app.store.get_reminder_by_row(row)
+
+
+def test_reminder_is_delivered_once(app, telegram):
+    reminder = _due_reminder(app)
+
+    async def scenario():
+        await app.delivery.start()
+        return await app.deliver_reminder(reminder), await app.deliver_reminder(reminder)
+
+    assert asyncio.run(scenario()) == (True, True)
+    assert _sends(telegram) == 1
+    assert app.delivery_log.state(app.store.reminder_uid(reminder)) == ACKED
+    assert app.store.get_reminder_by_row(reminder['row'])['sent'] == 'TRUE'
+
+
+def test_crash_while_sending_is_not_resent(app, telegram):
+    reminder = _due_reminder(app)
+    uid = app.store.reminder_uid(reminder)
+    # Процесс упал после записи sending, до ответа Telegram
+    assert app.delivery_log.begin(uid, reminder['row'], 42)
+
+    async def scenario():
+        await app.delivery.start()
+        await app.reconcile_delivery_log()
+        return await app.deliver_reminder(reminder)
+
+    asyncio.run(scenario())
+    assert _sends(telegram) == 0
+    # Исход неизвестен: в хранилище напоминание отмечено, чтобы не попасть в очередь снова
+    assert app.delivery_log.state(uid) == ACKED
+    assert app.store.get_reminder_by_row(reminder['row'])['sent'] == 'TRUE'
+
+
+def test_reconcile_marks_delivered_reminder_as_sent(app):
+    reminder = _due_reminder(app)
+    uid = app.store.reminder_uid(reminder)
+    # Сообщение отправлено, но отметка в хранилище не записалась до перезапуска
+    app.delivery_log.begin(uid, reminder['row'], 42)
+    app.delivery_log.delivered(uid)
+
+    asyncio.run(app.reconcile_delivery_log())
+    assert app.delivery_log.state(uid) == ACKED
+    assert app.store.get_reminder_by_row(reminder['row'])['sent'] == 'TRUE'
+
+
+def test_reconcile_skips_foreign_row(app):
+    reminder = _due_reminder(app)
+    # Запись журнала относится к другому напоминанию с тем же номером (например, из старой базы)
+    app.delivery_log.begin('other-uid', reminder['row'], 42)
+    app.delivery_log.delivered('other-uid')
+
+    asyncio.run(app.reconcile_delivery_log())
+    assert app.delivery_log.state('other-uid') == ACKED
+    assert app.store.get_reminder_by_row(reminder['row'])['sent'] != 'TRUE'
+
+
+def test_failed_send_can_be_retried(tmp_path):
+    log = DeliveryLog(str(tmp_path / 'delivery_log.sqlite3'))
+    assert log.begin('uid-1')
+    assert not log.begin('uid-1')
+    log.failed('uid-1')
+    assert log.begin('uid-1')
+    assert log.state('uid-1') == SENDING
+    assert log.recover() == 1
+    assert log.state('uid-1') == UNKNOWN
+    log.delivered('uid-1')
+    assert log.unacknowledged() == [{'uid': 'uid-1', 'state': DELIVERED, 'row': None, 'chat_id': None}]
+    log.close()
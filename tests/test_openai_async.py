@@ -0,0 +1,66 @@
+"""
+Асинхронный клиент OpenAI: ответ, таймаут и отмена запроса (заглушка вместо API)
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from message_processor import MessageProcessor
+from openai_client import create_async_client
+
+REMINDER = {'text': 'Позвонить маме', 'datetime': '2030-01-01 10:00:00', 'timezone': 'Europe/Moscow'}
+
+
+def _completion(body: bytes) -> dict:
+    return {
+        'id': 'chatcmpl-stub', 'object': 'chat.completion', 'created': 0, 'model': 'gpt-3.5-turbo',
+        'choices': [{'index': 0, 'finish_reason': 'stop',
+                     'message': {'role': 'assistant', 'content': json.dumps(REMINDER, ensure_ascii=False)}}],
+    }
+
+
+@pytest.fixture
+def openai_stub(stub_server):
+    return stub_server({'/v1/chat/completions': _completion})
+
+
+def _processor(server, timeout: float) -> MessageProcessor:
+    client = create_async_client('sk-test', base_url=f"{server.url}/v1", timeout=timeout, max_retries=0)
+    return MessageProcessor('sk-test', client, request_timeout=timeout, fast_path=False)
+
+
+def test_extract_async_returns_parsed_reminder(openai_stub):
+    processor = _processor(openai_stub, timeout=5)
+
+    assert asyncio.run(processor.extract_reminder_info_async('позвони маме')) == REMINDER
+    assert len(openai_stub.calls) == 1
+
+
+def test_extract_async_timeout_returns_none(openai_stub):
+    openai_stub.delay = 3
+    processor = _processor(openai_stub, timeout=0.3)
+
+    started = time.monotonic()
+    assert asyncio.run(processor.extract_reminder_info_async('позвони маме')) is None
+    assert time.monotonic() - started < 2
+
+
+def test_extract_async_cancellation_aborts_request(openai_stub):
+    openai_stub.delay = 3
+    processor = _processor(openai_stub, timeout=10)
+
+    async def cancel_in_flight():
+        task = asyncio.create_task(processor.extract_reminder_info_async('позвони маме'))
+        while not openai_stub.calls:
+            await asyncio.sleep(0.01)
+        started = time.monotonic()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return time.monotonic() - started
+
+    # Отмена не ждёт ответа сервера
+    assert asyncio.run(cancel_in_flight()) < 1
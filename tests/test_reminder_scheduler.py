@@ -0,0 +1,137 @@
+"""
+Планировщик напоминаний: перезагрузка очереди во время изменений, повтор доставки, остановка
+"""
+
+import asyncio
+import time
+
+from reminder_scheduler import ReminderScheduler
+
+
+def _reminder(row: int, delay: float = 0.0) -> dict:
+    return {'row': row, 'text': f'напоминание {row}', 'due_utc': time.time() + delay}
+
+
+async def _start(scheduler: ReminderScheduler) -> asyncio.Task:
+    task = asyncio.create_task(scheduler.run())
+    await asyncio.sleep(0)
+    return task
+
+
+async def _stop(scheduler: ReminderScheduler, task: asyncio.Task) -> None:
+    scheduler.stop()
+    await task
+
+
+def test_changes_during_load_survive_reload():
+    async def scenario():
+        reading = asyncio.Event()
+        release = asyncio.Event()
+
+        async def load_reminders():
+            reading.set()
+            await release.wait()
+            # Ответ хранилища прочитан до изменений: без строки 2 и со строкой 3
+            return [_reminder(1, 60), _reminder(3, 60)]
+
+        async def deliver(reminder):
+            return True
+
+        scheduler = ReminderScheduler(load_reminders, deliver)
+        task = await _start(scheduler)
+        load = asyncio.create_task(scheduler.load())
+        await reading.wait()
+        scheduler.add(_reminder(2, 60))
+        scheduler.remove(3)
+        release.set()
+        await load
+        rows = sorted(scheduler._reminders)
+        await _stop(scheduler, task)
+        return rows
+
+    assert asyncio.run(scenario()) == [1, 2]
+
+
+def test_failed_delivery_is_retried():
+    async def scenario():
+        attempts = []
+
+        async def deliver(reminder):
+            attempts.append(reminder['row'])
+            return len(attempts) > 1
+
+        async def load_reminders():
+            return [_reminder(1)]
+
+        scheduler = ReminderScheduler(load_reminders, deliver, retry_delay=0.05)
+        task = await _start(scheduler)
+        await scheduler.load()
+        for _ in range(100):
+            if len(attempts) >= 2:
+                break
+            await asyncio.sleep(0.02)
+        await _stop(scheduler, task)
+        return attempts, len(scheduler)
+
+    assert asyncio.run(scenario()) == ([1, 1], 0)
+
+
+def test_reload_skips_reminders_being_delivered():
+    async def scenario():
+        sending = asyncio.Event()
+        release = asyncio.Event()
+        delivered = []
+
+        async def deliver(reminder):
+            sending.set()
+            await release.wait()
+            delivered.append(reminder['row'])
+            return True
+
+        async def load_reminders():
+            # Хранилище ещё не отметило строку 1 отправленной
+            return [_reminder(1)]
+
+        scheduler = ReminderScheduler(load_reminders, deliver)
+        task = await _start(scheduler)
+        await scheduler.load()
+        await sending.wait()
+        await scheduler.load()
+        queued = len(scheduler)
+        release.set()
+        await _stop(scheduler, task)
+        await scheduler.drain()
+        return queued, delivered
+
+    assert asyncio.run(scenario()) == (0, [1])
+
+
+def test_drain_waits_for_delivery_and_cancels_after_timeout():
+    async def scenario():
+        finished, cancelled = [], []
+
+        async def deliver(reminder):
+            try:
+                await asyncio.sleep(0.1 if reminder['row'] == 1 else 10)
+            except asyncio.CancelledError:
+                cancelled.append(reminder['row'])
+                raise
+            finished.append(reminder['row'])
+            return True
+
+        async def load_reminders():
+            return [_reminder(1), _reminder(2, 0.01)]
+
+        scheduler = ReminderScheduler(load_reminders, deliver)
+        task = await _start(scheduler)
+        await scheduler.load()
+        await asyncio.sleep(0.05)
+        await _stop(scheduler, task)
+        started = time.monotonic()
+        await scheduler.drain(0.5)
+        return finished, cancelled, time.monotonic() - started
+
+    finished, cancelled, elapsed = asyncio.run(scenario())
+    assert finished == [1]
+    assert cancelled == [2]
+    assert elapsed < 2
@@ -0,0 +1,127 @@
+"""
+Бэкенды распознавания речи: выбор по длительности, переход на другой бэкенд, пул процессов
+"""
+
+import asyncio
+import io
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from openai_client import create_async_client
+from process_pool import SpawnPool
+from stt_backends import DurationRouter, TranscriptionBackend, WhisperAPIBackend
+from voice_processor import VoiceProcessor
+
+
+class StubBackend(TranscriptionBackend):
+    def __init__(self, name: str, text=None, busy: bool = False):
+        self.name = name
+        self.text = text
+        self._busy = busy
+        self.calls = []
+
+    @property
+    def busy(self) -> bool:
+        return self._busy
+
+    async def transcribe(self, audio, duration=None):
+        self.calls.append(audio.read())
+        return self.text
+
+
+def _audio() -> io.BytesIO:
+    audio = io.BytesIO(b'OggS-voice')
+    audio.name = 'voice.ogg'
+    return audio
+
+
+def test_router_selects_backend_by_duration():
+    local, api = StubBackend('local'), StubBackend('openai')
+    router = DurationRouter(local, api, max_short_duration=30)
+
+    assert router.select(10) is local
+    assert router.select(30) is local
+    assert router.select(31) is api
+    assert router.select(None) is api
+
+
+def test_router_skips_busy_short_backend():
+    api = StubBackend('openai')
+
+    assert DurationRouter(StubBackend('local', busy=True), api).select(5) is api
+    # Оба заняты — короткое сообщение ждёт локальный бэкенд
+    busy_api = StubBackend('openai', busy=True)
+    local = StubBackend('local', busy=True)
+    assert DurationRouter(local, busy_api).select(5) is local
+
+
+def test_router_falls_back_with_rewound_audio():
+    local, api = StubBackend('local'), StubBackend('openai', text='купить хлеб')
+    router = DurationRouter(local, api)
+
+    assert asyncio.run(router.transcribe(_audio(), 5)) == 'купить хлеб'
+    assert local.calls == api.calls == [b'OggS-voice']
+
+
+def test_router_without_fallback_returns_none():
+    api = StubBackend('openai', text='купить хлеб')
+    router = DurationRouter(StubBackend('local'), api, fallback=False)
+
+    assert asyncio.run(router.transcribe(_audio(), 5)) is None
+    assert not api.calls
+
+
+def test_voice_processor_backend_selection():
+    api, local = StubBackend('openai'), StubBackend('local')
+
+    assert VoiceProcessor._create_backend(api, None, 30) is api
+    assert VoiceProcessor._create_backend(api, local, None) is local
+    router = VoiceProcessor._create_backend(api, local, 30)
+    assert isinstance(router, DurationRouter)
+    assert (router.short_backend, router.long_backend, router.max_short_duration) == (local, api, 30)
+
+
+def test_local_failure_falls_back_to_whisper_api(stub_server):
+    server = stub_server({'/v1/audio/transcriptions': lambda body: {'text': ' купить хлеб '}})
+    client = create_async_client('sk-test', base_url=f"{server.url}/v1", timeout=5, max_retries=0)
+    router = DurationRouter(StubBackend('local'), WhisperAPIBackend('sk-test', client, timeout=5))
+
+    assert asyncio.run(router.transcribe(_audio(), 5)) == 'купить хлеб'
+    path, body = server.calls[0]
+    assert b'OggS-voice' in body
+
+
+@pytest.fixture
+def pool():
+    pool = SpawnPool(1, kill_on_timeout=True)
+    yield pool
+    pool.shutdown()
+
+
+def test_pool_kills_hung_worker_on_timeout(pool):
+    async def scenario():
+        first = await pool.run(30, os.getpid)
+        started = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run(0.5, time.sleep, 60)
+        assert time.monotonic() - started < 5
+        # Зависший процесс завершён: следующее задание выполняется в новом процессе сразу
+        second = await pool.run(30, os.getpid)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first != second
+    assert pool.pending == 0
+
+
+def test_pool_recovers_after_worker_crash(pool):
+    async def scenario():
+        with pytest.raises(BrokenProcessPool):
+            await pool.run(30, os._exit, 1)
+        return await pool.run(30, os.getpid)
+
+    assert asyncio.run(scenario()) != os.getpid()
+    assert pool.pending == 0
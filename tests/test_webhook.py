@@ -0,0 +1,78 @@
+"""
+Режим вебхука: проверка секрета, обработка обновления и остановка (заглушка вместо Bot API)
+"""
+
+import asyncio
+import json
+import socket
+import urllib.parse
+
+import httpx
+import pytest
+
+from reminder_store import ReminderStore
+from telegram_bot import ReminderBot
+
+TOKEN = '123:stub'
+SECRET = 'test-secret'
+
+
+def _ok(result) -> dict:
+    return {'ok': True, 'result': result}
+
+
+def _send_message(body: bytes) -> dict:
+    fields = dict(urllib.parse.parse_qsl(body.decode())) if not body.startswith(b'{') else json.loads(body)
+    return _ok({'message_id': 1, 'date': 0, 'chat': {'id': int(fields.get('chat_id', 7)), 'type': 'private'},
+                'text': fields.get('text', '')})
+
+
+@pytest.fixture
+def telegram(stub_server):
+    routes = {f'/bot{TOKEN}/{method}': (lambda body: _ok(True))
+              for method in ('setWebhook', 'deleteWebhook', 'setMyCommands')}
+    routes[f'/bot{TOKEN}/getMe'] = lambda body: _ok({'id': 1, 'is_bot': True, 'first_name': 'stub',
+                                                     'username': 'stub_bot'})
+    routes[f'/bot{TOKEN}/sendMessage'] = _send_message
+    return stub_server(routes)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _start_update(update_id: int) -> dict:
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': '/start',
+        'chat': {'id': 7, 'type': 'private'}, 'from': {'id': 7, 'is_bot': False, 'first_name': 'Test'},
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+    }}
+
+
+def test_webhook_checks_secret_and_processes_update(telegram):
+    port = _free_port()
+    bot = ReminderBot(TOKEN, 'sk-test', ReminderStore(), telegram_base_url=f"{telegram.url}/bot")
+
+    async def scenario():
+        task = asyncio.create_task(bot.run_async('https://example.com/telegram', '127.0.0.1', port, SECRET))
+        url = f"http://127.0.0.1:{port}/telegram"
+        async with httpx.AsyncClient() as client:
+            for _ in range(100):
+                try:
+                    await client.get(url)
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.05)
+            rejected = await client.post(url, json=_start_update(1))
+            accepted = await client.post(url, json=_start_update(2), headers={'X-Telegram-Bot-Api-Secret-Token': SECRET})
+        # Остановка дорабатывает принятое обновление
+        bot.stop()
+        await asyncio.wait_for(task, 10)
+        return rejected.status_code, accepted.status_code
+
+    assert asyncio.run(scenario()) == (403, 200)
+    methods = [path.rsplit('/', 1)[-1] for path, _ in telegram.calls]
+    assert 'setWebhook' in methods
+    assert methods.count('sendMessage') == 1
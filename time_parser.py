@@ -0,0 +1,324 @@
+"""
+Локальный разбор простых напоминаний без обращения к ChatGPT
+
+Понимает только однозначные конструкции из примеров системного промпта:
+"через 2 часа", "завтра в 15:00", "в пятницу в 14:30", "20 января в 14:30", "в 10 утра".
+Если в сообщении есть хоть что-то, в чём разбор не уверен, возвращается None,
+и сообщение обрабатывается ChatGPT как раньше.
+"""
+
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import pytz
+
+from time_utils import get_timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEZONE = 'Europe/Moscow'
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Длинные и многострочные тексты (пересланные сообщения, уточняющие промпты) не разбираем
+MAX_MESSAGE_LENGTH = 200
+
+NUMBER_WORDS = {
+    'один': 1, 'одну': 1, 'одна': 1, 'пару': 2, 'два': 2, 'две': 2, 'три': 3, 'четыре': 4,
+    'пять': 5, 'шесть': 6, 'семь': 7, 'восемь': 8, 'девять': 9, 'десять': 10,
+    'пятнадцать': 15, 'двадцать': 20, 'тридцать': 30, 'сорок': 40, 'пятьдесят': 50,
+}
+
+WEEKDAYS = {
+    'понедельник': 0, 'вторник': 1, 'среду': 2, 'четверг': 3,
+    'пятницу': 4, 'субботу': 5, 'воскресенье': 6,
+}
+
+MONTHS = {
+    'января': 1, 'февраля': 2, 'марта': 3, 'апреля': 4, 'мая': 5, 'июня': 6,
+    'июля': 7, 'августа': 8, 'сентября': 9, 'октября': 10, 'ноября': 11, 'декабря': 12,
+}
+
+DAY_OFFSETS = {'сегодня': 0, 'завтра': 1, 'послезавтра': 2}
+
+_NUM = r'\d{1,3}|' + '|'.join(NUMBER_WORDS)
+
+RELATIVE_RE = re.compile(
+    r'\bчерез\s+(?:(?P<half>полчаса|полтора\s+часа)'
+    rf'|(?:(?P<num>{_NUM})\s+)?(?P<unit>минуту|минуты|минут|мин|часа|часов|час|дня|дней|день|неделю|недели|недель))\b'
+)
+TIME_RE = re.compile(
+    r'(?:\bв\s+(?P<h>\d{1,2})(?:[:.](?P<m>\d{2}))?(?:\s*(?P<part>утра|дня|вечера|ночи)|\s*(?P<hours>часа|часов|час))?'
+    r'|\b(?P<h2>\d{1,2}):(?P<m2>\d{2}))\b'
+)
+DAY_RE = re.compile(r'\b(?P<day>сегодня|послезавтра|завтра)\b')
+WEEKDAY_RE = re.compile(r'\bв(?:о)?\s+(?P<weekday>' + '|'.join(WEEKDAYS) + r')\b')
+DATE_RE = re.compile(r'\b(?P<d>\d{1,2})\s+(?P<month>' + '|'.join(MONTHS) + r')\b')
+
+# Слова, при которых смысл времени может быть сложнее, чем видит разбор
+UNSURE_RE = re.compile(
+    r'\b(за|до|после|перед|каждый|каждую|каждое|каждые|ежедневно|еженедельно|назад|вчера|позавчера'
+    r'|или|утром|вечером|днём|днем|ночью|обед\w*|неделе|месяце|году|следующ\w*|ближайш\w*|этот|эту|это'
+    r'|мск|utc|gmt|времени|числа)\b'
+)
+LEADING_COMMAND_RE = re.compile(
+    r'^\s*(?:пожалуйста[,\s]+)?напомни(?:те)?(?:[,\s]+(?:мне|нам))?(?:[,\s]+пожалуйста)?\b', re.IGNORECASE
+)
+# Если после вырезания времени текст начинается так, его нужно переформулировать — это работа GPT
+REPHRASE_WORDS = {'о', 'об', 'обо', 'про', 'что', 'чтобы', 'мне', 'нам', 'надо', 'нужно', 'напомнить'}
+
+
+def _parse_number(value: Optional[str]) -> Optional[int]:
+    if value is None:
+        return 1
+    if value.isdigit():
+        return int(value)
+    return NUMBER_WORDS.get(value)
+
+
+def _relative_delta(match) -> Optional[timedelta]:
+    half = match.group('half')
+    if half:
+        return timedelta(minutes=30) if half == 'полчаса' else timedelta(minutes=90)
+    amount = _parse_number(match.group('num'))
+    if not amount:
+        return None
+    unit = match.group('unit')
+    if unit.startswith('мин'):
+        return timedelta(minutes=amount)
+    if unit.startswith('час'):
+        return timedelta(hours=amount)
+    if unit.startswith('д'):
+        return timedelta(days=amount)
+    return timedelta(weeks=amount)
+
+
+def _clock_time(match):
+    """Возвращает (час, минута) или None, если время неоднозначно."""
+    if match.group('h2') is not None:
+        hour, minute = int(match.group('h2')), int(match.group('m2'))
+    else:
+        hour = int(match.group('h'))
+        minute = int(match.group('m')) if match.group('m') else 0
+        part = match.group('part')
+        if part is None and match.group('m') is None and (match.group('hours') is None or hour < 13):
+            # "в 5" или "в 2 часа" — непонятно, утро или вечер
+            return None
+        if part in ('дня', 'вечера') and hour < 12:
+            hour += 12
+        elif part == 'ночи':
+            # "в 11 ночи" — 23:00, "в 12 ночи" — 00:00, "в 3 ночи" — 03:00; "в 7 ночи" неоднозначно
+            if 9 <= hour <= 11:
+                hour += 12
+            elif hour == 12:
+                hour = 0
+            elif hour > 5:
+                return None
+        elif part == 'утра' and hour >= 12:
+            # "в 12 утра" одни понимают как полдень, другие как полночь — решает GPT
+            return None
+        if part is not None and hour > 23:
+            return None
+    if hour > 23 or minute > 59:
+        return None
+    return hour, minute
+
+
+def _find_single(regex, text):
+    """Возвращает единственное совпадение, None если его нет, или False если их несколько."""
+    matches = list(regex.finditer(text))
+    if not matches:
+        return None
+    if len(matches) > 1:
+        return False
+    return matches[0]
+
+
+def _clean_text(message: str, spans) -> Optional[str]:
+    text = message
+    for start, end in sorted(spans, reverse=True):
+        text = text[:start] + ' ' + text[end:]
+    text = LEADING_COMMAND_RE.sub('', text)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s+([,.!?;])', r'\1', text)
+    text = text.strip(' ,.!?;:-—')
+    if not text:
+        return None
+    words = text.lower().split()
+    if words[0] in REPHRASE_WORDS or 'напомн' in text.lower() or re.search(r'\d', text):
+        return None
+    return text[0].upper() + text[1:]
+
+
+def parse_reminder(message: str, now: Optional[datetime] = None) -> Optional[Dict]:
+    """
+    Пытается разобрать напоминание без ChatGPT
+
+    Args:
+        message: Текст сообщения пользователя
+        now: Текущее время (aware, Europe/Moscow); по умолчанию — сейчас
+
+    Returns:
+        Словарь {'text', 'datetime', 'timezone'} как у MessageProcessor.extract_reminder_info
+        или None, если разбор не уверен в результате
+    """
+    if not message or len(message) > MAX_MESSAGE_LENGTH or '\n' in message:
+        return None
+
+    tz = get_timezone(DEFAULT_TIMEZONE)
+    now = (now or datetime.now(tz)).astimezone(tz).replace(microsecond=0)
+    lowered = message.lower()
+
+    if UNSURE_RE.search(lowered):
+        return None
+
+    relative = _find_single(RELATIVE_RE, lowered)
+    clock = _find_single(TIME_RE, lowered)
+    day = _find_single(DAY_RE, lowered)
+    weekday = _find_single(WEEKDAY_RE, lowered)
+    date = _find_single(DATE_RE, lowered)
+    if False in (relative, clock, day, weekday, date):
+        return None
+    date_matches = [m for m in (day, weekday, date) if m]
+    if len(date_matches) > 1:
+        return None
+
+    if relative:
+        # "через 2 часа" не сочетается с другими указаниями времени
+        if clock or date_matches:
+            return None
+        delta = _relative_delta(relative)
+        if delta is None:
+            return None
+        reminder_time = now + delta
+        spans = [relative.span()]
+    else:
+        if not clock:
+            return None
+        hm = _clock_time(clock)
+        if hm is None:
+            return None
+        hour, minute = hm
+        spans = [clock.span()]
+        today = now.date()
+
+        if day:
+            target = today + timedelta(days=DAY_OFFSETS[day.group('day')])
+        elif weekday:
+            days_ahead = (WEEKDAYS[weekday.group('weekday')] - today.weekday()) % 7
+            if days_ahead == 0:
+                # "в пятницу" в пятницу — сегодня или через неделю, решает GPT
+                return None
+            target = today + timedelta(days=days_ahead)
+        elif date:
+            try:
+                target = today.replace(month=MONTHS[date.group('month')], day=int(date.group('d')))
+            except ValueError:
+                return None
+            if target < today:
+                try:
+                    target = target.replace(year=target.year + 1)
+                except ValueError:
+                    return None
+        else:
+            target = today
+        spans += [m.span() for m in date_matches]
+
+        naive = datetime(target.year, target.month, target.day, hour, minute)
+        reminder_time = tz.localize(naive)
+        if not date_matches and reminder_time <= now:
+            # Только время без даты — ближайшее будущее
+            reminder_time = tz.localize(naive + timedelta(days=1))
+        if reminder_time <= now:
+            return None
+
+    text = _clean_text(message, spans)
+    if not text:
+        return None
+
+    result = {
+        'text': text,
+        'datetime': reminder_time.strftime(DATETIME_FORMAT),
+        'timezone': DEFAULT_TIMEZONE,
+    }
+    logger.info(f"Напоминание разобрано локально, без ChatGPT: {result}")
+    return result
+
+
+# Признаки того, что прошедшая дата может быть намеренной или посчитана сложнее, чем сдвиг
+ROLL_AMBIGUOUS_RE = re.compile(
+    r'\b(вчера|позавчера|назад|прошл\w*|за|до|после|перед|через|сегодня|завтра|послезавтра|(?:19|20)\d{2})\b'
+)
+MONTH_WORD_RE = re.compile(
+    r'\b(январ|феврал|март|апрел|ма[йяе]|июн|июл|август|сентябр|октябр|ноябр|декабр)\w*\b'
+)
+DAY_OF_MONTH_RE = re.compile(r'\b\d{1,2}(?:-?го)?\s+числа\b')
+
+
+def _add_months(dt: datetime, months: int) -> Optional[datetime]:
+    month_index = dt.month - 1 + months
+    try:
+        return dt.replace(year=dt.year + month_index // 12, month=month_index % 12 + 1)
+    except ValueError:
+        return None
+
+
+def roll_forward(message: str, reminder_info: Dict, now: Optional[datetime] = None) -> Optional[Dict]:
+    """
+    Сдвигает прошедшее время напоминания на ближайшее будущее по правилу «ближайший»
+
+    Шаг выбирается по тому, что упомянуто в сообщении: день недели — неделя, месяц — год,
+    "N числа" — месяц, только время суток — день. Исправление считается надёжным,
+    только если хватает ровно одного шага.
+
+    Args:
+        message: Исходный текст, по которому извлекалось напоминание
+        reminder_info: Результат извлечения с прошедшим datetime
+        now: Текущее время (по умолчанию — сейчас)
+
+    Returns:
+        Копия reminder_info с исправленным datetime или None, если сдвиг неоднозначен
+    """
+    datetime_str = reminder_info.get('datetime')
+    if not datetime_str:
+        return None
+    try:
+        tz = get_timezone(reminder_info.get('timezone') or DEFAULT_TIMEZONE)
+        naive = datetime.strptime(datetime_str, DATETIME_FORMAT)
+    except (pytz.exceptions.UnknownTimeZoneError, ValueError):
+        return None
+
+    lowered = (message or '').lower()
+    if ROLL_AMBIGUOUS_RE.search(lowered):
+        return None
+
+    steps = []
+    if WEEKDAY_RE.search(lowered):
+        steps.append('week')
+    if MONTH_WORD_RE.search(lowered):
+        steps.append('year')
+    if DAY_OF_MONTH_RE.search(lowered):
+        steps.append('month')
+    if len(steps) > 1:
+        return None
+    step = steps[0] if steps else 'day'
+
+    now = (now or datetime.now(tz)).astimezone(tz).replace(tzinfo=None)
+    if naive > now:
+        return None
+    if step == 'day':
+        candidate = naive + timedelta(days=1)
+    elif step == 'week':
+        candidate = naive + timedelta(weeks=1)
+    elif step == 'month':
+        candidate = _add_months(naive, 1)
+    else:
+        candidate = _add_months(naive, 12)
+    if candidate is None or candidate <= now:
+        # Одного шага не хватило — ChatGPT ошибся сильнее, чем на «ближайший»
+        return None
+
+    corrected = dict(reminder_info, datetime=candidate.strftime(DATETIME_FORMAT))
+    logger.info(f"Прошедшее время {datetime_str} сдвинуто на {corrected['datetime']} (шаг: {step})")
+    return corrected
@@ -0,0 +1,87 @@
+"""
+Разбор времени напоминаний и перевод в UTC без pandas
+"""
+
+import logging
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEZONE = 'Europe/Moscow'
+
+# Форматы, которые встречаются в таблице кроме ISO (ручные правки)
+_EXTRA_FORMATS = (
+    '%d.%m.%Y %H:%M:%S',
+    '%d.%m.%Y %H:%M',
+    '%d.%m.%Y',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y/%m/%d %H:%M',
+)
+
+
+@lru_cache(maxsize=64)
+def get_timezone(name: str):
+    """
+    Возвращает объект часового пояса pytz (с кэшированием)
+
+    Raises:
+        pytz.exceptions.UnknownTimeZoneError: Неизвестный часовой пояс
+    """
+    return pytz.timezone(name)
+
+
+@lru_cache(maxsize=64)
+def _timezone_or_default(name: str):
+    try:
+        return get_timezone(name)
+    except pytz.exceptions.UnknownTimeZoneError:
+        logger.warning(f"Неизвестный часовой пояс '{name}', используем {DEFAULT_TIMEZONE}")
+        return get_timezone(DEFAULT_TIMEZONE)
+
+
+def parse_datetime(datetime_str: str) -> datetime:
+    """
+    Разбирает дату и время из таблицы: ISO ('2025-01-31 15:00:00', с 'T' и смещением)
+    или ДД.ММ.ГГГГ ЧЧ:ММ
+
+    Raises:
+        ValueError: Строка не похожа ни на один из форматов
+    """
+    value = str(datetime_str).strip()
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        pass
+    for fmt in _EXTRA_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"Неизвестный формат даты и времени: '{datetime_str}'")
+
+
+def parse_due_utc(datetime_str, timezone_str: str = None) -> Optional[float]:
+    """
+    Переводит время напоминания из таблицы в UTC timestamp
+
+    Args:
+        datetime_str: Дата и время напоминания (строка из таблицы)
+        timezone_str: Часовой пояс напоминания
+
+    Returns:
+        Время срабатывания в секундах (UTC epoch) или None для напоминаний без времени
+
+    Raises:
+        ValueError: Время не удалось разобрать
+    """
+    if not datetime_str:
+        return None
+
+    dt = parse_datetime(datetime_str)
+    if dt.tzinfo is None or dt.tzinfo.utcoffset(dt) is None:
+        dt = _timezone_or_default(timezone_str or DEFAULT_TIMEZONE).localize(dt)
+    return dt.timestamp()
@@ -0,0 +1,76 @@
+"""
+Кэш распознанного текста голосовых сообщений
+
+Ключ — file_unique_id файла Telegram (пересланное или повторно отправленное голосовое
+распознаётся без скачивания) или хэш содержимого аудио (тот же звук в другом файле
+распознаётся без конвертации и запроса к Whisper). Текст хранится по частям, как его
+вернуло распознавание длинного сообщения, чтобы при попадании части снова разбирались
+на отдельные напоминания.
+
+В памяти — LRU с ограничением по объёму, на диске (необязательно) — SQLite.
+"""
+
+import hashlib
+import logging
+from typing import Iterable, List, Optional
+
+from sqlite_cache import SQLiteCache
+
+logger = logging.getLogger(__name__)
+
+
+def file_key(file_unique_id: str) -> str:
+    """Ключ по идентификатору файла Telegram (одинаков у всех копий файла)"""
+    return f"f:{file_unique_id}"
+
+
+def audio_key(data: bytes) -> str:
+    """Ключ по содержимому аудио"""
+    return f"h:{hashlib.sha256(data).hexdigest()}"
+
+
+class TranscriptCache(SQLiteCache):
+    def __init__(self, path: Optional[str] = None, max_bytes: int = 16 * 1024 * 1024,
+                 max_entries: int = 100000, ttl: float = 30 * 24 * 3600):
+        """
+        Инициализация кэша
+
+        Args:
+            path: Путь к файлу SQLite; None — только память (до перезапуска)
+            max_bytes: Объём текста в памяти (вытесняются давно не использованные записи)
+            max_entries: Максимальное число записей
+            ttl: Время жизни записи (в секундах)
+        """
+        super().__init__('transcript_cache', path, max_entries, ttl, max_bytes)
+
+    def get(self, *keys: Optional[str]) -> Optional[List[str]]:
+        """
+        Ищет распознанный текст по первому найденному ключу
+
+        Args:
+            *keys: Ключи file_key/audio_key (None пропускаются)
+
+        Returns:
+            Текст по частям или None
+        """
+        with self._lock:
+            for key in keys:
+                if key is None:
+                    continue
+                texts = self.lookup(key)
+                if texts is not None:
+                    self.hits += 1
+                    logger.info(f"Распознанный текст взят из кэша ({key[:18]})")
+                    return list(texts)
+            self.misses += 1
+            return None
+
+    def put(self, keys: Iterable[Optional[str]], texts: List[str]) -> None:
+        """
+        Сохраняет распознанный текст под всеми ключами
+
+        Args:
+            keys: Ключи file_key/audio_key (None пропускаются)
+            texts: Текст по частям (одна часть для короткого сообщения)
+        """
+        self.store([key for key in keys if key is not None], list(texts))
@@ -0,0 +1,120 @@
+"""
+Распределение обновлений Telegram по чатам
+
+- ChatUpdateProcessor — внутри процесса: обновления разных чатов обрабатываются
+  параллельно, одного чата — строго по порядку (серии сообщений и кнопки чата не
+  обрабатываются наперегонки);
+- UpdateRouter — между процессами-обработчиками: серии сообщений (MessageCoalescer) и
+  кнопки напоминаний живут в памяти процесса, а балансировщик раздаёт вебхуки процессам
+  по очереди. Поэтому каждый чат закреплён за одним процессом (chat_id % workers): чужое
+  обновление пересылается владельцу на его вебхук и у себя не обрабатывается. Если
+  владелец недоступен, обновление обрабатывается на месте.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Optional
+
+import httpx
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, BaseUpdateProcessor, ContextTypes
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def chat_key(update: object) -> Optional[int]:
+    """Чат обновления (или пользователь, если чата нет); None — обновление ни к кому не привязано"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return update.effective_user.id if update.effective_user is not None else None
+
+
+class ChatUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка внутри чата"""
+
+    def __init__(self, max_concurrent_updates: int):
+        """
+        Args:
+            max_concurrent_updates: Сколько обновлений обрабатываются одновременно
+        """
+        super().__init__(max_concurrent_updates)
+        self._chats = {}  # {chat_id: [Lock, число обновлений чата в работе]}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = chat_key(update)
+        if key is None:
+            await coroutine
+            return
+        entry = self._chats.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+class UpdateRouter:
+    def __init__(self, worker_index: int, workers: int, host: str, base_port: int, url_path: str = '',
+                 secret_token: Optional[str] = None, timeout: float = 5.0):
+        """
+        Args:
+            worker_index: Номер этого процесса
+            workers: Число процессов
+            host: Адрес, на котором слушают вебхуки процессов
+            base_port: Порт процесса 0 (процесс i слушает base_port + i)
+            url_path: Путь вебхука
+            secret_token: Секрет вебхука (передаётся владельцу в заголовке, как это делает Telegram)
+            timeout: Таймаут пересылки (в секундах)
+        """
+        self.worker_index = worker_index
+        self.workers = workers
+        self.host = '127.0.0.1' if host in ('', '0.0.0.0') else host
+        self.base_port = base_port
+        self.url_path = url_path
+        self.secret_token = secret_token
+        self.forwarded = 0
+        self._client = httpx.AsyncClient(timeout=timeout)
+
+    def owner(self, update: Update) -> Optional[int]:
+        """Номер процесса, за которым закреплён чат обновления (None — обработать где угодно)"""
+        key = chat_key(update)
+        if key is None:
+            return None
+        return key % self.workers
+
+    async def route(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Обработчик группы -1: пересылает чужие обновления владельцу и прекращает их обработку"""
+        owner = self.owner(update)
+        if owner is None or owner == self.worker_index:
+            return
+        if await self._forward(update, owner):
+            raise ApplicationHandlerStop
+
+    async def _forward(self, update: Update, owner: int) -> bool:
+        url = f"http://{self.host}:{self.base_port + owner}/{self.url_path}"
+        headers = {SECRET_HEADER: self.secret_token} if self.secret_token else {}
+        try:
+            response = await self._client.post(url, json=update.to_dict(), headers=headers)
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Не удалось передать обновление {update.update_id} процессу {owner}, "
+                           f"обрабатываем здесь: {e!r}")
+            return False
+        self.forwarded += 1
+        return True
+
+    async def close(self) -> None:
+        await self._client.aclose()
@@ -53,14 +53,11 @@ apt install -y ffmpeg
 # Активация виртуального окружения и установка Python зависимостей
 log "Установка Python зависимостей..."
 source venv/bin/activate
-pip install requests pydub
+pip install pydub
 
 # Проверка установки зависимостей
 log "Проверка установленных пакетов..."
 python -c "
-import requests
-print('✓ requests установлен')
-
 try:
     from pydub import AudioSegment
     print('✓ pydub установлен')
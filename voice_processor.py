@@ -1,139 +1,308 @@
-import os
+import io
+import asyncio
 import logging
-import tempfile
-import requests
-from typing import Optional
+from typing import Callable, List, Optional
 import openai
 from telegram import Update
 
+from audio_pool import AudioPool, PoolSaturated
+from io_executor import IOExecutor, LOCAL
+from transcript_cache import TranscriptCache, audio_key, file_key
+from stt_backends import DurationRouter, TranscriptionBackend, WhisperAPIBackend
+
 try:
     from pydub import AudioSegment
     PYDUB_AVAILABLE = True
 except ImportError:
     PYDUB_AVAILABLE = False
-    logging.warning("pydub не установлен. Голосовые сообщения не будут поддерживаться.")
+    logging.warning("pydub не установлен. Перекодирование аудио недоступно, "
+                    "в Whisper отправляются только поддерживаемые форматы (голосовые OGG/Opus).")
 
 logger = logging.getLogger(__name__)
 
+# Форматы, которые Whisper принимает без перекодирования: MIME-тип → расширение файла
+WHISPER_FORMATS = {
+    'audio/ogg': 'ogg',
+    'audio/opus': 'ogg',
+    'audio/mpeg': 'mp3',
+    'audio/mp4': 'm4a',
+    'audio/x-m4a': 'm4a',
+    'audio/wav': 'wav',
+    'audio/x-wav': 'wav',
+    'audio/webm': 'webm',
+    'audio/flac': 'flac',
+}
+# Максимальный размер файла, который принимает Whisper
+WHISPER_MAX_BYTES = 25 * 1024 * 1024
+
 class VoiceProcessor:
-    def __init__(self, openai_api_key: str):
+    def __init__(self, openai_api_key: str, async_client: Optional[openai.AsyncOpenAI] = None,
+                 request_timeout: float = 60.0, audio_pool: Optional[AudioPool] = None,
+                 passthrough: bool = True, split_duration: float = 60.0, segment_duration: float = 45.0,
+                 max_parallel_segments: int = 4, cache: Optional[TranscriptCache] = None,
+                 local_backend: Optional[TranscriptionBackend] = None, local_max_duration: Optional[float] = 30.0,
+                 io_executor: Optional[IOExecutor] = None):
         """
         Инициализация процессора голосовых сообщений
         
         Args:
             openai_api_key: API ключ OpenAI для Whisper
+            async_client: Общий AsyncOpenAI клиент; без него синхронный вызов уходит в отдельный поток
+            request_timeout: Таймаут запроса на распознавание (в секундах)
+            audio_pool: Пул процессов для конвертации аудио
+            passthrough: Отправлять в Whisper поддерживаемые форматы (OGG/Opus голосовых) без перекодирования
+            split_duration: Сообщения длиннее (в секундах) режутся по паузам и распознаются частями
+                параллельно; 0 — не резать
+            segment_duration: Максимальная длина части (в секундах)
+            max_parallel_segments: Сколько частей одного сообщения распознаются одновременно
+            cache: Кэш распознанного текста (по file_unique_id и хэшу аудио)
+            local_backend: Локальный бэкенд распознавания (LocalWhisperBackend); None — только OpenAI
+            local_max_duration: Сообщения до этой длительности (в секундах) распознаются локально,
+                остальные через OpenAI; None — все сообщения локально, без сети
+            io_executor: Пул, в котором идут обращения к кэшу (SQLite)
         """
         self.openai_api_key = openai_api_key
-        self.client = openai.OpenAI(api_key=openai_api_key)
+        self.request_timeout = request_timeout
+        self.backend = self._create_backend(WhisperAPIBackend(openai_api_key, async_client, request_timeout),
+                                            local_backend, local_max_duration)
+        self.audio_pool = audio_pool or AudioPool()
+        self.passthrough = passthrough
+        self.split_duration = split_duration
+        self.segment_duration = segment_duration
+        self.max_parallel_segments = max_parallel_segments
+        self.cache = cache
+        self.io_executor = io_executor or IOExecutor()
+    
+    @staticmethod
+    def _create_backend(api_backend: TranscriptionBackend, local_backend: Optional[TranscriptionBackend],
+                        local_max_duration: Optional[float]) -> TranscriptionBackend:
+        if local_backend is None:
+            return api_backend
+        if local_max_duration is None:
+            return local_backend
+        return DurationRouter(local_backend, api_backend, local_max_duration)
         
-    async def process_voice_message(self, update: Update, context) -> Optional[str]:
+    async def process_voice_message(self, update: Update, context,
+                                    on_segment: Optional[Callable[[int, str], None]] = None) -> Optional[str]:
         """
         Обрабатывает голосовое сообщение и возвращает распознанный текст
         
         Args:
             update: Объект Update от Telegram
             context: Контекст бота
+            on_segment: Вызывается с номером и текстом каждой части длинного сообщения, как только
+                она распознана (чтобы начать обработку, не дожидаясь остальных частей)
             
         Returns:
             Распознанный текст или None в случае ошибки
+
+        Raises:
+            PoolSaturated: Очередь конвертации заполнена, сообщение нужно отправить позже
         """
+        voice = update.message.voice
+        # Повторно присланное голосовое распознаём из кэша, не скачивая
+        if self.cache is not None:
+            texts = await self.io_executor.run(LOCAL, self.cache.get, file_key(voice.file_unique_id))
+            if texts is not None:
+                return self._replay(texts, on_segment)
+        
+        split = self._should_split(voice.duration)
+        # Не скачиваем файл, если его нужно обработать в пуле, а пул занят
+        needs_pool = split or self._negotiate_format(voice.mime_type, voice.file_size) is None
+        if needs_pool and self.audio_pool.saturated:
+            raise PoolSaturated("Очередь конвертации заполнена")
         try:
-            voice = update.message.voice
-            
             # Получаем информацию о файле
             file_info = await context.bot.get_file(voice.file_id)
-            file_url = file_info.file_path
             
             logger.info(f"Обрабатываем голосовое сообщение: {voice.file_id}")
             
-            # Скачиваем файл
-            audio_data = await self._download_audio(file_url)
+            # Скачиваем файл через HTTP-клиент бота
+            audio_data = await self._download_audio(file_info)
             if not audio_data:
                 return None
-                
-            # Конвертируем в нужный формат
-            audio_file = await self._convert_audio(audio_data)
-            if not audio_file:
-                return None
-                
-            # Распознаем речь с помощью Whisper
-            text = await self._transcribe_audio(audio_file)
             
-            # Очищаем временные файлы
-            if audio_file and os.path.exists(audio_file):
-                os.remove(audio_file)
-                
-            return text
+            # Тот же звук в другом файле тоже мог быть распознан раньше
+            keys = [file_key(voice.file_unique_id), audio_key(audio_data)]
+            if self.cache is not None:
+                texts = await self.io_executor.run(LOCAL, self.cache.get, keys[1])
+                if texts is not None:
+                    await self.io_executor.run(LOCAL, self.cache.put, keys[:1], texts)
+                    return self._replay(texts, on_segment)
             
+            texts = await self._recognize(audio_data, voice, split, on_segment)
+            if texts is None:
+                return None
+            if self.cache is not None:
+                await self.io_executor.run(LOCAL, self.cache.put, keys, texts)
+            return ' '.join(text for text in texts if text)
+            
+        except PoolSaturated:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при обработке голосового сообщения: {e}")
             return None
     
-    async def _download_audio(self, file_url: str) -> Optional[bytes]:
-        """Скачивает аудиофайл по URL"""
+    async def _recognize(self, audio_data: bytes, voice, split: bool,
+                         on_segment: Optional[Callable[[int, str], None]] = None) -> Optional[List[str]]:
+        """
+        Распознаёт скачанное голосовое сообщение
+
+        Returns:
+            Текст по частям (одна часть, если сообщение распознавалось целиком) или None
+        """
+        # Длинное сообщение распознаём частями параллельно
+        if split:
+            segments = await self._split_audio(audio_data, voice.mime_type, voice.duration)
+            if segments and len(segments) > 1:
+                return await self._transcribe_segments(segments, on_segment, voice.duration)
+        
+        # Приводим к формату, который принимает Whisper
+        audio = await self._prepare_audio(audio_data, voice.mime_type, voice.duration)
+        if not audio:
+            return None
+        
+        # Распознаем речь
+        text = await self._transcribe_audio(audio, voice.duration)
+        return None if text is None else [text]
+    
+    @staticmethod
+    def _replay(texts: List[str], on_segment: Optional[Callable[[int, str], None]] = None) -> str:
+        """Отдаёт текст из кэша так же, как после распознавания (части — через on_segment)"""
+        if len(texts) > 1 and on_segment is not None:
+            for index, text in enumerate(texts):
+                if text:
+                    on_segment(index, text)
+        return ' '.join(text for text in texts if text)
+    
+    def _should_split(self, duration: Optional[float]) -> bool:
+        return bool(self.split_duration and PYDUB_AVAILABLE and (duration or 0) > self.split_duration)
+    
+    async def _split_audio(self, audio_data: bytes, mime_type: Optional[str],
+                           duration: Optional[float]) -> Optional[List[bytes]]:
+        """
+        Режет аудио на части по паузам
+
+        Returns:
+            Части аудио в MP3 или None, если нарезать не удалось (тогда сообщение распознаётся целиком)
+        """
         try:
-            response = requests.get(file_url, timeout=30)
-            response.raise_for_status()
-            return response.content
+            segments = await self.audio_pool.split(
+                audio_data, 'ogg' if mime_type == 'audio/ogg' else None,
+                max_segment=self.segment_duration, min_segment=self.segment_duration / 3, duration=duration
+            )
+        except PoolSaturated:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при нарезке аудио, распознаём целиком: {e!r}")
+            return None
+        logger.info(f"Голосовое сообщение {duration} с разрезано на {len(segments)} частей")
+        return segments
+    
+    async def _transcribe_segments(self, segments: List[bytes],
+                                   on_segment: Optional[Callable[[int, str], None]] = None,
+                                   duration: Optional[float] = None) -> Optional[List[str]]:
+        """
+        Распознаёт части параллельно
+
+        Returns:
+            Текст частей в исходном порядке или None, если хотя бы одна часть не распознана
+        """
+        semaphore = asyncio.Semaphore(self.max_parallel_segments)
+        segment_duration = duration / len(segments) if duration else None
+        
+        async def transcribe(index: int, segment: bytes) -> Optional[str]:
+            audio = io.BytesIO(segment)
+            audio.name = f'segment-{index}.mp3'
+            async with semaphore:
+                text = await self._transcribe_audio(audio, segment_duration)
+            if text and on_segment is not None:
+                on_segment(index, text)
+            return text
+        
+        texts = await asyncio.gather(*(transcribe(i, segment) for i, segment in enumerate(segments)))
+        if None in texts:
+            logger.error(f"Не распознано частей: {texts.count(None)} из {len(texts)}")
+            return None
+        return texts
+    
+    async def _download_audio(self, file_info) -> Optional[bytes]:
+        """Скачивает аудиофайл в память (telegram.File, асинхронный HTTP-клиент бота)"""
+        try:
+            buffer = io.BytesIO()
+            await file_info.download_to_memory(buffer)
+            return buffer.getvalue()
         except Exception as e:
             logger.error(f"Ошибка при скачивании аудио: {e}")
             return None
     
-    async def _convert_audio(self, audio_data: bytes) -> Optional[str]:
+    def _negotiate_format(self, mime_type: Optional[str], size: Optional[int]) -> Optional[str]:
+        """
+        Выбирает, можно ли отправить аудио в Whisper как есть
+        
+        Returns:
+            Расширение файла для отправки без перекодирования или None, если нужно перекодировать
+        """
+        if not self.passthrough:
+            return None
+        extension = WHISPER_FORMATS.get((mime_type or '').lower())
+        if extension is None or (size or 0) > WHISPER_MAX_BYTES:
+            return None
+        return extension
+    
+    async def _prepare_audio(self, audio_data: bytes, mime_type: Optional[str] = None,
+                             duration: Optional[float] = None) -> Optional[io.BytesIO]:
+        """
+        Возвращает аудио в формате, который принимает Whisper: исходный файл, если формат
+        поддерживается и размер в пределах лимита, иначе результат перекодирования
+        """
+        extension = self._negotiate_format(mime_type, len(audio_data))
+        if extension is None:
+            logger.info(f"Перекодируем аудио ({mime_type}, {len(audio_data)} байт)")
+            return await self._convert_audio(audio_data, duration, 'ogg' if mime_type == 'audio/ogg' else None)
+        audio = io.BytesIO(audio_data)
+        audio.name = f'voice.{extension}'
+        return audio
+    
+    async def _convert_audio(self, audio_data: bytes, duration: Optional[float] = None,
+                             input_format: Optional[str] = 'ogg') -> Optional[io.BytesIO]:
         """
         Конвертирует аудио в формат, поддерживаемый Whisper (MP3)
+        
+        Args:
+            audio_data: Исходное аудио
+            duration: Длительность в секундах (для метрик пула)
+            input_format: Формат исходного аудио; None — ffmpeg определит сам
+        
+        Returns:
+            Файлоподобный объект с MP3 (с именем, по которому OpenAI определяет формат) или None
         """
         if not PYDUB_AVAILABLE:
             logger.error("pydub не доступен для конвертации аудио")
             return None
             
         try:
-            # Создаем временный файл для исходного аудио
-            with tempfile.NamedTemporaryFile(suffix='.ogg', delete=False) as temp_input:
-                temp_input.write(audio_data)
-                temp_input_path = temp_input.name
-            
-            # Создаем временный файл для конвертированного аудио
-            with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_output:
-                temp_output_path = temp_output.name
-            
-            # Конвертируем OGG в MP3
-            audio = AudioSegment.from_ogg(temp_input_path)
-            audio.export(temp_output_path, format="mp3")
-            
-            # Удаляем временный входной файл
-            os.remove(temp_input_path)
-            
-            return temp_output_path
-            
+            # Конвертируем в MP3 в отдельном процессе, через каналы ffmpeg
+            converted = await self.audio_pool.convert(audio_data, input_format, 'mp3', duration=duration)
+        except PoolSaturated:
+            raise
         except Exception as e:
-            logger.error(f"Ошибка при конвертации аудио: {e}")
-            # Очищаем временные файлы в случае ошибки
-            try:
-                if 'temp_input_path' in locals() and os.path.exists(temp_input_path):
-                    os.remove(temp_input_path)
-                if 'temp_output_path' in locals() and os.path.exists(temp_output_path):
-                    os.remove(temp_output_path)
-            except:
-                pass
+            logger.error(f"Ошибка при конвертации аудио: {e!r}")
             return None
+        
+        audio = io.BytesIO(converted)
+        audio.name = 'voice.mp3'
+        return audio
     
-    async def _transcribe_audio(self, audio_file_path: str) -> Optional[str]:
+    async def _transcribe_audio(self, audio_file: io.BytesIO, duration: Optional[float] = None) -> Optional[str]:
         """
-        Распознает речь в аудиофайле с помощью OpenAI Whisper
+        Распознает речь выбранным бэкендом (OpenAI Whisper или локальная модель)
+        
+        Args:
+            audio_file: Файлоподобный объект с аудио (атрибут name задаёт формат)
+            duration: Длительность аудио в секундах (по ней выбирается бэкенд)
         """
-        try:
-            with open(audio_file_path, 'rb') as audio_file:
-                transcript = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language="ru"  # Указываем русский язык для лучшего распознавания
-                )
-            
-            text = transcript.text.strip()
+        text = await self.backend.transcribe(audio_file, duration)
+        if text is not None:
             logger.info(f"Распознанный текст: {text}")
-            return text
-            
-        except Exception as e:
-            logger.error(f"Ошибка при распознавании речи: {e}")
-            return None
+        return text